@@ -1,15 +1,15 @@
 from typing import TypedDict
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-import os
-from dotenv import load_dotenv
-load_dotenv()
-
-llm = ChatOpenAI(
-    model="qwen3-max-2026-01-23",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+from langgraph.types import interrupt
+from custom.checkpoint import make_checkpointer
+from custom.amount_extractor import extract_confident_amount, parse_amount
+from custom.llm_registry import lazy_llm, load_env, once
+from custom.metrics import instrument
+from custom.singleflight import get_flight
+load_env()
+
+# 第一次调用模型时才创建客户端（与其他模块共享），多进程共享 DashScope 配额
+llm = lazy_llm("qwen3-max-2026-01-23", limiter="llm")
 LIMIT = 500
 
 
@@ -21,8 +21,23 @@ class ExpenseState(TypedDict):
 
 
 def parse_invoice_node(state: ExpenseState):
-    prompt = f"提取总金额，只返回数字：{state['invoice_text']}"
-    amount = float(llm.invoke(prompt).content)
+    # 规则能确定金额时直接返回，不确定时才调用 LLM；同时提交的相同发票只调用一次
+    amount = extract_confident_amount(state['invoice_text'])
+    if amount is None:
+        prompt = f"提取总金额，只返回数字：{state['invoice_text']}"
+        amount = get_flight("invoice").do(prompt, lambda: parse_amount(llm.invoke(prompt).content))
+    return {"amount": amount}
+
+
+async def aparse_invoice_node(state: ExpenseState):
+    amount = extract_confident_amount(state['invoice_text'])
+    if amount is None:
+        prompt = f"提取总金额，只返回数字：{state['invoice_text']}"
+
+        async def extract():
+            return parse_amount((await llm.ainvoke(prompt)).content)
+
+        amount = await get_flight("invoice").ado(prompt, extract)
     return {"amount": amount}
 
 
@@ -32,9 +47,14 @@ def policy_check_node(state: ExpenseState):
     return {"waiting_human": True}
 
 
-# ❗ 不再 input，而是“暂停”
+# ❗ 不再 input，而是“暂停”：interrupt 保存 checkpoint，审批后从这里继续，不会重新解析发票
 def human_review_node(state: ExpenseState):
-    return {"waiting_human": True}
+    approved = interrupt({
+        "type": "approval",
+        "amount": state["amount"],
+        "message": f"金额 {state['amount']} 超过报销标准，需要人工审批"
+    })
+    return {"approved": approved, "waiting_human": False}
 
 
 def bookkeeping_node(state: ExpenseState):
@@ -42,10 +62,11 @@ def bookkeeping_node(state: ExpenseState):
 
 
 graph = StateGraph(ExpenseState)
-graph.add_node("parse_invoice", parse_invoice_node)
-graph.add_node("policy_check", policy_check_node)
-graph.add_node("human_review", human_review_node)
-graph.add_node("bookkeeping", bookkeeping_node)
+# 每个节点记录耗时、调用/错误次数和 token，见 /metrics
+graph.add_node("parse_invoice", instrument("expense", "parse_invoice", parse_invoice_node, aparse_invoice_node))
+graph.add_node("policy_check", instrument("expense", "policy_check", policy_check_node))
+graph.add_node("human_review", instrument("expense", "human_review", human_review_node))
+graph.add_node("bookkeeping", instrument("expense", "bookkeeping", bookkeeping_node))
 
 graph.set_entry_point("parse_invoice")
 graph.add_edge("parse_invoice", "policy_check")
@@ -57,7 +78,30 @@ def route(state):
     return "human_review"
 
 
+def review_route(state):
+    # 审批驳回时直接结束，不入账
+    if state.get("approved"):
+        return "bookkeeping"
+    return END
+
+
 graph.add_conditional_edges("policy_check", route)
-graph.add_edge("human_review", END)
+graph.add_conditional_edges("human_review", review_route)
+graph.add_edge("bookkeeping", END)
+
+# 导入模块时不打开数据库、不编译图，第一次使用时创建并缓存
+get_checkpointer = once(make_checkpointer)
+
+
+@once
+def get_app_graph():
+    return graph.compile(checkpointer=get_checkpointer())
+
 
-app_graph = graph.compile()
+def __getattr__(name):
+    # 兼容 from agent.graph import app_graph, checkpointer
+    if name == "app_graph":
+        return get_app_graph()
+    if name == "checkpointer":
+        return get_checkpointer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
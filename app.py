@@ -1,10 +1,58 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+import asyncio
+import json
+import os
+import time
 import uuid
-from agent.graph import app_graph
+from langgraph.types import Command
+from agent.graph import get_app_graph, get_checkpointer
+from custom.llm_registry import aclose_llm_clients, once
+from custom.metrics import register_stats, render as render_metrics
+from custom.rate_limit import PRIORITY_BULK, get_limiter, request_priority
+from custom.singleflight import get_flight
+from custom.task_store import (
+    STATUS_APPROVING, STATUS_DONE, STATUS_FAILED, STATUS_FINISHED, STATUS_NEED_APPROVAL, STATUSES, TASK_PAGE_MAX,
+    make_task_store,
+)
 
 app = FastAPI()
-tasks = {}  # 实际应使用数据库
+# 任务状态保存在共享存储中（默认与 checkpoint 同一个 SQLite 文件），多个 worker 都能查询和审批
+get_task_store = once(make_task_store)
+# 批量提交时同时处理的发票数上限
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# 批量审批时同时恢复的任务数上限（恢复只写 checkpoint，不调用模型）
+APPROVE_MAX_CONCURRENCY = int(os.getenv("APPROVE_MAX_CONCURRENCY", "32"))
+# 单次批量审批的任务数上限
+APPROVE_BATCH_MAX = int(os.getenv("APPROVE_BATCH_MAX", "10000"))
+# 认领后超过该时长（秒）仍停在 approving 的任务（客户端断开、worker 崩溃）放回待审批
+APPROVE_CLAIM_TIMEOUT = float(os.getenv("APPROVE_CLAIM_TIMEOUT", "300"))
+_last_release = 0.0
+
+
+# 除节点指标外，导出模型限流队列和请求合并的计数（抓取时才读取）
+register_stats("rate_limit_llm", lambda: get_limiter("llm").stats())
+register_stats("singleflight_invoice", get_flight("invoice").stats)
+
+
+@app.on_event("startup")
+async def startup():
+    # 每张发票都会写 checkpoint，定期清理已结束/长期未更新的 thread
+    get_checkpointer().start_gc()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await aclose_llm_clients()
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标：各节点耗时直方图、调用/错误次数、token 数"""
+    # 采集时会查询 SQLite（生图缓存、马图库等），放到线程中执行，不阻塞正在推送的流
+    return PlainTextResponse(await asyncio.to_thread(render_metrics), media_type="text/plain; version=0.0.4")
 
 
 class InvoiceIn(BaseModel):
@@ -12,20 +60,88 @@ class InvoiceIn(BaseModel):
 
 
 @app.post("/submit")
-def submit_invoice(data: InvoiceIn):
+async def submit_invoice(data: InvoiceIn):
     task_id = str(uuid.uuid4())
+    # 每个发票一个 thread，超标时图在 human_review 暂停，审批后从 checkpoint 恢复
+    config = {"configurable": {"thread_id": task_id}}
 
     state = {
         "invoice_text": data.text
     }
 
-    result = app_graph.invoke(state)
-    tasks[task_id] = result
+    result = await get_app_graph().ainvoke(state, config=config)
+    return await _submit_result(task_id, result)
 
+
+async def _submit_result(task_id, result):
+    store = get_task_store()
     if result.get("waiting_human"):
-        return {"task_id": task_id, "status": "need_approval", "amount": result["amount"]}
+        await store.aput(task_id, STATUS_NEED_APPROVAL, amount=result["amount"], result=result)
+        return {"task_id": task_id, "status": STATUS_NEED_APPROVAL, "amount": result["amount"]}
+
+    await store.aput(task_id, STATUS_DONE, amount=result.get("amount"), approved=True, result=result)
+    await asyncio.to_thread(get_checkpointer().mark_finished, task_id)
+    return {"task_id": task_id, "status": STATUS_DONE, "approved": True}
 
-    return {"task_id": task_id, "status": "done", "approved": True}
+
+class BatchInvoiceIn(BaseModel):
+    invoices: List[InvoiceIn]
+    concurrency: Optional[int] = Field(None, ge=1)  # 不传时使用 BATCH_MAX_CONCURRENCY
+
+
+@app.post("/submit/batch")
+async def submit_invoice_batch(data: BatchInvoiceIn):
+    """
+    批量提交发票，以 NDJSON 流式返回：每张发票处理完立即输出一行，最后一行为汇总（含吞吐量）
+    """
+    concurrency = min(data.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    task_ids = [str(uuid.uuid4()) for _ in data.invoices]
+    inputs = [{"invoice_text": invoice.text} for invoice in data.invoices]
+    configs = [
+        {"configurable": {"thread_id": task_id}, "max_concurrency": concurrency}
+        for task_id in task_ids
+    ]
+
+    async def stream():
+        counts = {"done": 0, "need_approval": 0, "failed": 0}
+        start = time.perf_counter()
+        # 批量任务在限流队列中排在交互请求之后
+        with request_priority(PRIORITY_BULK):
+            async for index, result in get_app_graph().abatch_as_completed(inputs, configs, return_exceptions=True):
+                task_id = task_ids[index]
+                if isinstance(result, Exception):
+                    item = {"task_id": task_id, "status": STATUS_FAILED, "error": repr(result)}
+                    await get_task_store().aput(task_id, STATUS_FAILED, result={"error": repr(result)})
+                else:
+                    item = await _submit_result(task_id, result)
+                counts[item["status"]] += 1
+                yield json.dumps({"index": index, **item}, ensure_ascii=False) + "\n"
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "total": len(inputs),
+            **counts,
+            "concurrency": concurrency,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(inputs) / elapsed, 2) if elapsed > 0 else None,
+        }
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+async def _release_stale_claims():
+    # 审批和列出待审批任务时顺带检查，每个进程最多每 APPROVE_CLAIM_TIMEOUT / 10 秒查询一次
+    global _last_release
+    now = time.time()
+    if now - _last_release < APPROVE_CLAIM_TIMEOUT / 10:
+        return
+    _last_release = now
+    released = await get_task_store().arelease_stale(
+        STATUS_APPROVING, STATUS_NEED_APPROVAL, now - APPROVE_CLAIM_TIMEOUT
+    )
+    if released:
+        print(f"{released} 个任务认领后超时未完成，已放回待审批")
 
 
 class ApprovalIn(BaseModel):
@@ -33,12 +149,153 @@ class ApprovalIn(BaseModel):
     approved: bool
 
 @app.post("/approve")
-def approve(data: ApprovalIn):
-    state = tasks[data.task_id]
-    state["approved"] = data.approved
-    state["waiting_human"] = False
+async def approve(data: ApprovalIn):
+    await _release_stale_claims()
+    # 先认领：同一任务同时被多个请求（或多个 worker）审批时只有一个会恢复执行
+    if not await get_task_store().aclaim([data.task_id], STATUS_NEED_APPROVAL, STATUS_APPROVING):
+        if await get_task_store().aget(data.task_id) is None:
+            raise HTTPException(status_code=404, detail="task not found")
+        raise HTTPException(status_code=409, detail="task not waiting for approval")
+
+    outcome = await _resume(data.task_id, data.approved)
+    if outcome["status"] != STATUS_FINISHED:
+        # checkpoint 已过期：任务不能再审批；恢复执行出错：任务已放回待审批，可以重试
+        raise HTTPException(status_code=409 if outcome.get("expired") else 500, detail=outcome["error"])
+    return {"status": STATUS_FINISHED, "approved": data.approved}
+
+
+async def _resume(task_id, approved):
+    """
+    恢复一个已认领的任务；失败时把任务放回待审批，checkpoint 已被清理时标记为失败
+    :return: 单个任务的处理结果
+    """
+    store = get_task_store()
+    app_graph = get_app_graph()
+    config = {"configurable": {"thread_id": task_id}}
+    try:
+        state_snapshot = await app_graph.aget_state(config)
+        if not state_snapshot.next:
+            await store.aput(task_id, STATUS_FAILED, result={"error": "checkpoint expired"})
+            return {"task_id": task_id, "status": STATUS_FAILED, "error": "task not waiting for approval", "expired": True}
+
+        # 直接从 human_review 继续执行（通过时入账，驳回时结束），不会重新调用 LLM
+        result = await app_graph.ainvoke(Command(resume=approved), config=config)
+    except asyncio.CancelledError:
+        # 请求被取消时放回待审批，避免任务一直停在 approving
+        await asyncio.shield(store.aput(task_id, STATUS_NEED_APPROVAL))
+        raise
+    except Exception as e:
+        # 异常详情只写日志，不返回给客户端
+        print(f"恢复审批任务 {task_id} 失败：{e!r}")
+        await store.aput(task_id, STATUS_NEED_APPROVAL)
+        return {"task_id": task_id, "status": STATUS_FAILED, "error": "failed to resume task"}
+
+    await store.aput(task_id, STATUS_FINISHED, approved=approved, result=result)
+    await asyncio.to_thread(get_checkpointer().mark_finished, task_id)
+    return {"task_id": task_id, "status": STATUS_FINISHED, "approved": approved}
+
+
+class BatchApprovalIn(BaseModel):
+    items: List[ApprovalIn]
+    concurrency: Optional[int] = Field(None, ge=1)  # 不传时使用 APPROVE_MAX_CONCURRENCY
+
+
+@app.post("/approve/batch")
+async def approve_batch(data: BatchApprovalIn):
+    """
+    批量审批，以 NDJSON 流式返回：每个任务处理完立即输出一行（finished / not_found / not_waiting / failed），
+    最后一行为汇总。以有界并发逐个认领并恢复执行（在响应开始后才认领，客户端提前断开时任务仍待审批）
+    """
+    if len(data.items) > APPROVE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"at most {APPROVE_BATCH_MAX} items per batch")
+    concurrency = min(data.concurrency or APPROVE_MAX_CONCURRENCY, APPROVE_MAX_CONCURRENCY)
+    store = get_task_store()
+    # 同一批次里重复出现的任务以第一次出现为准，之后的重复项报告为 not_waiting（在调度前确定，结果与执行顺序无关）
+    first = {}
+    for index, item in enumerate(data.items):
+        first.setdefault(item.task_id, index)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index, item):
+        if first[item.task_id] != index:
+            return index, {"task_id": item.task_id, "status": "not_waiting"}
+        async with semaphore:
+            # 轮到执行时才认领，排队期间不占用任务
+            if not await store.aclaim([item.task_id], STATUS_NEED_APPROVAL, STATUS_APPROVING):
+                task = await store.aget(item.task_id)
+                return index, {"task_id": item.task_id, "status": "not_found" if task is None else "not_waiting"}
+            return index, await _resume(item.task_id, item.approved)
+
+    async def stream():
+        counts = {STATUS_FINISHED: 0, "not_found": 0, "not_waiting": 0, STATUS_FAILED: 0}
+        start = time.perf_counter()
+        await _release_stale_claims()
+        tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(data.items)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                index, item = await future
+                counts[item["status"]] += 1
+                yield json.dumps({"index": index, **item}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消剩余任务：还没认领的保持待审批，正在恢复的由 _resume 放回待审批
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - start
+        summary = {
+            "total": len(data.items),
+            **counts,
+            "concurrency": concurrency,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(data.items) / elapsed, 2) if elapsed > 0 else None,
+        }
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/tasks/{task_id}")
+async def get_task(task_id: str):
+    task = await get_task_store().aget(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="task not found")
+    return task
+
+
+async def _page(status, limit, cursor, sort="created_at", descending=False):
+    try:
+        items, next_cursor = await get_task_store().alist(status, limit, cursor, sort, descending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/tasks")
+async def list_tasks(
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=TASK_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    """
+    按创建时间列出任务，翻页时把上一页的 next_cursor 传回（keyset 分页，百万级任务下每页耗时不变）
+    """
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(STATUSES)}")
+    return await _page(status, limit, cursor)
 
-    result = app_graph.invoke(state)
-    tasks[data.task_id] = result
 
-    return {"status": "finished", "approved": data.approved}
\ No newline at end of file
+@app.get("/approvals/pending")
+async def list_pending_approvals(
+    sort: Literal["age", "amount"] = "age",
+    order: Optional[Literal["asc", "desc"]] = None,
+    limit: int = Query(50, ge=1, le=TASK_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    """
+    待审批的任务：默认等待最久的排在前面；sort=amount 时默认金额最大的排在前面
+    翻页时 sort、order 需与上一页一致
+    """
+    await _release_stale_claims()
+    if sort == "age":
+        return await _page(STATUS_NEED_APPROVAL, limit, cursor, "created_at", order == "desc")
+    return await _page(STATUS_NEED_APPROVAL, limit, cursor, "amount", order != "asc")
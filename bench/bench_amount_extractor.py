@@ -0,0 +1,67 @@
+# 规则金额提取基准：命中率、准确率与单张发票耗时
+# 运行：python -m bench.bench_amount_extractor
+import time
+
+from custom.amount_extractor import CONFIDENCE_THRESHOLD, extract_amount
+
+# (发票文本, 期望金额)；期望为 None 表示规则不应采用（数量、单价等应交给 LLM）
+CORPUS = [
+    ("酒店住宿费用，总计 860 元", 860.0),
+    ("餐饮费 合计：¥1,234.50", 1234.5),
+    ("出租车票 金额合计 ￥５６.００", 56.0),
+    ("增值税普通发票 金额 849.06 税额 50.94 价税合计（小写）¥900.00", 900.0),
+    ("办公用品采购，总金额：2,380元", 2380.0),
+    ("高铁票 二等座 ¥553.5", 553.5),
+    ("会议室租赁 3 小时，共计 1500 元", 1500.0),
+    ("Hotel invoice. Room 2 nights. Total: $420.00", 420.0),
+    ("Grand Total USD 1,050.75", 1050.75),
+    ("Amount due: 89.90", 89.9),
+    ("Subtotal 100.00 Tax 13.00 Total 113.00", 113.0),
+    ("快递费 18 元", 18.0),
+    ("打车 32.5元", 32.5),
+    ("应付金额 ：　６８８ 元", 688.0),
+    ("实付 ¥ 99", 99.0),
+    ("住宿 2 晚，单价 400 元，合计 800 元", 800.0),
+    ("小计 300 元 服务费 30 元 总计 330 元", 330.0),
+    ("机票 经济舱 RMB 1,280", 1280.0),
+    ("培训费 总额 5000", 5000.0),
+    ("餐费 256", 256.0),
+    ("2024年3月5日 停车费 15 元", 15.0),
+    ("发票号码 04400123 开票日期 2024-03-05 价税合计 ¥ 3,456.78", 3456.78),
+    ("TOTAL AMOUNT: CNY 12,000.00", 12000.0),
+    ("早餐 35 元，午餐 48 元", 83.0),
+    ("价税合计（大写）捌佰陆拾元整", 860.0),
+    ("书籍采购 三本 共 198.00", 198.0),
+    ("Taxi receipt, fare 46.20, tip 5.00", 51.2),
+    ("咖啡 2 杯 共 76 元", 76.0),
+    ("合计 -50 元", -50.0),
+    ("总计 3 晚 住宿费 1200", None),
+    ("共计 2 张发票", None),
+    ("Total: 3 items", None),
+    ("酒店住宿两晚，每晚 430 元", None),
+    ("单价 400 元", None),
+]
+ROUNDS = 1000
+
+
+if __name__ == "__main__":
+    hits = correct = 0
+    for text, expected in CORPUS:
+        match = extract_amount(text)
+        confident = match is not None and match.confidence >= CONFIDENCE_THRESHOLD
+        if confident:
+            hits += 1
+            correct += match.amount == expected
+        status = "命中" if confident else "转 LLM"
+        shown = f"{match.amount} ({match.confidence:.2f}, {match.rule})" if match else "无"
+        print(f"[{status}] {text[:30]:<30} -> {shown}")
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for text, _ in CORPUS:
+            extract_amount(text)
+    per_invoice = (time.perf_counter() - start) / (ROUNDS * len(CORPUS))
+
+    print(f"\n样本 {len(CORPUS)} 张，规则命中 {hits} 张（命中率 {hits / len(CORPUS):.0%}），"
+          f"命中中正确 {correct} 张（准确率 {correct / max(hits, 1):.0%}）")
+    print(f"规则提取平均耗时 {per_invoice * 1e6:.1f}µs/张，未命中的发票才需要一次 LLM 往返")
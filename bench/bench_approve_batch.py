@@ -0,0 +1,76 @@
+# 批量审批基准：先用 /submit/batch 积压一批超标发票（规则即可提取金额，不调用模型），然后对比
+# 逐个调用 /approve 与一次 /approve/batch 的吞吐；逐个调用时可用 BENCH_RTT 模拟每次请求的网络往返
+# 运行：python -m bench.bench_approve_batch
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+_workdir = tempfile.mkdtemp(prefix="bench-approve-")
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+os.environ.setdefault("CHECKPOINT_DB", os.path.join(_workdir, "checkpoints.sqlite"))
+
+import httpx  # noqa: E402
+import app  # noqa: E402
+
+BACKLOG = int(os.getenv("BENCH_BACKLOG", "5000"))
+SEQUENTIAL = int(os.getenv("BENCH_SEQUENTIAL", "200"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "32"))
+# 逐个审批时每次请求额外的网络往返（秒）
+RTT = float(os.getenv("BENCH_RTT", "0.05"))
+
+
+async def read_ndjson(response):
+    lines = [json.loads(line) async for line in response.aiter_lines() if line]
+    return lines[:-1], lines[-1]["summary"]
+
+
+async def main():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench",
+                                 timeout=3600) as client:
+        start = time.perf_counter()
+        invoices = [{"text": f"第 {i} 号报销单 价税合计：{600 + i % 4000}.00元"} for i in range(BACKLOG + SEQUENTIAL)]
+        async with client.stream("POST", "/submit/batch", json={"invoices": invoices}) as response:
+            _, summary = await read_ndjson(response)
+        print(f"积压 {summary['need_approval']} 张待审批发票：{time.perf_counter() - start:.1f}s")
+
+        page = (await client.get("/approvals/pending", params={"sort": "amount", "limit": 3})).json()
+        print("金额最大的三张：" + ", ".join(str(item["amount"]) for item in page["items"]))
+
+        pending = []
+        cursor = None
+        while True:
+            params = {"limit": 200, **({"cursor": cursor} if cursor else {})}
+            page = (await client.get("/approvals/pending", params=params)).json()
+            pending.extend(item["task_id"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
+        start = time.perf_counter()
+        for task_id in pending[:SEQUENTIAL]:
+            await asyncio.sleep(RTT)
+            response = await client.post("/approve", json={"task_id": task_id, "approved": True})
+            assert response.status_code == 200, response.text
+        sequential = (time.perf_counter() - start) / SEQUENTIAL
+        print(f"逐个 /approve（往返 {RTT * 1000:.0f}ms）：{sequential * 1000:.1f}ms/张，"
+              f"{BACKLOG} 张预计 {sequential * BACKLOG:.0f}s")
+
+        items = [{"task_id": task_id, "approved": True} for task_id in pending[SEQUENTIAL:]]
+        # 混入已审批和不存在的任务，确认逐项返回结果
+        items += [{"task_id": pending[0], "approved": True}, {"task_id": "missing", "approved": True}]
+        start = time.perf_counter()
+        await asyncio.sleep(RTT)
+        async with client.stream("POST", "/approve/batch", json={"items": items, "concurrency": CONCURRENCY}) as response:
+            _, summary = await read_ndjson(response)
+        elapsed = time.perf_counter() - start
+        print(f"/approve/batch：{len(items)} 项 {elapsed:.1f}s（{len(items) / elapsed:.0f} 张/s），"
+              f"finished={summary['finished']} not_waiting={summary['not_waiting']} "
+              f"not_found={summary['not_found']} failed={summary['failed']}")
+        left = (await client.get("/approvals/pending")).json()["items"]
+        print(f"剩余待审批：{len(left)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+# 本地图片存储基准：本地 HTTP 服务提供一张大图，验证
+# 分块下载时内存峰值与块大小同量级（不随图片大小增长）、相同内容只存一份、同一 URL 同时只下载一次、
+# 已下载的远程图片作为输入时以本地文件发送、hourseApp 的下载接口支持 ETag/304/Range
+# 运行：python -m bench.bench_artifact_store
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+IMAGE_MB = int(os.getenv("BENCH_IMAGE_MB", "64"))
+
+_workdir = tempfile.mkdtemp(prefix="bench-artifacts-")
+os.environ["ARTIFACT_DIR"] = os.path.join(_workdir, "artifacts")
+os.environ["CHECKPOINT_DB"] = os.path.join(_workdir, "checkpoints.sqlite")
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+
+import httpx  # noqa: E402
+from custom.artifact_store import get_artifact_store  # noqa: E402
+from custom.image_cache import inline_local_images  # noqa: E402
+
+_requests = {"count": 0}
+_lock = threading.Lock()
+
+
+class _Origin(BaseHTTPRequestHandler):
+    # 模拟 OSS：/big-{n}.png 返回 IMAGE_MB 大小的内容（n 不同内容也相同），分块发送，响应前稍作延迟
+    def do_GET(self):
+        with _lock:
+            _requests["count"] += 1
+        time.sleep(0.2)
+        size = IMAGE_MB * 1024 * 1024
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        block = bytes(range(256)) * 4096
+        for _ in range(size // len(block)):
+            self.wfile.write(block)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def origin():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Origin)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def serve(name):
+    import hourseApp
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=hourseApp.app), base_url="http://bench") as client:
+        full = await client.get(f"/artifacts/{name}")
+        etag = full.headers["etag"]
+        cached = await client.get(f"/artifacts/{name}", headers={"If-None-Match": etag})
+        part = await client.get(f"/artifacts/{name}", headers={"Range": "bytes=100-199"})
+        missing = await client.get(f"/artifacts/{'0' * 64}.png")
+        invalid = await client.get("/artifacts/..%2Fcheckpoints.sqlite")
+    print(f"下载：{full.status_code}，{len(full.content) // 1024 // 1024}MB，ETag {etag[:10]}...，"
+          f"Cache-Control: {full.headers['cache-control']}")
+    print(f"If-None-Match：{cached.status_code}（应为 304），Range：{part.status_code} {part.headers.get('content-range')} "
+          f"{len(part.content)} 字节，不存在：{missing.status_code}，非法名称：{invalid.status_code}")
+
+
+if __name__ == "__main__":
+    store = get_artifact_store()
+    base = origin()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    digest, ext, size = store.save_url(f"{base}/big-0.png")
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"保存 {size // 1024 // 1024}MB：{elapsed:.2f}s，Python 内存峰值 {peak / 1024:.0f}KB（块大小 {store.chunk_size // 1024}KB）")
+
+    before = _requests["count"]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(store.save_url, [f"{base}/big-1.png"] * 8))
+    print(f"8 个线程同时保存同一 URL：下载 {_requests['count'] - before} 次，结果一致 {len(set(results)) == 1}")
+    print(f"不同 URL、相同内容：{store.stats()}（saved 应为 1）")
+
+    url = f"{base}/big-2.png"
+    store.save_url(url)
+    payload = {"input": {"messages": [{"content": [{"image": url}, {"text": "合照"}]}]}}
+    inlined = inline_local_images(payload)["input"]["messages"][0]["content"][0]["image"]
+    print(f"已保存的远程图片作为输入：{inlined[:22]}...（{len(inlined) // 1024 // 1024}MB data URI，不再由远端下载）")
+
+    asyncio.run(serve(f"{digest}{ext}"))
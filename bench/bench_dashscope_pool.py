@@ -0,0 +1,48 @@
+# 连接池微基准：对比裸 requests.post 与共享 keep-alive 会话
+# 运行：python -m bench.bench_dashscope_pool
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.dashscope_stub import DashScopeStub
+
+stub = DashScopeStub().start()
+os.environ["DASHSCOPE_GENERATE_URL"] = stub.url
+# 本基准不测限流，放开生图令牌桶
+os.environ.setdefault("RATE_LIMIT_IMAGE_QPS", "100000")
+os.environ.setdefault("RATE_LIMIT_IMAGE_BURST", "100000")
+
+import requests  # noqa: E402
+from custom.dashscope_client import parse_image_urls, post_generation  # noqa: E402
+
+CALLS = int(os.getenv("BENCH_CALLS", "500"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+PAYLOAD = {"model": "wan2.6-t2i", "input": {"messages": []}, "parameters": {"n": 1}}
+
+
+def bare_call(_):
+    # 旧实现：每次调用新建连接
+    response = requests.post(url=stub.url, json=PAYLOAD, timeout=60)
+    response.raise_for_status()
+    return parse_image_urls(response.json())
+
+
+def pooled_call(_):
+    return post_generation(PAYLOAD)
+
+
+def run(name, fn):
+    stub.reset_counters()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        results = list(pool.map(fn, range(CALLS)))
+    elapsed = time.perf_counter() - start
+    assert all(results), f"{name}: 存在失败的请求"
+    print(f"{name:<8} 调用 {stub.requests} 次, 新建连接 {stub.connections} 条, "
+          f"耗时 {elapsed:.3f}s, 平均 {elapsed / CALLS * 1000:.2f}ms/次")
+
+
+if __name__ == "__main__":
+    run("bare", bare_call)
+    run("pooled", pooled_call)
+    stub.shutdown()
@@ -0,0 +1,48 @@
+# 报销审批恢复执行验证：计数假 LLM，确认每张超标发票审批通过时只调用一次模型
+# 发票文本刻意避开规则快速提取，保证每张都会走 LLM
+# 运行：python -m bench.bench_expense_resume
+import os
+import time
+
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+
+import agent.graph  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+INVOICES = int(os.getenv("BENCH_INVOICES", "20"))
+
+
+class _Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return _Reply("860")
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+if __name__ == "__main__":
+    fake = CountingLLM()
+    agent.graph.llm = fake
+
+    import app  # noqa: E402
+    client = TestClient(app.app)
+
+    start = time.perf_counter()
+    for i in range(INVOICES):
+        submitted = client.post("/submit", json={"text": f"第 {i} 号报销单：酒店住宿两晚，每晚 430 元"}).json()
+        assert submitted["status"] == "need_approval", submitted
+        approved = client.post("/approve", json={"task_id": submitted["task_id"], "approved": True}).json()
+        assert approved["status"] == "finished", approved
+    elapsed = time.perf_counter() - start
+
+    print(f"{INVOICES} 张超标发票，LLM 调用 {fake.calls} 次，平均 {elapsed / INVOICES * 1000:.2f}ms/张（提交+审批）")
+    assert fake.calls == INVOICES, "审批恢复时重新调用了 LLM"
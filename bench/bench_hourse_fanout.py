@@ -0,0 +1,93 @@
+# 马图/人物图并行生成的计时验证：用固定延迟的假生图接口替换真实调用
+# 运行：python -m bench.bench_hourse_fanout
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+# 关闭马图库，保证每次恢复都真正生成马图
+os.environ.setdefault("HOURSE_LIBRARY_VARIANTS", "0")
+
+import hourseAgent  # noqa: E402
+from langgraph.types import Command  # noqa: E402
+
+IMAGE_LATENCY = float(os.getenv("BENCH_IMAGE_LATENCY", "0.5"))
+
+_lock = threading.Lock()
+_intervals = []
+
+
+class _FakeStructuredLLM:
+    def invoke(self, messages):
+        return hourseAgent.ImageStyles(styles=["水墨", "赛博朋克", "油画", "喜庆年画"])
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+    def batch(self, inputs):
+        # 风格池后台补货
+        return [self.invoke(messages) for messages in inputs]
+
+
+def _record(start):
+    with _lock:
+        _intervals.append((start, time.perf_counter()))
+
+
+def fake_generate(prompt, use_cache=True):
+    start = time.perf_counter()
+    time.sleep(IMAGE_LATENCY)
+    _record(start)
+    return [f"http://stub.local/{len(_intervals)}.png"]
+
+
+async def afake_generate(prompt, use_cache=True):
+    start = time.perf_counter()
+    await asyncio.sleep(IMAGE_LATENCY)
+    _record(start)
+    return [f"http://stub.local/{len(_intervals)}.png"]
+
+
+def fake_final(prompt, person_url, hourse_url):
+    return ["http://stub.local/final.png"]
+
+
+async def afake_final(prompt, person_url, hourse_url):
+    return fake_final(prompt, person_url, hourse_url)
+
+
+hourseAgent.structured_llm = _FakeStructuredLLM()
+hourseAgent.generate_image_by_text = fake_generate
+hourseAgent.agenerate_image_by_text = afake_generate
+hourseAgent.generate_final = fake_final
+hourseAgent.agenerate_final = afake_final
+
+
+def _check(name, elapsed):
+    (a_start, a_end), (b_start, b_end) = _intervals[-2:]
+    overlapped = a_start < b_end and b_start < a_end
+    print(f"{name:<7} 恢复执行耗时 {elapsed:.3f}s（单次生图 {IMAGE_LATENCY}s），两次生图并行：{overlapped}")
+    assert overlapped, "person_generate 与 hourse_generate 没有并行执行"
+    assert elapsed < IMAGE_LATENCY * 1.8, "端到端耗时没有减少一次生图的时长"
+
+
+def run_sync():
+    config = {"configurable": {"thread_id": "bench-sync"}}
+    hourseAgent.agent.invoke({"messages": []}, config=config)
+    start = time.perf_counter()
+    hourseAgent.agent.invoke(Command(resume="水墨"), config=config)
+    _check("invoke", time.perf_counter() - start)
+
+
+async def run_async():
+    config = {"configurable": {"thread_id": "bench-async"}}
+    await hourseAgent.agent.ainvoke({"messages": []}, config=config)
+    start = time.perf_counter()
+    await hourseAgent.agent.ainvoke(Command(resume="水墨"), config=config)
+    _check("ainvoke", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    run_sync()
+    asyncio.run(run_async())
@@ -0,0 +1,88 @@
+# 马图库基准：本地桩服务模拟生图耗时，N 个任务按热门程度（少数风格占大多数任务）选择风格，
+# 对比关闭/开启马图库时 hourse_generate 实际发出的生图请求数和平均耗时，并检查每个热门风格的变体数
+# 运行：python -m bench.bench_hourse_library
+import os
+import random
+import tempfile
+import time
+
+from bench.model_stub import ModelStub, Route
+
+JOBS = int(os.getenv("BENCH_JOBS", "200"))
+STYLES = int(os.getenv("BENCH_STYLES", "20"))
+VARIANTS = int(os.getenv("BENCH_VARIANTS", "3"))
+
+stub = ModelStub(image=Route(os.getenv("BENCH_IMAGE_LATENCY", "fixed:0.5"))).start()
+_workdir = tempfile.mkdtemp(prefix="bench-hourse-library-")
+os.environ["DASHSCOPE_GENERATE_URL"] = stub.generate_url
+os.environ["CHECKPOINT_DB"] = os.path.join(_workdir, "checkpoints.sqlite")
+os.environ["ARTIFACT_DIR"] = os.path.join(_workdir, "artifacts")
+os.environ["IMAGE_CACHE_ENABLED"] = "false"
+os.environ["HOURSE_LIBRARY_VARIANTS"] = str(VARIANTS)
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+os.environ.setdefault("RATE_LIMIT_IMAGE_QPS", "1000")
+os.environ.setdefault("RATE_LIMIT_IMAGE_BURST", "1000")
+
+from custom.image_cache import image_cache_bypass  # noqa: E402
+from hourse.hourse_library import HourseLibrary, normalize_style  # noqa: E402
+import hourseAgent  # noqa: E402
+
+
+def workload(seed=0):
+    # Zipf 分布：第 k 个风格被选中的概率与 1/k 成正比
+    rng = random.Random(seed)
+    styles = [f"第{k}种风格" for k in range(1, STYLES + 1)]
+    return rng.choices(styles, weights=[1 / k for k in range(1, STYLES + 1)], k=JOBS)
+
+
+def run(jobs):
+    before = stub.counters()["image"]["requests"]
+    start = time.perf_counter()
+    latencies = []
+    for style in jobs:
+        t = time.perf_counter()
+        hourseAgent.hourse_generate({"style": style}, {})
+        latencies.append(time.perf_counter() - t)
+    return stub.counters()["image"]["requests"] - before, time.perf_counter() - start, latencies
+
+
+def wait_idle(library, timeout=60):
+    # 等后台补齐的变体生成完
+    deadline = time.time() + timeout
+    while library.stats()["filling"] and time.time() < deadline:
+        time.sleep(0.05)
+
+
+def report(name, jobs, calls, elapsed, latencies):
+    avg = sum(latencies) / len(latencies) * 1000
+    print(f"{name:<10} {len(jobs):>6} {calls:>8} {calls / len(jobs):>8.0%} {avg:>9.1f}ms {elapsed:>8.2f}s")
+
+
+if __name__ == "__main__":
+    jobs = workload()
+    print(f"{'场景':<10} {'任务数':>4} {'生图次数':>4} {'生图占比':>4} {'平均耗时':>8} {'总耗时':>6}")
+
+    library = hourseAgent.hourse_library
+    library.variants = 0
+    report("关闭图库", jobs, *run(jobs))
+
+    # 新的索引文件，从空库开始（包含后台补齐变体的生图请求）
+    library = hourseAgent.hourse_library = HourseLibrary(
+        hourseAgent._produce_hourse, path=os.path.join(_workdir, "library.sqlite"), variants=VARIANTS)
+    before = stub.counters()["image"]["requests"]
+    _, elapsed, latencies = run(jobs)
+    wait_idle(library)
+    report("开启图库", jobs, stub.counters()["image"]["requests"] - before, elapsed, latencies)
+    report("再跑一轮", jobs, *run(workload(seed=1)))
+
+    stats = library.stats()
+    print(f"图库：{stats}")
+    top = "第1种风格"
+    urls = {hourseAgent.hourse_generate({"style": top}, {})["hourse_with_style"] for _ in range(50)}
+    print(f"热门风格 {top}：{library.count(top)} 个变体，50 次取图拿到 {len(urls)} 张不同的图")
+    print(f"归一化：{normalize_style(' 水墨 风格。')!r} == {normalize_style('水墨')!r}")
+
+    before = stub.counters()["image"]["requests"]
+    with image_cache_bypass():
+        hourseAgent.hourse_generate({"style": top}, {})
+    print(f"fresh：新增生图请求 {stub.counters()['image']['requests'] - before} 次（应为 1）")
@@ -0,0 +1,75 @@
+# 推测执行基准：本地桩服务模拟模型耗时，N 个任务并发提交，等待“思考时间”后选择风格并恢复执行，
+# 对比关闭/开启推测时恢复执行的耗时（用户选择后等多久拿到结果）和每个任务实际发出的生图请求数
+# 场景：思考时间长于生图（推测已完成）、思考时间很短（推测还在进行中）、用户输入了不在候选中的风格（推测全部浪费）、
+# 超过费用上限（部分任务只推测靠前的风格或不推测）
+# 运行：python -m bench.bench_hourse_speculation
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.model_stub import ModelStub, Route
+
+TASKS = int(os.getenv("BENCH_TASKS", "8"))
+IMAGE_LATENCY = float(os.getenv("BENCH_IMAGE_LATENCY", "1.0"))
+THINK_TIME = float(os.getenv("BENCH_THINK_TIME", "2.0"))
+
+stub = ModelStub(chat=Route("fixed:0.2"), image=Route(f"fixed:{IMAGE_LATENCY}")).start()
+_workdir = tempfile.mkdtemp(prefix="bench-speculation-")
+os.environ["DASHSCOPE_GENERATE_URL"] = stub.generate_url
+os.environ["DASHSCOPE_BASE_URL"] = stub.chat_base_url
+os.environ["CHECKPOINT_DB"] = os.path.join(_workdir, "checkpoints.sqlite")
+os.environ["ARTIFACT_DIR"] = os.path.join(_workdir, "artifacts")
+# 生图缓存、请求合并、马图库、风格池关闭，每次生图都打到桩服务（桩服务对每个任务返回相同的风格列表）
+os.environ["IMAGE_CACHE_ENABLED"] = "false"
+os.environ["SINGLEFLIGHT_ENABLED"] = "false"
+# 连接池足够大，推测生图不占用用户请求的连接
+os.environ.setdefault("DASHSCOPE_POOL_MAXSIZE", str(TASKS * 16))
+os.environ["HOURSE_LIBRARY_VARIANTS"] = "0"
+os.environ["HOURSE_STYLE_POOL_DEPTH"] = "0"
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+for _bucket in ("LLM", "IMAGE"):
+    os.environ.setdefault(f"RATE_LIMIT_{_bucket}_QPS", "100000")
+    os.environ.setdefault(f"RATE_LIMIT_{_bucket}_BURST", "100000")
+
+import hourseAgent  # noqa: E402
+from hourse.pipeline import resume_task, start_task  # noqa: E402
+from hourse.speculation import Speculator  # noqa: E402
+
+
+def job(think, choose):
+    thread_id = str(uuid.uuid4())
+    styles = start_task(thread_id, "我想要一张骑马的合照")["styles"]
+    time.sleep(think)
+    start = time.perf_counter()
+    result = resume_task(thread_id, choose(styles))
+    return time.perf_counter() - start, result["status"]
+
+
+def run(name, think=THINK_TIME, enabled=True, max_calls=TASKS * 8, choose=lambda styles: styles[1]):
+    hourseAgent.speculator = Speculator(hourseAgent.speculator.produce, enabled=enabled, max_calls=max_calls)
+    before = stub.counters()["image"]["requests"]
+    with ThreadPoolExecutor(max_workers=TASKS) as pool:
+        results = list(pool.map(lambda _: job(think, choose), range(TASKS)))
+    # 等已经发出、结果被丢弃的推测生图结束后再统计请求数
+    time.sleep(IMAGE_LATENCY * 1.5)
+    calls = stub.counters()["image"]["requests"] - before
+    latencies = [latency for latency, _ in results]
+    completed = sum(status == "completed" for _, status in results)
+    stats = hourseAgent.speculator.stats()
+    print(f"{name:<16} {statistics.median(latencies):>8.2f}s {max(latencies):>8.2f}s {calls / TASKS:>10.1f} "
+          f"{completed:>4}/{TASKS} {stats['adopted']:>6} {stats['missed']:>6} {stats['cancelled']:>6} "
+          f"{stats['wasted']:>6} {stats['partial']:>6} {stats['skipped']:>6}")
+
+
+if __name__ == "__main__":
+    print(f"思考时间 {THINK_TIME}s，单次生图 {IMAGE_LATENCY}s，{TASKS} 个任务；每个任务不推测时需 3 次生图（马图、人物图、合成）")
+    print(f"{'场景':<16} {'恢复p50':>8} {'恢复max':>8} {'生图/任务':>8} {'完成':>6} {'采用':>4} {'未命中':>4} "
+          f"{'取消':>4} {'浪费':>4} {'部分':>4} {'跳过':>4}")
+    run("关闭推测", enabled=False)
+    run("开启推测")
+    run("思考时间很短", think=IMAGE_LATENCY / 3)
+    run("选择候选外风格", choose=lambda styles: "自定义的水彩风格")
+    run("费用上限=20次", max_calls=20)
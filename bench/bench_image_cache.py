@@ -0,0 +1,107 @@
+# 生图缓存基准：本地桩服务模拟生图耗时，测量未命中/命中的耗时，并验证
+# 提示词归一化后命中、bypass 不读缓存、以缓存图片为输入的编辑请求按内容哈希命中、
+# URL 过期后返回本地文件并以 data URI 发送、超过容量后淘汰、另一个 worker 进程可以直接命中
+# 运行：python -m bench.bench_image_cache
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.model_stub import ModelStub, Route
+
+IMAGE_LATENCY = os.getenv("BENCH_IMAGE_LATENCY", "fixed:1.0")
+PROMPTS = int(os.getenv("BENCH_PROMPTS", "4"))
+
+stub = ModelStub(image=Route(IMAGE_LATENCY)).start()
+_workdir = tempfile.mkdtemp(prefix="bench-image-cache-")
+os.environ["DASHSCOPE_GENERATE_URL"] = stub.generate_url
+os.environ["IMAGE_CACHE_DIR"] = os.path.join(_workdir, "cache")
+os.environ["ARTIFACT_DIR"] = os.path.join(_workdir, "artifacts")
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+os.environ.setdefault("RATE_LIMIT_IMAGE_QPS", "1000")
+os.environ.setdefault("RATE_LIMIT_IMAGE_BURST", "1000")
+
+from custom.image_cache import get_image_cache, image_cache_bypass  # noqa: E402
+from custom.image_edit import generate_final  # noqa: E402
+from custom.request import agenerate_image_by_text, generate_image_by_text  # noqa: E402
+
+# 另一个 worker 进程：用同样的提示词生图，应当全部命中
+_CHILD = r"""
+import sys
+from custom.request import generate_image_by_text
+from custom.image_cache import get_image_cache
+for prompt in sys.argv[1:]:
+    generate_image_by_text(prompt)
+print(get_image_cache().stats()["hits"])
+"""
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def wait_stored(count, timeout=30):
+    # 图片在后台下载保存
+    deadline = time.time() + timeout
+    while get_image_cache().stats()["entries"] < count and time.time() < deadline:
+        time.sleep(0.05)
+
+
+if __name__ == "__main__":
+    cache = get_image_cache()
+    prompts = [f"第 {i} 种风格的骏马，奔跑在草原上" for i in range(PROMPTS)]
+
+    misses = [timed(generate_image_by_text, prompt)[1] for prompt in prompts]
+    wait_stored(PROMPTS)
+    hits = [timed(generate_image_by_text, prompt)[1] for prompt in prompts]
+    print(f"未命中：{sum(misses) / len(misses) * 1000:.0f}ms/次，命中：{sum(hits) / len(hits) * 1000:.2f}ms/次")
+
+    # 全角字符、多余空白归一化后仍命中
+    requests_before = stub.counters()["image"]["requests"]
+    generate_image_by_text("  " + prompts[0].replace(" ", "　") + "  ")
+    asyncio.run(agenerate_image_by_text(prompts[1]))
+    print(f"归一化提示词 + 异步接口：新增生图请求 {stub.counters()['image']['requests'] - requests_before} 次")
+
+    requests_before = stub.counters()["image"]["requests"]
+    with image_cache_bypass():
+        generate_image_by_text(prompts[0])
+    generate_image_by_text(prompts[0], use_cache=False)
+    print(f"bypass：新增生图请求 {stub.counters()['image']['requests'] - requests_before} 次（应为 2）")
+
+    person, hourse = generate_image_by_text(prompts[0])[0], generate_image_by_text(prompts[1])[0]
+    first, miss_time = timed(generate_final, "合照", person, hourse)
+    wait_stored(PROMPTS + 1)
+    second, hit_time = timed(generate_final, "合照", person, hourse)
+    print(f"图片编辑（输入为缓存图片）：未命中 {miss_time * 1000:.0f}ms，命中 {hit_time * 1000:.2f}ms，结果一致 {first == second}")
+
+    # URL 过期后返回本服务的下载地址，作为输入时读取本地文件转成 data URI 发送
+    cache.url_ttl = -1
+    expired = generate_image_by_text(prompts[0])[0]
+    requests_before = stub.counters()["image"]["requests"]
+    generate_final("另一张合照", expired, hourse)
+    print(f"URL 过期：返回 {expired[:10]}...，以本地图片为输入的编辑请求 {stub.counters()['image']['requests'] - requests_before} 次")
+    cache.url_ttl = 23 * 3600
+
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD, *prompts], capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": os.getcwd()},
+    )
+    print(f"另一个进程：{PROMPTS} 次生图命中 {result.stdout.strip() or result.stderr.strip()[-200:]} 次")
+
+    stats = cache.stats()
+    # 桩服务每次返回同一张图片，按内容哈希只存一份
+    print(f"命中率 {stats['hit_rate']:.0%}，条目 {stats['entries']}，占用 {stats['bytes']} 字节")
+
+    # 容量淘汰：写入 4 张不同的 1000 字节图片，访问最早的一张后把容量降到 2500 字节（之前的条目访问更早，先被淘汰）
+    now = time.time()
+    for i in range(4):
+        cache.put(f"lru-{i}", f"http://stub/lru-{i}.png", bytes([i]) * 1000, now=now + i)
+    cache.get("lru-0", now=now + 10)
+    cache.max_bytes = 2500
+    cache.evict(now=now + 11)
+    kept = [f"lru-{i}" for i in range(4) if cache.get(f"lru-{i}", now=now + 12)]
+    print(f"LRU 淘汰后保留：{kept}（应为 lru-0、lru-3）")
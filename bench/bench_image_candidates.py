@@ -0,0 +1,130 @@
+# 多候选模式对比：用固定延迟的假 LLM / 生图 / 评审接口，比较不同候选数下得到合格图片的耗时与轮数
+# 运行：python -m bench.bench_image_candidates
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+# 假生图返回的地址不可下载，关闭评审前的下载缩放与缓存
+os.environ.setdefault("REVIEW_THUMBNAIL_SIZE", "0")
+os.environ.setdefault("REVIEW_CACHE_SIZE", "0")
+
+import imageAgent  # noqa: E402
+
+LLM_LATENCY = float(os.getenv("BENCH_LLM_LATENCY", "0.2"))
+IMAGE_LATENCY = float(os.getenv("BENCH_IMAGE_LATENCY", "0.5"))
+REVIEW_LATENCY = float(os.getenv("BENCH_REVIEW_LATENCY", "0.3"))
+# 单张图片通过评审的概率
+PASS_RATE = float(os.getenv("BENCH_PASS_RATE", "0.35"))
+TRIALS = int(os.getenv("BENCH_TRIALS", "20"))
+CANDIDATES = [int(k) for k in os.getenv("BENCH_CANDIDATES", "1,2,3,4").split(",")]
+
+_rng = random.Random(42)
+
+
+class _Reply:
+    def __init__(self, content):
+        self.content = content
+
+
+class _FakeLLM:
+    def invoke(self, prompt):
+        time.sleep(LLM_LATENCY)
+        return _Reply(f"电影画质的橘猫 #{_rng.randint(0, 9999)}")
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(LLM_LATENCY)
+        return _Reply(f"电影画质的橘猫 #{_rng.randint(0, 9999)}")
+
+    def batch(self, prompts):
+        # 真实的 batch 会并发请求，这里只计一次延迟
+        time.sleep(LLM_LATENCY)
+        return [_Reply(f"电影画质的橘猫 #{_rng.randint(0, 9999)}") for _ in prompts]
+
+    async def abatch(self, prompts):
+        await asyncio.sleep(LLM_LATENCY)
+        return [_Reply(f"电影画质的橘猫 #{_rng.randint(0, 9999)}") for _ in prompts]
+
+
+def _review():
+    passed = _rng.random() < PASS_RATE
+    score = _rng.randint(80, 95) if passed else _rng.randint(40, 75)
+    return _Reply(json.dumps({"score": score, "is_passed": passed, "feedback": "增加留白"}, ensure_ascii=False))
+
+
+class _FakeVL:
+    def invoke(self, messages):
+        time.sleep(REVIEW_LATENCY)
+        return _review()
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(REVIEW_LATENCY)
+        return _review()
+
+
+def fake_generate(prompt):
+    time.sleep(IMAGE_LATENCY)
+    return [f"http://stub.local/{abs(hash(prompt))}.png"]
+
+
+async def afake_generate(prompt):
+    await asyncio.sleep(IMAGE_LATENCY)
+    return [f"http://stub.local/{abs(hash(prompt))}.png"]
+
+
+imageAgent.llm = _FakeLLM()
+imageAgent.vlllm = _FakeVL()
+imageAgent.generate_image_by_text = fake_generate
+imageAgent.agenerate_image_by_text = afake_generate
+
+
+def _initial_state(k):
+    return {
+        "user_input": "一只可爱的橘猫坐在窗台上，阳光洒在它身上",
+        "current_prompt": "",
+        "image_data": "",
+        "feedback": "",
+        "score": 0,
+        "is_passed": False,
+        "iteration_count": 0,
+        "history": [],
+        "num_candidates": k,
+    }
+
+
+def _report(name, k, elapsed, results):
+    passed = sum(1 for r in results if r["is_passed"])
+    rounds = sum(r["iteration_count"] for r in results) / len(results)
+    score = sum(r["score"] for r in results) / len(results)
+    print(f"{name:<7} K={k}  平均耗时 {elapsed / len(results):.3f}s  通过率 {passed / len(results):>5.0%}  "
+          f"平均轮数 {rounds:.2f}  平均得分 {score:.1f}")
+
+
+def run_sync(k):
+    results = []
+    start = time.perf_counter()
+    for _ in range(TRIALS):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.append(imageAgent.app.invoke(_initial_state(k)))
+    _report("invoke", k, time.perf_counter() - start, results)
+
+
+async def run_async(k):
+    results = []
+    start = time.perf_counter()
+    for _ in range(TRIALS):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.append(await imageAgent.app.ainvoke(_initial_state(k)))
+    _report("ainvoke", k, time.perf_counter() - start, results)
+
+
+if __name__ == "__main__":
+    print(f"单次延迟：LLM {LLM_LATENCY}s，生图 {IMAGE_LATENCY}s，评审 {REVIEW_LATENCY}s；单图通过率 {PASS_RATE:.0%}，每组 {TRIALS} 次")
+    for k in CANDIDATES:
+        run_sync(k)
+    for k in CANDIDATES:
+        asyncio.run(run_async(k))
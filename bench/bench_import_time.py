@@ -0,0 +1,84 @@
+# 导入耗时与副作用检查：每个模块在独立的子进程中导入，记录耗时、本仓库模块自身耗时，
+# 并确认导入期间没有网络连接、没有加载 openai SDK、没有创建 checkpoint 数据库、不需要 API Key
+# 运行：python -m bench.bench_import_time
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODULES = os.getenv("BENCH_IMPORT_MODULES", "app,hourseApp,imageApp,chain,agent.graph,hourseAgent,imageAgent,graph,graphStart").split(",")
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行：拦截 socket 连接后导入模块
+_PROBE = r"""
+import json, socket, sys, time
+attempts = []
+def _blocked(self, address, *args, **kwargs):
+    attempts.append(str(address))
+    raise OSError("network disabled during import")
+socket.socket.connect = _blocked
+socket.socket.connect_ex = _blocked
+socket.getaddrinfo = lambda host, *args, **kwargs: attempts.append(str(host)) or (_ for _ in ()).throw(OSError("dns disabled"))
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "network": attempts,
+    "openai": "openai" in sys.modules,
+}}))
+"""
+
+
+def _repo_self_time(stderr):
+    # -X importtime 输出：import time: self [us] | cumulative | name
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not parts[0].isdigit():
+            continue
+        name = parts[2].strip()
+        top = name.split(".")[0]
+        if os.path.exists(os.path.join(ROOT, f"{top}.py")) or os.path.isdir(os.path.join(ROOT, top)):
+            total += int(parts[0])
+    return total / 1e6
+
+
+def measure(module, db_dir):
+    env = dict(os.environ)
+    env.pop("DASHSCOPE_API_KEY", None)
+    env["CHECKPOINT_DB"] = os.path.join(db_dir, f"{module}.sqlite")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=db_dir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["repo"] = _repo_self_time(proc.stderr)
+    result["db_created"] = os.path.exists(env["CHECKPOINT_DB"])
+    return result
+
+
+if __name__ == "__main__":
+    failed = False
+    print(f"{'模块':<12} {'导入耗时':>9} {'本仓库自身':>10} {'网络连接':>8} {'openai':>7} {'建库':>5}")
+    with tempfile.TemporaryDirectory() as db_dir:
+        for module in MODULES:
+            runs = [measure(module, db_dir) for _ in range(ROUNDS)]
+            errors = [run["error"] for run in runs if "error" in run]
+            if errors:
+                failed = True
+                print(f"{module:<12} 导入失败：{errors[0]}")
+                continue
+            best = min(runs, key=lambda run: run["elapsed"])
+            clean = not best["network"] and not best["db_created"]
+            failed = failed or not clean
+            print(f"{module:<12} {best['elapsed'] * 1000:>7.0f}ms {best['repo'] * 1000:>8.1f}ms "
+                  f"{len(best['network']):>8} {'是' if best['openai'] else '否':>7} {'是' if best['db_created'] else '否':>5}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,80 @@
+# 指标开销测试：同一个三节点小图，分别用 RunnableLambda(同步, afunc=异步) 节点（接入指标前各图的注册方式）
+# 和 instrument() 包装的节点编译，比较每次 invoke / ainvoke 的耗时差；另外测 token 回调和 /metrics 渲染的耗时
+# 运行：python -m bench.bench_metrics_overhead
+import asyncio
+import os
+import time
+from typing import TypedDict
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from custom.metrics import instrument, render, token_usage_handler
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "2000"))
+NODES = ("a", "b", "c")
+
+
+class State(TypedDict):
+    n: int
+
+
+def step(state: State):
+    return {"n": state["n"] + 1}
+
+
+async def astep(state: State):
+    return {"n": state["n"] + 1}
+
+
+def build(instrumented):
+    graph = StateGraph(State)
+    for node in NODES:
+        if instrumented:
+            graph.add_node(node, instrument("bench", node, step, astep))
+        else:
+            graph.add_node(node, RunnableLambda(step, afunc=astep, name=node))
+    graph.add_edge(START, NODES[0])
+    for prev, node in zip(NODES, NODES[1:]):
+        graph.add_edge(prev, node)
+    graph.add_edge(NODES[-1], END)
+    return graph.compile()
+
+
+def per_call(fn, rounds=ROUNDS):
+    fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+async def aper_call(fn, rounds=ROUNDS):
+    await fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await fn()
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    plain, wrapped = build(False), build(True)
+    print(f"每次 invoke 含 {len(NODES)} 个节点，{ROUNDS} 轮取平均")
+    print(f"{'方式':<8} {'RunnableLambda':>10} {'instrument':>12} {'每节点开销':>10}")
+    for name, measure in (
+        ("invoke", lambda g: per_call(lambda: g.invoke({"n": 0}))),
+        ("ainvoke", lambda g: asyncio.run(aper_call(lambda: g.ainvoke({"n": 0})))),
+    ):
+        base, inst = measure(plain), measure(wrapped)
+        print(f"{name:<8} {base * 1e6:>12.0f}µs {inst * 1e6:>10.0f}µs {(inst - base) / len(NODES) * 1e6:>8.1f}µs")
+
+    result = LLMResult(
+        generations=[[ChatGeneration(message=AIMessage(content="ok"))]],
+        llm_output={"model_name": "bench", "token_usage": {"prompt_tokens": 100, "completion_tokens": 20}},
+    )
+    handler = per_call(lambda: token_usage_handler.on_llm_end(result), ROUNDS * 10)
+    print(f"token 回调：{handler * 1e6:.2f}µs/次")
+
+    body = render()
+    render_time = per_call(render, 200)
+    print(f"/metrics 渲染：{render_time * 1e3:.2f}ms（{len(body.splitlines())} 行）")
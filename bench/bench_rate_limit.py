@@ -0,0 +1,68 @@
+# 跨进程限流验证：多个进程共享一个令牌桶时总速率不超过配置值；交互请求优先于批量请求拿到令牌
+# 运行：python -m bench.bench_rate_limit
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from custom.rate_limit import (PRIORITY_BULK, PRIORITY_INTERACTIVE, SharedRateLimiter,
+                               SharedTokenBucket, request_priority)
+
+RATE = float(os.getenv("BENCH_RATE", "20"))
+PROCESSES = int(os.getenv("BENCH_PROCESSES", "4"))
+PER_PROCESS = int(os.getenv("BENCH_PER_PROCESS", "20"))
+
+
+def _worker(directory, results):
+    limiter = SharedRateLimiter(SharedTokenBucket("bench", RATE, 1, directory))
+    for _ in range(PER_PROCESS):
+        limiter.acquire()
+        results.put(time.time())
+
+
+def scenario_cross_process(directory):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_worker, args=(directory, results)) for _ in range(PROCESSES)]
+    start = time.time()
+    for proc in procs:
+        proc.start()
+    stamps = [results.get() for _ in range(PROCESSES * PER_PROCESS)]
+    for proc in procs:
+        proc.join()
+    elapsed = max(stamps) - start
+    observed = (len(stamps) - 1) / elapsed
+    print(f"[跨进程] {PROCESSES} 个进程共取 {len(stamps)} 个令牌，耗时 {elapsed:.2f}s，"
+          f"实际速率 {observed:.1f}/s（配置 {RATE}/s）")
+    assert observed <= RATE * 1.1
+
+
+def scenario_priority(directory):
+    limiter = SharedRateLimiter(SharedTokenBucket("priority", RATE, 1, directory))
+    waits = {"bulk": [], "interactive": []}
+
+    def request(kind, priority):
+        with request_priority(priority):
+            start = time.perf_counter()
+            limiter.acquire()
+            waits[kind].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=request, args=("bulk", PRIORITY_BULK)) for _ in range(40)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    # 批量请求已经排满队列后，交互请求才到达
+    interactive = [threading.Thread(target=request, args=("interactive", PRIORITY_INTERACTIVE)) for _ in range(3)]
+    for thread in interactive:
+        thread.start()
+    for thread in threads + interactive:
+        thread.join()
+    print(f"[优先级] 40 个批量请求排队时到达的交互请求最长等待 {max(waits['interactive']):.2f}s，"
+          f"批量请求最长等待 {max(waits['bulk']):.2f}s")
+    assert max(waits["interactive"]) < 4 / RATE + 0.1
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        scenario_cross_process(directory)
+        scenario_priority(directory)
@@ -0,0 +1,98 @@
+# 容错层验证：对故障注入桩服务分别测试重试、对冲请求和熔断器
+# 运行：python -m bench.bench_resilience
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.dashscope_stub import DashScopeStub
+
+stub = DashScopeStub().start()
+os.environ["DASHSCOPE_GENERATE_URL"] = stub.url
+# 本基准不测限流，放开生图令牌桶
+os.environ.setdefault("RATE_LIMIT_IMAGE_QPS", "100000")
+os.environ.setdefault("RATE_LIMIT_IMAGE_BURST", "100000")
+os.environ.setdefault("DASHSCOPE_BACKOFF_BASE", "0.02")
+
+from custom import dashscope_client  # noqa: E402
+from custom.dashscope_client import post_generation  # noqa: E402
+from custom.resilience import CircuitBreaker, ResilientCaller  # noqa: E402
+
+CALLS = int(os.getenv("BENCH_CALLS", "200"))
+PAYLOAD = {"model": "wan2.6-t2i", "input": {"messages": []}, "parameters": {"n": 1}}
+
+
+def reset_caller(**kwargs):
+    caller = ResilientCaller(
+        "dashscope-image",
+        max_attempts=kwargs.pop("max_attempts", 3),
+        backoff_base=0.02,
+        breaker=kwargs.pop("breaker", CircuitBreaker(5, 30)),
+        **kwargs,
+    )
+    dashscope_client.image_caller = caller
+    return caller
+
+
+def run_calls(concurrency=8):
+    latencies = []
+
+    def one(_):
+        start = time.perf_counter()
+        ok = post_generation(PAYLOAD) is not None
+        latencies.append(time.perf_counter() - start)
+        return ok
+
+    # 失败日志不输出到控制台
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        ok = sum(pool.map(one, range(CALLS)))
+    latencies.sort()
+    return ok, latencies[int(0.5 * len(latencies))], latencies[int(0.99 * len(latencies)) - 1]
+
+
+def scenario_retry():
+    stub.reset_counters()
+    stub.latency, stub.error_rate, stub.slow_rate = 0.005, 0.3, 0.0
+    for attempts in (1, 3):
+        caller = reset_caller(max_attempts=attempts, breaker=CircuitBreaker(10 ** 6, 30))
+        ok, p50, p99 = run_calls()
+        print(f"[重试] 30% 503，最多尝试 {attempts} 次：成功 {ok}/{CALLS}，{caller.metrics()}")
+    assert ok >= CALLS * 0.95
+
+
+def scenario_hedge():
+    stub.latency, stub.error_rate, stub.slow_rate, stub.slow_latency = 0.01, 0.0, 0.05, 0.5
+    results = {}
+    for hedge in (False, True):
+        caller = reset_caller(hedge=hedge, hedge_delay=0.05 if hedge else None)
+        ok, p50, p99 = run_calls()
+        results[hedge] = p99
+        print(f"[对冲] 5% 慢请求(0.5s)，对冲={hedge}：成功 {ok}/{CALLS}，p50 {p50 * 1000:.0f}ms，"
+              f"p99 {p99 * 1000:.0f}ms，hedges={caller.metrics()['hedges']}，hedge_wins={caller.metrics()['hedge_wins']}")
+    assert results[True] < results[False]
+
+
+def scenario_breaker():
+    stub.latency, stub.error_rate, stub.slow_rate = 0.0, 0.0, 0.0
+    caller = reset_caller(max_attempts=2, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5))
+    stub.down = True
+    stub.reset_counters()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(50):
+            post_generation(PAYLOAD)
+    print(f"[熔断] 后端宕机：50 次调用只打到后端 {stub.requests} 次，耗时 {time.perf_counter() - start:.2f}s，"
+          f"状态 {caller.metrics()['breaker_state']}，short_circuits={caller.metrics()['short_circuits']}")
+    assert stub.requests <= 6
+    stub.down = False
+    time.sleep(0.6)
+    assert post_generation(PAYLOAD) is not None
+    print(f"[熔断] 后端恢复后半开探测成功，状态 {caller.metrics()['breaker_state']}")
+
+
+if __name__ == "__main__":
+    scenario_retry()
+    scenario_hedge()
+    scenario_breaker()
+    stub.shutdown()
@@ -0,0 +1,133 @@
+# 评审前缩略图的收益：本地桩服务同时提供 1280×1280 原图和 OpenAI 兼容的视觉模型接口，
+# 桩接口按图片像素折算 token（28×28 像素 1 个 token）并按 token 数增加处理耗时
+# 运行：python -m bench.bench_review_thumbnail
+import base64
+import io
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+
+from PIL import Image  # noqa: E402
+from langchain_openai import ChatOpenAI  # noqa: E402
+import imageAgent  # noqa: E402
+from custom.review_cache import ReviewCache, prepare_review_image  # noqa: E402
+
+# 视觉模型的固定耗时与每个图片 token 的耗时（秒）
+VL_BASE_LATENCY = float(os.getenv("BENCH_VL_BASE_LATENCY", "0.3"))
+VL_TOKEN_LATENCY = float(os.getenv("BENCH_VL_TOKEN_LATENCY", "0.0002"))
+SIZES = [int(s) for s in os.getenv("BENCH_THUMBNAIL_SIZES", "0,1024,768,512,384,256").split(",")]
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+PIXELS_PER_TOKEN = 28 * 28
+
+
+def _make_png(size=1280):
+    # 渐变 + 噪点，压缩后大小接近真实生成图
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    overlay = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(image, overlay, 0.5).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send(self, content_type, body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send("image/png", self.server.png)
+
+    def _image_pixels(self, url):
+        if url.startswith("data:"):
+            data = base64.b64decode(url.split(",", 1)[1])
+        else:
+            # 模型服务端自行下载原图
+            data = urllib.request.urlopen(url).read()
+        with Image.open(io.BytesIO(data)) as image:
+            return image.width * image.height
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.payload_bytes.append(int(self.headers.get("Content-Length", 0)))
+        tokens = 0
+        for part in body["messages"][0]["content"]:
+            if part.get("type") == "image_url":
+                tokens += self._image_pixels(part["image_url"]["url"]) // PIXELS_PER_TOKEN
+        self.server.image_tokens.append(tokens)
+        time.sleep(VL_BASE_LATENCY + tokens * VL_TOKEN_LATENCY)
+        review = json.dumps({"score": 82, "is_passed": True, "feedback": "构图平衡"}, ensure_ascii=False)
+        self._send("application/json", json.dumps({
+            "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub-vl",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": review}}],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": 20, "total_tokens": tokens + 20},
+        }).encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.png = _make_png()
+    server.payload_bytes = []
+    server.image_tokens = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_sizes(server, base):
+    vl = ChatOpenAI(model="stub-vl", api_key="bench", base_url=f"{base}/v1")
+    image_url = f"{base}/image.png"
+    state = {"current_prompt": "电影画质的橘猫", "image_data": image_url}
+    print(f"原图 {len(server.png) / 1024:.0f} KB；视觉模型耗时 = {VL_BASE_LATENCY}s + 图片 token × {VL_TOKEN_LATENCY}s")
+    print(f"{'缩略图':>8} {'预处理':>9} {'评审':>9} {'总耗时':>9} {'请求体':>10} {'图片token':>9}")
+    for size in SIZES:
+        prep, review = [], []
+        server.payload_bytes.clear()
+        server.image_tokens.clear()
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            # size 为 0 时不下载不缩放，直接传原图 URL
+            _, image_ref = prepare_review_image(image_url, size) if size else (None, image_url)
+            middle = time.perf_counter()
+            vl.invoke([imageAgent._review_message(state, image_ref)])
+            prep.append(middle - start)
+            review.append(time.perf_counter() - middle)
+        name = f"{size}px" if size else "原图URL"
+        print(f"{name:>8} {statistics.median(prep):>8.3f}s {statistics.median(review):>8.3f}s "
+              f"{statistics.median(prep) + statistics.median(review):>8.3f}s "
+              f"{statistics.median(server.payload_bytes) / 1024:>8.1f}KB {statistics.median(server.image_tokens):>9.0f}")
+
+
+def bench_cache(base):
+    imageAgent.vlllm = ChatOpenAI(model="stub-vl", api_key="bench", base_url=f"{base}/v1")
+    imageAgent.review_cache = ReviewCache(max_size=16)
+    state = {"current_prompt": "电影画质的橘猫", "image_data": f"{base}/image.png"}
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        imageAgent._review(state)
+        timings.append(time.perf_counter() - start)
+    print(f"缓存：首次评审 {timings[0]:.3f}s，重复评审 {statistics.median(timings[1:]):.3f}s，"
+          f"{imageAgent.review_cache.stats()}")
+
+
+if __name__ == "__main__":
+    stub = _start_stub()
+    host, port = stub.server_address[:2]
+    base = f"http://{host}:{port}"
+    bench_sizes(stub, base)
+    bench_cache(base)
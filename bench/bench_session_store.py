@@ -0,0 +1,59 @@
+# 会话历史基准：随着同一会话提交的发票增多，对比无界 dict 存储与有界窗口存储的单次耗时和 prompt token 数
+# 运行：python -m bench.bench_session_store
+import os
+import time
+
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+
+from langchain_core.chat_history import InMemoryChatMessageHistory  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.output_parsers import StrOutputParser  # noqa: E402
+from langchain_core.runnables import RunnableLambda  # noqa: E402
+from langchain_core.runnables.history import RunnableWithMessageHistory  # noqa: E402
+
+import chain  # noqa: E402
+from custom.session_store import SessionStore, estimate_tokens  # noqa: E402
+
+INVOICES = int(os.getenv("BENCH_INVOICES", "200"))
+REPORT_EVERY = INVOICES // 6
+# 模拟模型耗时与 prompt 长度成正比（秒/token）
+SECONDS_PER_TOKEN = float(os.getenv("BENCH_SECONDS_PER_TOKEN", "0.00002"))
+
+
+def build_chain(get_history, prompt_tokens):
+    def fake_llm(prompt_value):
+        tokens = sum(estimate_tokens(m) for m in prompt_value.to_messages())
+        prompt_tokens.append(tokens)
+        time.sleep(tokens * SECONDS_PER_TOKEN)
+        return AIMessage(content="860")
+
+    return RunnableWithMessageHistory(
+        chain.invoice_prompt | RunnableLambda(fake_llm) | StrOutputParser(),
+        get_history,
+        input_messages_key="text",
+    )
+
+
+def run(name, get_history):
+    prompt_tokens = []
+    runnable = build_chain(get_history, prompt_tokens)
+    config = {"configurable": {"session_id": "bench-user"}}
+    print(f"--- {name}")
+    for i in range(1, INVOICES + 1):
+        start = time.perf_counter()
+        runnable.invoke({"text": f"第 {i} 张发票：酒店住宿费用，总计 860 元"}, config=config)
+        elapsed = time.perf_counter() - start
+        if i % REPORT_EVERY == 0:
+            print(f"第 {i:>4} 次调用：耗时 {elapsed * 1000:7.2f}ms，prompt 约 {prompt_tokens[-1]:>6} tokens")
+
+
+if __name__ == "__main__":
+    unbounded = {}
+
+    def get_unbounded(session_id):
+        if session_id not in unbounded:
+            unbounded[session_id] = InMemoryChatMessageHistory()
+        return unbounded[session_id]
+
+    run("无界 dict + InMemoryChatMessageHistory（旧实现）", get_unbounded)
+    run("SessionStore 窗口", SessionStore(max_sessions=100, max_messages=20, max_tokens=2000).get)
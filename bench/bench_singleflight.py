@@ -0,0 +1,86 @@
+# 请求合并基准：本地桩服务模拟模型耗时，N 个相同请求同时发出，统计实际打到桩服务的请求数
+# 场景：同步线程并发生图、异步并发生图、同步与异步混合、批量提交 N 张相同发票（金额需要 LLM 提取）
+# 生图缓存关闭，只看合并的效果；对照组使用 use_cache=False（要求重新生成时不合并）
+# 运行：python -m bench.bench_singleflight
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.model_stub import ModelStub, Route
+
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "20"))
+stub = ModelStub(chat=Route(os.getenv("BENCH_CHAT_LATENCY", "fixed:0.5")),
+                 image=Route(os.getenv("BENCH_IMAGE_LATENCY", "fixed:1.0"))).start()
+_workdir = tempfile.mkdtemp(prefix="bench-singleflight-")
+os.environ["DASHSCOPE_GENERATE_URL"] = stub.generate_url
+os.environ["DASHSCOPE_BASE_URL"] = stub.chat_base_url
+os.environ["CHECKPOINT_DB"] = os.path.join(_workdir, "checkpoints.sqlite")
+os.environ["ARTIFACT_DIR"] = os.path.join(_workdir, "artifacts")
+os.environ["IMAGE_CACHE_ENABLED"] = "false"
+os.environ["BATCH_MAX_CONCURRENCY"] = str(CONCURRENCY)
+os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+for _bucket in ("LLM", "IMAGE"):
+    os.environ.setdefault(f"RATE_LIMIT_{_bucket}_QPS", "100000")
+    os.environ.setdefault(f"RATE_LIMIT_{_bucket}_BURST", "100000")
+
+import httpx  # noqa: E402
+from custom.request import agenerate_image_by_text, generate_image_by_text  # noqa: E402
+from custom.singleflight import get_flight  # noqa: E402
+
+PROMPT = "红色骏马奔跑在雪地上，水墨风格"
+
+
+def upstream(kind, fn):
+    before = stub.counters()[kind]["requests"]
+    start = time.perf_counter()
+    results = fn()
+    return stub.counters()[kind]["requests"] - before, time.perf_counter() - start, results
+
+
+def threads(use_cache=True):
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        return list(pool.map(lambda _: generate_image_by_text(PROMPT, use_cache=use_cache), range(CONCURRENCY)))
+
+
+async def tasks():
+    return await asyncio.gather(*(agenerate_image_by_text(PROMPT) for _ in range(CONCURRENCY)))
+
+
+async def mixed():
+    # 一半在线程中同步调用，一半在事件循环中异步调用
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        sync_calls = [loop.run_in_executor(pool, generate_image_by_text, PROMPT) for _ in range(CONCURRENCY // 2)]
+        async_calls = [agenerate_image_by_text(PROMPT) for _ in range(CONCURRENCY - CONCURRENCY // 2)]
+        return await asyncio.gather(*sync_calls, *async_calls)
+
+
+async def invoices():
+    import app
+    invoice = {"text": "本次差旅住宿费用合计捌佰陆拾元整"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench",
+                                 timeout=300) as client:
+        response = await client.post("/submit/batch", json={"invoices": [invoice] * CONCURRENCY,
+                                                            "concurrency": CONCURRENCY})
+        lines = [json.loads(line) for line in response.text.splitlines() if line]
+    return lines[:-1]
+
+
+def report(name, calls, elapsed, results):
+    same = len({json.dumps(result, sort_keys=True, ensure_ascii=False) for result in results}) == 1
+    print(f"{name:<14} {CONCURRENCY:>4} {calls:>10} {elapsed:>8.2f}s {'是' if same else '否':>8}")
+
+
+if __name__ == "__main__":
+    print(f"{'场景':<14} {'请求数':>4} {'上游调用':>8} {'耗时':>9} {'结果一致':>6}")
+    report("同步（不合并）", *upstream("image", lambda: threads(use_cache=False)))
+    report("同步线程", *upstream("image", threads))
+    report("异步", *upstream("image", lambda: asyncio.run(tasks())))
+    report("同步+异步混合", *upstream("image", lambda: asyncio.run(mixed())))
+    calls, elapsed, items = upstream("chat", lambda: asyncio.run(invoices()))
+    report("相同发票", calls, elapsed, [item["amount"] for item in items])
+    for name in ("image", "invoice"):
+        print(f"{name}: {get_flight(name).stats()}")
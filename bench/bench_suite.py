@@ -0,0 +1,339 @@
+# 离线端到端压测：本地桩服务（bench/model_stub.py）替代 DashScope 的对话和生图接口，
+# 覆盖三个图（agent.graph / hourseAgent / imageAgent）和三个 FastAPI 应用的全部业务接口。
+# 每个场景在独立的子进程中运行（模块级配置、连接池、峰值内存互不影响），并发数逐级增加，
+# 输出 p50/p95/p99 延迟、吞吐、错误数和峰值 RSS，结果写入 JSON 便于与历史结果对比
+# 运行：python -m bench.bench_suite
+# 常用环境变量：
+#   BENCH_SCENARIOS       逗号分隔的场景名，默认全部
+#   BENCH_CONCURRENCY     并发等级，默认 1,4,16
+#   BENCH_REQUESTS        每个并发等级的请求数，默认 20
+#   BENCH_CHAT_LATENCY    对话接口延迟分布，默认 lognormal:0.05:0.5（格式见 model_stub.Latency）
+#   BENCH_IMAGE_LATENCY   生图接口延迟分布，默认 lognormal:0.2:0.4
+#   BENCH_CHAT_ERROR_RATE / BENCH_IMAGE_ERROR_RATE  注入错误的比例，默认 0
+#   BENCH_REVIEW_PASS_RATE 评审通过比例，默认 0.5
+#   BENCH_OUTPUT          结果文件，默认 bench-results.json
+#   BENCH_COMPARE         与之对比的历史结果文件
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+SCENARIOS = [
+    "graph_expense", "graph_hourse", "graph_image",
+    "http_expense", "http_expense_batch", "http_hourse_jobs", "http_hourse_stream", "http_image_stream",
+]
+INVOICE = "酒店住宿两晚，每晚 430 元"  # 避开规则快速提取，且超标需要审批
+BATCH_SIZE = int(os.getenv("BENCH_BATCH_SIZE", "8"))
+JOB_POLL_INTERVAL = 0.02
+
+
+# -------------------------- 场景（在子进程中运行） --------------------------
+
+async def graph_expense(ctx):
+    from langgraph.types import Command
+    from agent.graph import get_app_graph
+    graph = get_app_graph()
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    result = await graph.ainvoke({"invoice_text": INVOICE}, config=config)
+    if result.get("waiting_human"):
+        await graph.ainvoke(Command(resume=True), config=config)
+
+
+async def graph_hourse(ctx):
+    from langgraph.types import Command
+    from langchain_core.messages import HumanMessage
+    from hourseAgent import get_agent
+    agent = get_agent()
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    await agent.ainvoke({"messages": [HumanMessage(content="马年全家福")]}, config=config)
+    result = await agent.ainvoke(Command(resume="水墨"), config=config)
+    if not result.get("final_image"):
+        raise RuntimeError("没有生成最终图片")
+
+
+async def graph_image(ctx):
+    from imageAgent import get_app
+    await get_app().ainvoke({
+        "user_input": "一只可爱的橘猫坐在窗台上，阳光洒在它身上",
+        "current_prompt": "", "image_data": "", "feedback": "",
+        "score": 0, "is_passed": False, "iteration_count": 0, "history": [],
+    })
+
+
+async def _post(client, path, payload):
+    response = await client.post(path, json=payload)
+    response.raise_for_status()
+    return response
+
+
+async def http_expense(ctx):
+    client = ctx["expense"]
+    submitted = (await _post(client, "/submit", {"text": INVOICE})).json()
+    if submitted["status"] == "need_approval":
+        await _post(client, "/approve", {"task_id": submitted["task_id"], "approved": True})
+
+
+async def http_expense_batch(ctx):
+    response = await _post(ctx["expense"], "/submit/batch", {"invoices": [{"text": INVOICE}] * BATCH_SIZE})
+    summary = json.loads(response.text.strip().splitlines()[-1])["summary"]
+    if summary["failed"]:
+        raise RuntimeError(f"批量提交失败 {summary['failed']} 张")
+
+
+async def _wait_job(client, job_id):
+    while True:
+        info = (await client.get(f"/jobs/{job_id}")).json()
+        if info["status"] in ("done", "failed"):
+            if info["status"] == "failed":
+                raise RuntimeError(info.get("error"))
+            return info["result"]
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+async def http_hourse_jobs(ctx):
+    client = ctx["hourse"]
+    submitted = (await _post(client, "/submit", {"prompt": "马年全家福"})).json()
+    await _wait_job(client, submitted["job_id"])
+    selected = (await _post(client, "/select-style", {"task_id": submitted["task_id"], "selected_style": "水墨"})).json()
+    result = await _wait_job(client, selected["job_id"])
+    if result["status"] != "completed":
+        raise RuntimeError("没有生成最终图片")
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        events.append((lines.get("event"), json.loads(lines.get("data", "null"))))
+    return events
+
+
+async def http_hourse_stream(ctx):
+    client = ctx["hourse"]
+    events = _sse_events((await _post(client, "/submit/stream", {"prompt": "马年全家福"})).text)
+    task_id = events[0][1]["task_id"]
+    events = _sse_events((await _post(client, "/select-style/stream", {"task_id": task_id, "selected_style": "水墨"})).text)
+    if not any(name == "image_generate" and data.get("final_image") for name, data in events):
+        raise RuntimeError("没有生成最终图片")
+
+
+async def http_image_stream(ctx):
+    events = _sse_events((await _post(ctx["image"], "/generate/stream", {"user_input": "一只可爱的橘猫"})).text)
+    if events[-1][0] != "end":
+        raise RuntimeError(f"生成中断：{events[-1]}")
+
+
+async def _asgi_client(app):
+    import httpx
+    # 应用内的 startup 钩子（checkpoint 清理、风格池预热、编译图）
+    for handler in app.router.on_startup:
+        await handler()
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300)
+
+
+async def _context(name):
+    ctx = {}
+    if name.startswith("http_expense"):
+        import app
+        ctx["expense"] = await _asgi_client(app.app)
+    elif name.startswith("http_hourse"):
+        import hourseApp
+        ctx["hourse"] = await _asgi_client(hourseApp.app)
+    elif name.startswith("http_image"):
+        import imageApp
+        ctx["image"] = await _asgi_client(imageApp.app)
+    return ctx
+
+
+# -------------------------- 子进程：逐级并发测量 --------------------------
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _peak_rss_mb():
+    # Linux 上 ru_maxrss 单位为 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def _run_level(run_once, ctx, concurrency, requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run_once(ctx)
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3) if elapsed > 0 else None,
+        "mean": round(sum(ordered) / len(ordered), 4) if ordered else None,
+        "p50": _percentile(ordered, 0.5),
+        "p95": _percentile(ordered, 0.95),
+        "p99": _percentile(ordered, 0.99),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+async def _child(name, levels, requests):
+    run_once = globals()[name]
+    ctx = await _context(name)
+    # 预热：编译图、建立连接池，不计入结果
+    await run_once(ctx)
+    results = [await _run_level(run_once, ctx, concurrency, requests) for concurrency in levels]
+    for client in ctx.values():
+        await client.aclose()
+    return results
+
+
+def child_main():
+    name = os.environ["BENCH_CHILD_SCENARIO"]
+    levels = [int(c) for c in os.environ["BENCH_CONCURRENCY"].split(",")]
+    requests = int(os.environ["BENCH_REQUESTS"])
+    # 节点里的 print 很多，子进程只输出结果文件
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(_child(name, levels, requests))
+    with open(os.environ["BENCH_CHILD_OUTPUT"], "w", encoding="utf-8") as f:
+        json.dump({"levels": results, "peak_rss_mb": _peak_rss_mb()}, f)
+
+
+# -------------------------- 主进程：启动桩服务、汇总结果 --------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _fmt(seconds):
+    return f"{seconds * 1000:8.0f}ms" if seconds is not None else f"{'-':>10}"
+
+
+def _compare(results, path):
+    with open(path, encoding="utf-8") as f:
+        previous = json.load(f)["scenarios"]
+    print(f"\n与 {path} 对比（正数表示变慢/吞吐下降）")
+    for name, scenario in results.items():
+        old_levels = {level["concurrency"]: level for level in previous.get(name, {}).get("levels", [])}
+        for level in scenario.get("levels", []):
+            old = old_levels.get(level["concurrency"])
+            if not old or not old["p95"] or not level["p95"] or not old["throughput"] or not level["throughput"]:
+                continue
+            p95 = (level["p95"] - old["p95"]) / old["p95"]
+            throughput = (old["throughput"] - level["throughput"]) / old["throughput"]
+            print(f"{name:<20} c={level['concurrency']:<3} p95 {p95:+7.1%}  吞吐 {throughput:+7.1%}")
+
+
+def main():
+    from bench.model_stub import ModelStub, Route
+
+    scenarios = [s for s in os.getenv("BENCH_SCENARIOS", ",".join(SCENARIOS)).split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"未知场景：{', '.join(sorted(unknown))}，可选：{', '.join(SCENARIOS)}")
+    levels = os.getenv("BENCH_CONCURRENCY", "1,4,16")
+    requests = os.getenv("BENCH_REQUESTS", "20")
+    stub = ModelStub(
+        chat=Route(os.getenv("BENCH_CHAT_LATENCY", "lognormal:0.05:0.5"), float(os.getenv("BENCH_CHAT_ERROR_RATE", "0"))),
+        image=Route(os.getenv("BENCH_IMAGE_LATENCY", "lognormal:0.2:0.4"), float(os.getenv("BENCH_IMAGE_ERROR_RATE", "0"))),
+        review_pass_rate=float(os.getenv("BENCH_REVIEW_PASS_RATE", "0.5")),
+    ).start()
+
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    env = dict(os.environ)
+    env.update({
+        "DASHSCOPE_API_KEY": "bench",
+        "DASHSCOPE_BASE_URL": stub.chat_base_url,
+        "DASHSCOPE_GENERATE_URL": stub.generate_url,
+        "RATE_LIMIT_DIR": os.path.join(workdir, "ratelimit"),
+        "BENCH_CONCURRENCY": levels,
+        "BENCH_REQUESTS": requests,
+    })
+    # 默认不让限流成为瓶颈，需要时可通过环境变量覆盖
+    for bucket in ("LLM", "VL", "IMAGE"):
+        env.setdefault(f"RATE_LIMIT_{bucket}_QPS", "100000")
+        env.setdefault(f"RATE_LIMIT_{bucket}_BURST", "100000")
+    # 生图缓存和马图库默认关闭，保证每次请求都真正打到桩服务；开启时每个场景使用独立的缓存目录
+    env.setdefault("IMAGE_CACHE_ENABLED", "false")
+    env.setdefault("HOURSE_LIBRARY_VARIANTS", "0")
+
+    results = {}
+    print(f"{'场景':<20} {'并发':>4} {'p50':>10} {'p95':>10} {'p99':>10} {'吞吐(次/s)':>11} {'错误':>5} {'峰值RSS':>9}")
+    for name in scenarios:
+        output = os.path.join(workdir, f"{name}.json")
+        before = stub.counters()
+        proc = subprocess.run(
+            [sys.executable, "-m", "bench.bench_suite"],
+            env={**env, "BENCH_CHILD_SCENARIO": name, "BENCH_CHILD_OUTPUT": output,
+                 "CHECKPOINT_DB": os.path.join(workdir, f"{name}.sqlite"),
+                 "IMAGE_CACHE_DIR": os.path.join(workdir, f"{name}-image-cache"),
+                 "ARTIFACT_DIR": os.path.join(workdir, f"{name}-artifacts")},
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+            results[name] = {"error": error}
+            print(f"{name:<20} 运行失败：{error}")
+            continue
+        with open(output, encoding="utf-8") as f:
+            results[name] = json.load(f)
+        after = stub.counters()
+        results[name]["stub_requests"] = {
+            route: after[route]["requests"] - before[route]["requests"] for route in after
+        }
+        for level in results[name]["levels"]:
+            print(f"{name:<20} {level['concurrency']:>4} {_fmt(level['p50'])} {_fmt(level['p95'])} {_fmt(level['p99'])} "
+                  f"{level['throughput'] or 0:>11.2f} {level['errors']:>5} {level['peak_rss_mb']:>7.1f}MB")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": [int(c) for c in levels.split(",")],
+            "requests_per_level": int(requests),
+            "stub": {"chat": stub.chat.config(), "image": stub.image.config(),
+                     "review_pass_rate": stub.review_pass_rate},
+        },
+        "scenarios": results,
+    }
+    output = os.getenv("BENCH_OUTPUT", "bench-results.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {output}")
+    if os.getenv("BENCH_COMPARE"):
+        _compare(results, os.environ["BENCH_COMPARE"])
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    if os.getenv("BENCH_CHILD_SCENARIO"):
+        child_main()
+    else:
+        main()
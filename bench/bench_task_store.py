@@ -0,0 +1,96 @@
+# 任务存储基准：向 SQLite 任务表写入大量任务（约 1/5 待审批），测量
+# 按 id 查询、待审批列表第一页、keyset 翻到末尾附近的一页，与同位置 OFFSET 分页的耗时对比，
+# 并用多个进程同时写入、交叉读取，确认一个 worker 写入的任务其他 worker 立即可见
+# 运行：python -m bench.bench_task_store
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import uuid
+from custom.checkpoint import connect
+from custom.task_store import STATUS_DONE, STATUS_NEED_APPROVAL, SqliteTaskStore, encode_cursor
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000000"))
+PAGE = int(os.getenv("BENCH_PAGE", "50"))
+WORKERS = int(os.getenv("BENCH_WORKERS", "4"))
+WRITES_PER_WORKER = int(os.getenv("BENCH_WRITES", "500"))
+
+
+def fill(store, rows):
+    now = time.time() - rows
+    batch = []
+    for i in range(rows):
+        status = STATUS_NEED_APPROVAL if i % 5 == 0 else STATUS_DONE
+        batch.append((uuid.uuid4().hex, status, random.uniform(100, 5000), None, None, now + i, now + i))
+        if len(batch) == 50000:
+            store.conn.executemany("INSERT INTO expense_tasks VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    store.conn.executemany("INSERT INTO expense_tasks VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+    store.conn.commit()
+
+
+def timed(fn, rounds=20):
+    fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+def writer(path, worker, ids):
+    store = SqliteTaskStore(connect(path))
+    for i in range(WRITES_PER_WORKER):
+        task_id = f"w{worker}-{i}"
+        store.put(task_id, STATUS_NEED_APPROVAL, amount=800)
+        ids.append(task_id)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "tasks.sqlite")
+        store = SqliteTaskStore(connect(path))
+        start = time.perf_counter()
+        fill(store, ROWS)
+        print(f"写入 {ROWS} 条任务：{time.perf_counter() - start:.1f}s")
+
+        pending = ROWS // 5
+        deep = store.conn.execute(
+            "SELECT created_at, task_id FROM expense_tasks WHERE status = ? ORDER BY created_at, task_id "
+            "LIMIT 1 OFFSET ?", (STATUS_NEED_APPROVAL, pending - PAGE * 2),
+        ).fetchone()
+        cursor = encode_cursor(*deep)
+        some_id = deep[1]
+
+        plan = store.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT task_id FROM expense_tasks WHERE status = ? AND (created_at, task_id) > (?, ?) "
+            "ORDER BY created_at, task_id LIMIT ?", (STATUS_NEED_APPROVAL, *deep, PAGE),
+        ).fetchall()
+        print("keyset 查询计划：" + "; ".join(row[-1] for row in plan))
+
+        offset_sql = ("SELECT task_id, status, amount, approved, created_at, updated_at FROM expense_tasks "
+                      "WHERE status = ? ORDER BY created_at, task_id LIMIT ? OFFSET ?")
+        results = {
+            "按 id 查询": timed(lambda: store.get(some_id)),
+            "待审批第一页": timed(lambda: store.list(STATUS_NEED_APPROVAL, PAGE)),
+            "待审批末尾页（keyset）": timed(lambda: store.list(STATUS_NEED_APPROVAL, PAGE, cursor)),
+            "待审批末尾页（OFFSET）": timed(
+                lambda: store.conn.execute(offset_sql, (STATUS_NEED_APPROVAL, PAGE, pending - PAGE)).fetchall(), 5),
+            "全部任务末尾页（keyset）": timed(lambda: store.list(None, PAGE, cursor)),
+        }
+        for name, seconds in results.items():
+            print(f"{name:<16} {seconds * 1000:>8.3f}ms")
+
+        with multiprocessing.Manager() as manager:
+            ids = manager.list()
+            start = time.perf_counter()
+            procs = [multiprocessing.Process(target=writer, args=(path, w, ids)) for w in range(WORKERS)]
+            for proc in procs:
+                proc.start()
+            for proc in procs:
+                proc.join()
+            elapsed = time.perf_counter() - start
+            missing = [task_id for task_id in ids if store.get(task_id) is None]
+            total = WORKERS * WRITES_PER_WORKER
+            print(f"{WORKERS} 个进程并发写入 {total} 条：{total / elapsed:.0f} 条/s，"
+                  f"写入数 {len(ids)}，主进程读不到 {len(missing)} 条")
@@ -0,0 +1,96 @@
+# 本地 DashScope 生图接口桩服务，用于离线压测（不产生真实计费）
+# 支持故障注入：按比例返回错误状态码、按比例慢响应、整体宕机
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才支持 keep-alive 连接复用
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        # 每个 handler 实例对应一条 TCP 连接
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.down:
+            with server.lock:
+                server.errors += 1
+            self._reply(503, {"code": "ServiceUnavailable", "message": "stub is down"})
+            return
+        if random.random() < server.slow_rate:
+            time.sleep(server.slow_latency)
+        elif server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            self._reply(server.error_status, {"code": "InjectedError", "message": "injected by stub"})
+            return
+        self._reply(200, {
+            "output": {
+                "choices": [{
+                    "message": {"content": [{"type": "image", "image": "http://stub.local/image.png"}]}
+                }]
+            }
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DashScopeStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, error_status=503,
+                 slow_rate=0.0, slow_latency=0.0):
+        """
+        :param latency: 正常响应耗时（秒）
+        :param error_rate: 返回 error_status 的比例
+        :param slow_rate: 慢响应比例，慢响应耗时为 slow_latency
+        """
+        super().__init__((host, port), _StubHandler)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.down = False
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1/services/aigc/multimodal-generation/generation"
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.errors = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,221 @@
+# 本地模型桩服务：同时提供 OpenAI 兼容的对话接口和 DashScope 生图接口，用于离线端到端压测（不产生真实计费）
+# 对话接口按请求内容返回各个图需要的格式：金额数字、评审 JSON、结构化输出、普通文本
+# 延迟分布格式：fixed:秒 / uniform:最小:最大 / lognormal:中位数:sigma
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_PATH = "/v1/chat/completions"
+GENERATE_PATH = "/api/v1/services/aigc/multimodal-generation/generation"
+
+
+class Latency:
+    def __init__(self, spec="fixed:0"):
+        """
+        :param spec: fixed:0.2、uniform:0.1:0.5 或 lognormal:0.3:0.5
+        """
+        kind, *params = spec.split(":")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"未知的延迟分布：{spec}")
+
+    def sample(self):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(*self.params)
+        median, sigma = self.params
+        return random.lognormvariate(math.log(median), sigma)
+
+
+class Route:
+    """单个接口的延迟与故障注入配置，以及计数"""
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, error_status=503):
+        self.latency = Latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+
+    def config(self):
+        return {"latency": self.latency.spec, "error_rate": self.error_rate, "error_status": self.error_status}
+
+
+def _fill_schema(schema, defs=None):
+    # 按 JSON Schema 生成一个合法的实例（用于结构化输出）
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return _fill_schema(defs[schema["$ref"].split("/")[-1]], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fill_schema(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = schema.get("minItems", 1)
+        return [f"风格{i + 1}" if schema.get("items", {}).get("type") == "string" else _fill_schema(schema["items"], defs)
+                for i in range(count)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    return "桩服务返回的文本"
+
+
+def _message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    return "\n".join(parts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fault(self, route):
+        """计数、按配置延迟，需要注入错误时返回True"""
+        server = self.server
+        with server.lock:
+            route.requests += 1
+        time.sleep(route.latency.sample())
+        if random.random() < route.error_rate:
+            with server.lock:
+                route.errors += 1
+            self._reply(route.error_status, {"code": "InjectedError", "message": "injected by stub"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path.startswith("/images/"):
+            self._reply(200, self.server.png, "image/png")
+        else:
+            self._reply(404, {"message": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith(CHAT_PATH):
+            if not self._fault(self.server.chat):
+                self._reply(200, self._chat_completion(body))
+        elif self.path == GENERATE_PATH:
+            if not self._fault(self.server.image):
+                image = f"{self.server.base_url}/images/{uuid.uuid4().hex}.png"
+                self._reply(200, {"output": {"choices": [{"message": {"content": [{"type": "image", "image": image}]}}]}})
+        else:
+            self._reply(404, {"message": "not found"})
+
+    def _chat_completion(self, body):
+        text = _message_text(body.get("messages", []))
+        message = {"role": "assistant", "content": None}
+        response_format = body.get("response_format") or {}
+        if body.get("tools"):
+            function = body["tools"][0]["function"]
+            arguments = _fill_schema(function.get("parameters", {}))
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)},
+            }]
+        elif response_format.get("type") == "json_schema":
+            message["content"] = json.dumps(_fill_schema(response_format["json_schema"]["schema"]), ensure_ascii=False)
+        elif "艺术总监" in text:
+            passed = random.random() < self.server.review_pass_rate
+            message["content"] = json.dumps({
+                "score": random.randint(80, 95) if passed else random.randint(40, 75),
+                "is_passed": passed,
+                "feedback": "构图稍显拥挤，请增加留白",
+            }, ensure_ascii=False)
+        elif "只返回数字" in text:
+            message["content"] = str(self.server.invoice_amount)
+        else:
+            message["content"] = "电影画质，柔和的侧逆光，浅景深，细节丰富"
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                         "message": message}],
+            "usage": {"prompt_tokens": len(text), "completion_tokens": 20, "total_tokens": len(text) + 20},
+        }
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _tiny_png():
+    try:
+        from PIL import Image
+    except ImportError:
+        # 1×1 透明 PNG
+        return bytes.fromhex(
+            "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+            "1f15c4890000000d49444154789c6300010000000500010d0a2db40000000049454e44ae426082"
+        )
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), (200, 160, 90)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ModelStub(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, host="127.0.0.1", port=0, chat=None, image=None, review_pass_rate=0.5, invoice_amount=860):
+        """
+        :param chat: 对话接口的 Route 配置
+        :param image: 生图接口的 Route 配置
+        :param review_pass_rate: 评审请求返回通过的比例
+        :param invoice_amount: 金额提取请求返回的金额
+        """
+        super().__init__((host, port), _Handler)
+        self.lock = threading.Lock()
+        self.chat = chat or Route()
+        self.image = image or Route()
+        self.review_pass_rate = review_pass_rate
+        self.invoice_amount = invoice_amount
+        self.png = _tiny_png()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def chat_base_url(self):
+        return f"{self.base_url}/v1"
+
+    @property
+    def generate_url(self):
+        return f"{self.base_url}{GENERATE_PATH}"
+
+    def counters(self):
+        with self.lock:
+            return {
+                "chat": {"requests": self.chat.requests, "errors": self.chat.errors},
+                "image": {"requests": self.image.requests, "errors": self.image.errors},
+            }
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -2,45 +2,41 @@
 # AI 报销助手（LangChain LCEL 版）
 # ==============================
 
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.chat_history import InMemoryChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from custom.amount_extractor import extract_confident_amount, parse_amount
+from custom.session_store import SessionStore
+from custom.llm_registry import get_llm, load_env, once
+load_env()
 
 # 🔹 1. 初始化 LLM（可替换为 Qwen OpenAI 兼容接口）
 # llm = ChatOpenAI(model="gpt-4o", temperature=0)
-llm = ChatOpenAI(
-    model="qwen3-max-2026-01-23",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+# 客户端在第一次构建链时从注册表获取（与其他模块共享），多进程共享 DashScope 配额
+LLM_MODEL = "qwen3-max-2026-01-23"
 
 # 🔹 2. 多轮会话存储（支持多用户）
-store = {}
+# 会话数超限时淘汰最久未用的会话，每个会话只保留最近的消息窗口，避免内存和 prompt 无限增长
+store = SessionStore()
 
 def get_session_history(session_id: str):
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
+    return store.get(session_id)
 
 # 🔹 3. 发票金额解析 Prompt
 invoice_prompt = ChatPromptTemplate.from_template(
     "从下面发票文本中提取总金额，只返回数字：\n{text}"
 )
 
-# LCEL 链
-parse_invoice_chain = invoice_prompt | llm | StrOutputParser()
-
-# 让链支持“记忆”
-parse_invoice_chain = RunnableWithMessageHistory(
-    parse_invoice_chain,
-    get_session_history,
-    input_messages_key="text",
-)
+# LCEL 链（第一次使用时构建）
+@once
+def get_parse_invoice_chain():
+    chain = invoice_prompt | get_llm(LLM_MODEL, limiter="llm") | StrOutputParser()
+    # 让链支持“记忆”
+    return RunnableWithMessageHistory(
+        chain,
+        get_session_history,
+        input_messages_key="text",
+    )
 
 # 🔹 4. 报销规则
 LIMIT = 500
@@ -58,19 +54,24 @@ def human_review(amount):
 def expense_assistant(invoice_text: str, session_id="user1"):
     print("\n🧾 用户上传发票...")
     
-    # AI 解析金额（带会话记忆）
-    amount_str = parse_invoice_chain.invoke(
-        {"text": invoice_text},
-        config={"configurable": {"session_id": session_id}}
-    )
-
-    try:
-        amount = float(amount_str.strip())
-    except:
-        print("❌ AI 金额解析失败")
-        return "报销失败"
-
-    print(f"🤖 AI 识别金额：{amount}")
+    # 规则快速提取，命中时不调用 LLM
+    amount = extract_confident_amount(invoice_text)
+    if amount is not None:
+        print(f"⚡ 规则识别金额：{amount}")
+    else:
+        # AI 解析金额（带会话记忆）
+        amount_str = get_parse_invoice_chain().invoke(
+            {"text": invoice_text},
+            config={"configurable": {"session_id": session_id}}
+        )
+
+        try:
+            amount = parse_amount(amount_str)
+        except ValueError:
+            print("❌ AI 金额解析失败")
+            return "报销失败"
+
+        print(f"🤖 AI 识别金额：{amount}")
 
     # 规则判断
     if policy_check(amount):
@@ -0,0 +1,121 @@
+# 发票总金额的规则提取：命中常见写法时直接返回，不确定时才交给 LLM
+import os
+import re
+import unicodedata
+from typing import NamedTuple, Optional
+
+# 置信度不低于该值时直接采用规则结果，跳过 LLM
+CONFIDENCE_THRESHOLD = float(os.getenv("AMOUNT_CONFIDENCE_THRESHOLD", "0.8"))
+
+# 金额数字：支持负号、千分位和小数；负号前不能是字母或数字（避免把日期 2024-03-05 中的 -03 当作负数），
+# 数字后面不能紧跟数字（回溯时不会只取前几位）
+_NUMBER = r"(?P<num>(?:(?<![0-9A-Za-z.])[-−])?(?:\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?))(?!\d|[.,]\d)"
+_CURRENCY = r"(?:¥|RMB|CNY|\$|USD)"
+_UNIT = r"(?:元|圆|块|RMB|CNY|yuan)"
+# 紧跟在数字后面时说明这是数量而不是金额（“总计 3 晚”“共计 2 张”“Total: 3 items”）
+_QUANTITY = r"(?!\s*(?:晚|张|件|个|份|次|天|人|间|杯|本|小时|items?\b|pcs\b|nights?\b|units?\b))"
+# 出现在金额前面时说明这是单价而不是总额（“每晚 430 元”“单价 400 元”）
+_PER_UNIT = re.compile(r"(?:每\S{0,2}|单价|per\s+\w+|@)\s*[:=]?\s*$", re.IGNORECASE)
+# 表示“总额”的关键词，顺序即优先级
+_TOTAL_KEYWORDS = (
+    r"价税合计(?:\s*[（(]\s*小写\s*[)）])?",
+    r"(?:总计|合计|共计|总金额|总额|金额合计|应付金额|实付金额|实收金额|应收金额|应付|实付)",
+    r"\b(?:grand\s+total|total\s+amount|amount\s+due|total\s+due|total)\b",
+)
+
+# (规则名, 正则, 基础置信度, 是否要求带币种或单位)；置信度用整数百分比计算，避免 0.7 + 0.1 < 0.8 这样的浮点误差
+_KEYWORD_PATTERNS = [
+    re.compile(
+        rf"(?:{keyword})\s*[:=]?\s*(?P<cur>{_CURRENCY}\s*)?{_NUMBER}{_QUANTITY}\s*(?P<unit>{_UNIT})?",
+        re.IGNORECASE,
+    )
+    for keyword in _TOTAL_KEYWORDS
+]
+_RULES = [
+    (f"keyword_{idx}", pattern, 95 - idx * 2, True) for idx, pattern in enumerate(_KEYWORD_PATTERNS)
+] + [
+    ("currency", re.compile(rf"{_CURRENCY}\s*{_NUMBER}{_QUANTITY}", re.IGNORECASE), 75, False),
+    ("unit", re.compile(rf"{_NUMBER}\s*{_UNIT}", re.IGNORECASE), 70, False),
+] + [
+    # 关键词后面是不带币种/单位的数字：可能是数量，只作为候选交给 LLM 确认
+    (f"keyword_bare_{idx}", pattern, 60, False) for idx, pattern in enumerate(_KEYWORD_PATTERNS)
+]
+_ANY_NUMBER = re.compile(_NUMBER)
+
+
+class AmountMatch(NamedTuple):
+    amount: float
+    confidence: float
+    rule: str
+
+
+def normalize(text: str) -> str:
+    """全角转半角（全角数字、￥、：、，等），统一空白"""
+    return unicodedata.normalize("NFKC", text)
+
+
+def _to_float(num: str) -> float:
+    return float(num.replace(",", "").replace("−", "-"))
+
+
+def _amounts(pattern, text, money):
+    # 跳过单价（前面是“每晚”“单价”等）；money 为 True 时只取带币种或单位的金额
+    return [
+        _to_float(m.group("num")) for m in pattern.finditer(text)
+        if not (money and not (m.group("cur") or m.group("unit")))
+        and not _PER_UNIT.search(text, max(0, m.start() - 12), m.start())
+    ]
+
+
+def extract_amount(text: str) -> Optional[AmountMatch]:
+    """
+    用规则提取发票总金额
+    :param text: 发票文本
+    :return: AmountMatch(amount, confidence, rule)，没有任何候选时返回None
+    """
+    text = normalize(text)
+    for rule, pattern, score, money in _RULES:
+        amounts = _amounts(pattern, text, money)
+        if not amounts:
+            continue
+        distinct = set(amounts)
+        if len(distinct) == 1:
+            if rule in ("currency", "unit") and len(_ANY_NUMBER.findall(text)) == 1:
+                # 全文只有这一个数字，且带有币种/单位
+                score += 10
+            return AmountMatch(amounts[0], score / 100, rule)
+        if rule.startswith("keyword"):
+            # 多个“合计”时通常最后一个是总额，但不够确定
+            return AmountMatch(amounts[-1], (score - 25) / 100, rule)
+        # 多个币种/单位金额且没有总额关键词，取最大值并降低置信度
+        return AmountMatch(max(distinct), (score - 30) / 100, rule)
+
+    numbers = [_to_float(m.group("num")) for m in _ANY_NUMBER.finditer(text)]
+    if len(numbers) == 1:
+        return AmountMatch(numbers[0], 0.5, "single_number")
+    if numbers:
+        return AmountMatch(max(numbers), 0.2, "max_number")
+    return None
+
+
+def extract_confident_amount(text: str, threshold: float = CONFIDENCE_THRESHOLD) -> Optional[float]:
+    """规则结果的置信度达到阈值时返回金额，否则返回None（交给 LLM）"""
+    match = extract_amount(text)
+    if match is not None and match.confidence >= threshold:
+        return match.amount
+    return None
+
+
+def parse_amount(reply: str) -> float:
+    """
+    解析 LLM 返回的金额，容忍“860元”“总计：860”等多余文字
+    :raises ValueError: 回复中没有数字
+    """
+    try:
+        return float(reply.strip())
+    except ValueError:
+        pass
+    match = extract_amount(reply)
+    if match is None:
+        raise ValueError(f"无法从模型回复中解析金额：{reply!r}")
+    return match.amount
@@ -0,0 +1,349 @@
+# 生成图片的本地持久化：DashScope 返回的图片 URL 会过期，生成后立即在后台分块下载到本地磁盘
+# （边下载边计算 sha256，不把整张图读进内存），按内容哈希命名去重，由应用以 /artifacts/{哈希}{扩展名} 提供下载
+# 生图缓存的图片文件、作为输入传给图片编辑接口的图片、评审前的下载都优先读本地文件
+# 文件总大小超过上限时按最近访问时间删除
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+ARTIFACT_ENABLED = os.getenv("ARTIFACT_ENABLED", "true").lower() == "true"
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", ".artifacts")
+# 对外的下载地址前缀，可配置为完整地址（如 https://example.com/artifacts）
+ARTIFACT_URL_PREFIX = os.getenv("ARTIFACT_URL_PREFIX", "/artifacts").rstrip("/")
+# 下载时每次写入磁盘的字节数
+ARTIFACT_CHUNK_SIZE = int(os.getenv("ARTIFACT_CHUNK_SIZE", str(64 * 1024)))
+# 磁盘上文件总字节数上限
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(4 * 1024 ** 3)))
+# 两次容量检查的最小间隔（秒），检查需要遍历目录
+ARTIFACT_EVICT_INTERVAL = float(os.getenv("ARTIFACT_EVICT_INTERVAL", "60"))
+# 后台下载的并发数
+ARTIFACT_WORKERS = int(os.getenv("ARTIFACT_WORKERS", "4"))
+# 进程内记住多少个 远程 URL -> 本地文件 的对应关系
+ARTIFACT_URL_ENTRIES = int(os.getenv("ARTIFACT_URL_ENTRIES", "4096"))
+ARTIFACT_FETCH_TIMEOUT = float(os.getenv("ARTIFACT_FETCH_TIMEOUT", "30"))
+
+EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+_NAME = re.compile(r"^([0-9a-f]{64})(\.png|\.jpg|\.jpeg|\.webp)$")
+
+
+def extension(url):
+    """图片地址的扩展名，无法识别时按 .png 处理"""
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext if ext in EXTENSIONS else ".png"
+
+
+def local_path(ref):
+    """file:// 地址对应的本地路径，其他地址返回 None"""
+    if ref.startswith("file://"):
+        return unquote(urlparse(ref).path)
+    return None
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACT_DIR, url_prefix=ARTIFACT_URL_PREFIX, chunk_size=ARTIFACT_CHUNK_SIZE,
+                 max_bytes=ARTIFACT_MAX_BYTES, evict_interval=ARTIFACT_EVICT_INTERVAL, workers=ARTIFACT_WORKERS,
+                 url_entries=ARTIFACT_URL_ENTRIES):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.workers = workers
+        self.url_entries = url_entries
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        self._lock = threading.Lock()
+        # 远程 URL -> (digest, ext)；正在下载的远程 URL -> Future
+        self._urls = OrderedDict()
+        self._inflight = {}
+        self._pool = None
+        self._session = None
+        self._last_evict = 0.0
+        self.saved = 0  # 新写入的文件数
+        self.deduped = 0  # 内容已存在、未重复写入的次数
+        self.bytes_written = 0
+        self.errors = 0
+        self.evictions = 0
+
+    def path(self, digest, ext):
+        return os.path.join(self.root, "blobs", digest[:2], digest + ext)
+
+    def url_for(self, digest, ext):
+        """对外的下载地址"""
+        return f"{self.url_prefix}/{digest}{ext}"
+
+    def find(self, name):
+        """
+        :param name: {哈希}{扩展名}
+        :return: (本地路径, 哈希)，名称不合法或文件不存在时返回 None
+        """
+        match = _NAME.match(name)
+        if not match:
+            return None
+        path = self.path(match.group(1), match.group(2))
+        if not os.path.exists(path):
+            return None
+        return path, match.group(1)
+
+    def touch(self, path):
+        # 更新访问时间，容量淘汰时最近访问的文件最后删除
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def save_stream(self, chunks, ext=".png"):
+        """
+        把分块的图片内容写入磁盘：先写临时文件并计算哈希，内容已存在时丢弃临时文件，否则原子改名
+        :param chunks: 字节块的可迭代对象
+        :return: (digest, ext, size)
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.root, "tmp", f"{os.getpid()}.{threading.get_ident()}.{time.time_ns()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        hasher.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            digest = hasher.hexdigest()
+            path = self.path(digest, ext)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                self.touch(path)
+                with self._lock:
+                    self.deduped += 1
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self.saved += 1
+                    self.bytes_written += size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._maybe_evict()
+        return digest, ext, size
+
+    def save_bytes(self, data, ext=".png"):
+        return self.save_stream([data], ext)
+
+    def _get_session(self):
+        # 图片在 OSS 等外部存储上，不能复用带 DashScope 鉴权头的会话
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=max(self.workers, 16))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def _download(self, url):
+        path = local_path(url)
+        if path:
+            with open(path, "rb") as f:
+                return self.save_stream(iter(lambda: f.read(self.chunk_size), b""), extension(url))
+        with self._get_session().get(url, timeout=ARTIFACT_FETCH_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            return self.save_stream(response.iter_content(self.chunk_size), extension(url))
+
+    def _remember(self, url, digest, ext):
+        # 在锁内调用
+        self._urls[url] = (digest, ext)
+        self._urls.move_to_end(url)
+        while len(self._urls) > self.url_entries:
+            self._urls.popitem(last=False)
+
+    def save_async(self, url):
+        """
+        在后台下载一张生成的图片；同一 URL 同时只下载一次，已下载过的直接返回
+        :return: Future，结果为 (digest, ext, size)，失败时为 None
+        """
+        with self._lock:
+            known = self._urls.get(url)
+            if known is not None and os.path.exists(self.path(*known)):
+                future = Future()
+                future.set_result((*known, os.path.getsize(self.path(*known))))
+                return future
+            future = self._inflight.get(url)
+            if future is not None:
+                return future
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="artifact-fetch")
+            future = self._inflight[url] = self._pool.submit(self._fetch, url)
+            return future
+
+    def _fetch(self, url):
+        try:
+            result = self._download(url)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"图片保存到本地失败：{e}")
+            result = None
+        with self._lock:
+            if result is not None:
+                self._remember(url, result[0], result[1])
+            self._inflight.pop(url, None)
+        return result
+
+    def save_url(self, url):
+        """
+        save_async 的阻塞版本
+        :return: (digest, ext, size)，失败返回 None
+        """
+        return self.save_async(url).result()
+
+    async def asave_url(self, url):
+        """save_url 的异步版本"""
+        return await asyncio.wrap_future(self.save_async(url))
+
+    def lookup(self, ref, wait=True):
+        """
+        图片地址对应的本地文件：本服务的下载地址、file:// 地址、已经（或正在）下载到本地的远程 URL
+        :param wait: 远程 URL 正在下载时是否等待下载完成
+        :return: 本地路径，没有本地文件时返回 None
+        """
+        if not ref:
+            return None
+        if ref.startswith(self.url_prefix + "/"):
+            found = self.find(ref[len(self.url_prefix) + 1:])
+            return found[0] if found else None
+        path = local_path(ref)
+        if path:
+            return path if os.path.exists(path) else None
+        with self._lock:
+            known = self._urls.get(ref)
+            future = self._inflight.get(ref)
+        if known is None and future is not None and wait:
+            result = future.result()
+            known = result[:2] if result else None
+        if known is None:
+            return None
+        path = self.path(*known)
+        return path if os.path.exists(path) else None
+
+    def artifact_url(self, ref):
+        """
+        生成结果的对外下载地址（需要时先下载到本地）
+        :return: 下载地址，下载失败时返回 None
+        """
+        if not ref or not ARTIFACT_ENABLED:
+            return None
+        if ref.startswith(self.url_prefix + "/"):
+            return ref
+        path = local_path(ref)
+        if path and os.path.dirname(os.path.dirname(path)) == os.path.join(self.root, "blobs"):
+            # 已经在本地存储中，文件名就是 {哈希}{扩展名}
+            return f"{self.url_prefix}/{os.path.basename(path)}"
+        result = self.save_url(ref)
+        return self.url_for(result[0], result[1]) if result else None
+
+    def _maybe_evict(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_evict < self.evict_interval:
+                return
+            self._last_evict = now
+        self.evict()
+
+    def evict(self):
+        """
+        文件总大小超过上限时，按最近访问（修改）时间从旧到新删除
+        :return: 删除的文件数
+        """
+        files = []
+        total = 0
+        for dirpath, _, names in os.walk(os.path.join(self.root, "blobs")):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "saved": self.saved,
+                "deduped": self.deduped,
+                "bytes_written": self.bytes_written,
+                "inflight": len(self._inflight),
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def media_type(path):
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def artifact_response(name, if_none_match=None):
+    """
+    下载接口的响应：文件名即内容哈希，ETag 固定、可永久缓存；支持 Range（断点续传）和 If-None-Match（304）
+    文件由 FileResponse 直接从磁盘发送，服务器支持 pathsend 扩展时零拷贝发送
+    :param name: {哈希}{扩展名}
+    :param if_none_match: 请求头 If-None-Match
+    """
+    from fastapi import HTTPException
+    from fastapi.responses import FileResponse, Response
+
+    store = get_artifact_store()
+    found = store.find(name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="artifact not found")
+    path, digest = found
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]):
+        return Response(status_code=304, headers=headers)
+    store.touch(path)
+    return FileResponse(path, media_type=media_type(path), headers=headers)
+
+
+_artifact_store = None
+_artifact_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """
+    获取进程内共享的本地图片存储（首次使用时创建目录）
+    :return: ArtifactStore
+    """
+    global _artifact_store
+    if _artifact_store is None:
+        with _artifact_store_lock:
+            if _artifact_store is None:
+                _artifact_store = ArtifactStore()
+    return _artifact_store
@@ -0,0 +1,125 @@
+# 基于 SQLite（WAL 模式）的持久化 checkpointer，支持多 worker 进程共享与按 TTL 清理
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# checkpoint 数据库文件，多个 uvicorn worker 指向同一个文件即可互相恢复任务
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+# 已结束的 thread 保留时长（秒）
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", str(24 * 3600)))
+# 未结束但长时间无更新的 thread（例如用户一直没有选择风格）保留时长（秒）
+CHECKPOINT_IDLE_TTL = int(os.getenv("CHECKPOINT_IDLE_TTL", str(7 * 24 * 3600)))
+# 后台清理间隔（秒）
+CHECKPOINT_GC_INTERVAL = int(os.getenv("CHECKPOINT_GC_INTERVAL", "600"))
+
+
+def connect(path=CHECKPOINT_DB):
+    """打开 WAL 模式的 SQLite 连接（允许多进程并发读写）"""
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+class ExpiringSqliteSaver(SqliteSaver):
+    """
+    记录每个 thread 的最后活跃时间，按 TTL 删除过期 thread 的全部 checkpoint
+    异步接口在线程中调用同步实现，invoke 与 ainvoke 都可以使用
+    """
+
+    def __init__(self, conn, ttl=CHECKPOINT_TTL, idle_ttl=CHECKPOINT_IDLE_TTL):
+        super().__init__(conn)
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self._gc_thread = None
+        with self.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity ("
+                "thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, finished INTEGER NOT NULL DEFAULT 0)"
+            )
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_thread_activity_updated ON thread_activity (finished, updated_at)"
+            )
+
+    def _touch(self, thread_id, finished=0):
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, updated_at, finished) VALUES (?, ?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at, finished = excluded.finished",
+                (str(thread_id), time.time(), finished),
+            )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config["configurable"]["thread_id"])
+        return next_config
+
+    def mark_finished(self, thread_id):
+        """任务结束后调用，thread 将在 ttl 后被清理"""
+        self._touch(thread_id, finished=1)
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def gc(self, now=None):
+        """
+        删除过期的 thread
+        :return: 删除的 thread 数量
+        """
+        now = now or time.time()
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT thread_id FROM thread_activity "
+                "WHERE (finished = 1 AND updated_at < ?) OR updated_at < ?",
+                (now - self.ttl, now - self.idle_ttl),
+            )
+            expired = [row[0] for row in cur.fetchall()]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return len(expired)
+
+    def start_gc(self, interval=CHECKPOINT_GC_INTERVAL):
+        """启动后台清理线程（重复调用无副作用）"""
+        if self._gc_thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    removed = self.gc()
+                    if removed:
+                        print(f"checkpoint 清理：删除 {removed} 个过期 thread")
+                except sqlite3.Error as e:
+                    print(f"checkpoint 清理异常：{e}")
+
+        self._gc_thread = threading.Thread(target=loop, name="checkpoint-gc", daemon=True)
+        self._gc_thread.start()
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def make_checkpointer(path=CHECKPOINT_DB):
+    """创建持久化 checkpointer"""
+    return ExpiringSqliteSaver(connect(path))
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+import os
+from custom.artifact_store import ARTIFACT_ENABLED, get_artifact_store
+from custom.image_cache import cache_active, fresh_requested, get_image_cache, inline_local_images
+from custom.llm_registry import load_env
+from custom.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from custom.rate_limit import get_limiter
+from custom.singleflight import get_flight
+load_env()
+
+# -------------------------- 全局配置（只需配置一次） --------------------------
+DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY", None)
+# 生图接口固定地址（可通过环境变量指向本地桩服务做压测）
+GENERATE_URL = os.getenv(
+    "DASHSCOPE_GENERATE_URL",
+    "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
+)
+# 连接池配置：POOL_CONNECTIONS 为缓存的主机连接池个数，POOL_MAXSIZE 为单个主机的最大连接数
+POOL_CONNECTIONS = int(os.getenv("DASHSCOPE_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("DASHSCOPE_POOL_MAXSIZE", "32"))
+# 单主机连接数达到上限时是否阻塞等待（True 时严格限制每个主机的并发连接数）
+POOL_BLOCK = os.getenv("DASHSCOPE_POOL_BLOCK", "true").lower() == "true"
+# 生图接口耗时较长，保留60秒超时
+DEFAULT_TIMEOUT = 60
+# 容错配置：最多尝试次数、退避基数/上限（秒）、是否对冲及对冲延迟（秒，不设置时取最近耗时 p95）、熔断阈值/恢复时间（秒）
+MAX_ATTEMPTS = int(os.getenv("DASHSCOPE_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("DASHSCOPE_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("DASHSCOPE_BACKOFF_MAX", "8"))
+HEDGE = os.getenv("DASHSCOPE_HEDGE", "false").lower() == "true"
+HEDGE_DELAY = float(os.environ["DASHSCOPE_HEDGE_DELAY"]) if os.getenv("DASHSCOPE_HEDGE_DELAY") else None
+BREAKER_THRESHOLD = int(os.getenv("DASHSCOPE_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("DASHSCOPE_BREAKER_RESET", "30"))
+
+# 所有生图/图片编辑调用共用同一个容错调用器（共享熔断状态与延迟统计）
+image_caller = ResilientCaller(
+    "dashscope-image",
+    max_attempts=MAX_ATTEMPTS,
+    backoff_base=BACKOFF_BASE,
+    backoff_max=BACKOFF_MAX,
+    hedge=HEDGE,
+    hedge_delay=HEDGE_DELAY,
+    breaker=CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET),
+)
+
+_session = None
+_session_lock = threading.Lock()
+# 事件循环 -> 异步客户端：httpx.AsyncClient 的连接绑定在创建它的事件循环上，每个循环各用一个
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _build_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {DASHSCOPE_API_KEY}"
+    })
+    return session
+
+
+def get_session():
+    """
+    获取进程内共享的 keep-alive 会话（首次调用时创建）
+    :return: requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def configure_pool(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=POOL_BLOCK):
+    """按新的连接池参数重建共享会话（旧会话的连接会被关闭）"""
+    global _session
+    with _session_lock:
+        old, _session = _session, _build_session(pool_connections, pool_maxsize, pool_block)
+    if old is not None:
+        old.close()
+
+
+def get_async_client():
+    """
+    获取当前事件循环共享的异步 HTTP 客户端（httpx 连接池，与同步会话使用相同的连接数限制）
+    :return: httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    with _session_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            client = _async_clients[loop] = httpx.AsyncClient(
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {DASHSCOPE_API_KEY}"
+                },
+                limits=httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE),
+            )
+        return client
+
+
+async def aclose_async_client():
+    """关闭当前事件循环的异步客户端（应用 shutdown 时调用）"""
+    with _session_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def parse_image_urls(result):
+    """
+    解析生图/图片编辑接口的响应
+    实际返回结构：output.choices[0].message.content[{image: url, type: image}]
+    :param result: 接口返回的 json
+    :return: 图片URL列表，没有图片时返回None
+    """
+    if "output" in result and "choices" in result["output"]:
+        choices = result["output"]["choices"]
+        if choices and "message" in choices[0] and "content" in choices[0]["message"]:
+            content = choices[0]["message"]["content"]
+            # 提取所有带 image 字段的项
+            image_urls = [item["image"] for item in content if "image" in item]
+            if image_urls:
+                return image_urls
+    return None
+
+
+def _post_once(payload, timeout):
+    # 每次实际请求（含重试、对冲）都先从跨进程令牌桶取令牌
+    get_limiter("image").acquire()
+    # 发送POST请求（复用连接，不再每次握手）
+    response = get_session().post(url=GENERATE_URL, json=payload, timeout=timeout)
+    response.raise_for_status()  # HTTP状态码错误（如401/429/500），由容错层决定是否重试
+    return response.json()
+
+
+def _handle_result(result):
+    image_urls = parse_image_urls(result)
+    if image_urls:
+        return image_urls
+    print(f"生图失败：接口未返回图片数据，响应内容：{result}")
+    return None
+
+
+def _cache_lookup(payload, use_cache):
+    """
+    :return: (缓存键, 命中的图片地址)，不使用缓存或缓存出错时为 (None, None)
+    """
+    if not cache_active(use_cache):
+        return None, None
+    try:
+        cache = get_image_cache()
+        key = cache.key(payload)
+        return key, (cache.get(key) if key else None)
+    except Exception as e:
+        print(f"生图缓存不可用：{e}")
+        return None, None
+
+
+def _cache_store(key, image_urls):
+    # 只缓存单张图片的结果，图片在后台下载保存
+    if key and image_urls and len(image_urls) == 1:
+        try:
+            get_image_cache().store_async(key, image_urls[0])
+        except Exception as e:
+            print(f"生图缓存写入失败：{e}")
+
+
+def _save_artifacts(image_urls):
+    # 生成后立即在后台把图片下载到本地（URL 会过期）；生图缓存与评审复用同一次下载
+    if ARTIFACT_ENABLED and image_urls:
+        try:
+            for url in image_urls:
+                get_artifact_store().save_async(url)
+        except Exception as e:
+            print(f"图片保存到本地失败：{e}")
+
+
+def _flight_key(payload):
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _copy(image_urls):
+    # 合并的调用共享同一个结果，各自返回一份拷贝
+    return list(image_urls) if image_urls else image_urls
+
+
+def post_generation(payload, timeout=DEFAULT_TIMEOUT, use_cache=True):
+    """
+    通过共享连接池调用生图接口，超时/429/5xx 自动退避重试，后端故障时熔断
+    相同输入命中本地缓存时不调用接口；同时进行的相同请求合并为一次调用
+    :param payload: 请求体
+    :param timeout: 超时时间（秒）
+    :param use_cache: False 时不读也不写缓存、也不合并请求（需要重新随机生成时使用）
+    :return: 成功返回图片URL列表，失败返回None
+    """
+    if fresh_requested(use_cache):
+        image_urls = _post_generation(inline_local_images(payload), timeout)
+        _save_artifacts(image_urls)
+        return image_urls
+    return _copy(get_flight("image").do(_flight_key(payload), lambda: _cached_generation(payload, timeout)))
+
+
+def _cached_generation(payload, timeout):
+    key, cached = _cache_lookup(payload, True)
+    if cached:
+        return [cached]
+    image_urls = _post_generation(inline_local_images(payload), timeout)
+    _save_artifacts(image_urls)
+    _cache_store(key, image_urls)
+    return image_urls
+
+
+def _post_generation(payload, timeout):
+    try:
+        return _handle_result(image_caller.call(lambda: _post_once(payload, timeout)))
+    except CircuitOpenError as e:
+        print(f"生图服务熔断：{e}")
+        return None
+    # 捕获所有网络请求相关错误（超时、连接失败、DNS错误等）
+    except requests.exceptions.RequestException as e:
+        resp_text = e.response.text if e.response is not None else '无响应数据'
+        print(f"网络请求异常：{e}，接口原始响应：{resp_text}")
+        return None
+    # 捕获其他未知错误
+    except Exception as e:
+        print(f"程序执行异常：{e}")
+        return None
+
+
+async def _apost_once(payload, timeout):
+    await get_limiter("image").aacquire()
+    response = await get_async_client().post(GENERATE_URL, json=payload, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+async def apost_generation(payload, timeout=DEFAULT_TIMEOUT, use_cache=True):
+    """
+    post_generation 的异步版本，等待接口返回期间不占用线程
+    :param payload: 请求体
+    :param timeout: 超时时间（秒）
+    :param use_cache: False 时不读也不写缓存、也不合并请求
+    :return: 成功返回图片URL列表，失败返回None
+    """
+    if fresh_requested(use_cache):
+        image_urls = await _apost_generation(await asyncio.to_thread(inline_local_images, payload), timeout)
+        _save_artifacts(image_urls)
+        return image_urls
+    return _copy(await get_flight("image").ado(_flight_key(payload), lambda: _acached_generation(payload, timeout)))
+
+
+async def _acached_generation(payload, timeout):
+    # 计算缓存键可能需要下载输入图片，在线程中执行
+    key, cached = await asyncio.to_thread(_cache_lookup, payload, True)
+    if cached:
+        return [cached]
+    image_urls = await _apost_generation(await asyncio.to_thread(inline_local_images, payload), timeout)
+    _save_artifacts(image_urls)
+    _cache_store(key, image_urls)
+    return image_urls
+
+
+async def _apost_generation(payload, timeout):
+    try:
+        return _handle_result(await image_caller.acall(lambda: _apost_once(payload, timeout)))
+    except CircuitOpenError as e:
+        print(f"生图服务熔断：{e}")
+        return None
+    except httpx.HTTPError as e:
+        response = getattr(e, "response", None)
+        resp_text = response.text if response is not None else '无响应数据'
+        print(f"网络请求异常：{e}，接口原始响应：{resp_text}")
+        return None
+    except Exception as e:
+        print(f"程序执行异常：{e}")
+        return None
@@ -0,0 +1,328 @@
+# 生图结果缓存：按 (模型, 归一化后的提示词, 输入图片内容哈希, 参数) 的哈希作为键，
+# 生成的图片由 artifact_store 按内容哈希保存在本地磁盘，索引在 SQLite（WAL 模式，多个 worker 进程共享）并在进程内存中缓存；
+# 超过容量时按最近访问时间淘汰索引条目，超过 TTL 的条目视为未命中（图片文件的删除由 artifact_store 负责）
+# 命中时 DashScope 返回的 URL 仍在有效期内则直接返回该 URL，否则返回本服务的下载地址（/artifacts/...，客户端可以直接下载；
+# 再作为输入图片传给生图接口时会转成 base64 data URI）。服务器上的 file:// 路径不会出现在返回值中
+import base64
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from custom.artifact_store import extension, get_artifact_store, local_path, media_type
+from custom.checkpoint import connect
+from custom.review_cache import fetch_image
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".image_cache")
+# 磁盘上图片总字节数上限
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# 条目有效期（秒）
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+# DashScope 返回的图片 URL 有效期（秒），超过后命中时返回本地文件
+IMAGE_URL_TTL = int(os.getenv("IMAGE_URL_TTL", str(23 * 3600)))
+# 进程内存中缓存的索引条目数
+IMAGE_CACHE_MEMORY_ENTRIES = int(os.getenv("IMAGE_CACHE_MEMORY_ENTRIES", "4096"))
+# 作为输入的远程图片已经下载到本地时，以 data URI 发送，不让 DashScope 再下载一次
+INLINE_LOCAL_INPUTS = os.getenv("IMAGE_INLINE_LOCAL_INPUTS", "true").lower() == "true"
+
+_bypass = contextvars.ContextVar("image_cache_bypass", default=False)
+
+
+@contextlib.contextmanager
+def image_cache_bypass(bypass=True):
+    """在该上下文中发起的生图请求不读也不写缓存（需要重新随机生成时使用）"""
+    token = _bypass.set(bypass)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def fresh_requested(use_cache=True):
+    """调用方要求重新随机生成：不读写缓存，也不与同时进行的相同请求合并"""
+    return not use_cache or _bypass.get()
+
+
+def cache_active(use_cache=True):
+    return IMAGE_CACHE_ENABLED and not fresh_requested(use_cache)
+
+
+def normalize_prompt(text):
+    """全角转半角、合并连续空白（不改变大小写）"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _input_path(ref):
+    # file:// 和本服务的下载地址必须以本地文件发送（DashScope 访问不到）；
+    # 已经下载到本地的远程图片按配置发送本地文件，正在下载的不等待
+    store = get_artifact_store()
+    if local_path(ref) or ref.startswith(store.url_prefix + "/"):
+        return store.lookup(ref)
+    if INLINE_LOCAL_INPUTS and not ref.startswith("data:"):
+        return store.lookup(ref, wait=False)
+    return None
+
+
+def inline_local_images(payload):
+    """
+    把请求体中有本地文件的图片替换为 base64 data URI
+    :return: 替换后的新请求体，没有本地图片时返回原对象
+    """
+    messages = payload.get("input", {}).get("messages", [])
+    paths = {ref: _input_path(ref) for ref in
+             (item.get("image", "") for message in messages for item in message.get("content", [])) if ref}
+    if not any(paths.values()):
+        return payload
+    payload = json.loads(json.dumps(payload))
+    for message in payload["input"]["messages"]:
+        for item in message.get("content", []):
+            path = paths.get(item.get("image", ""))
+            if path:
+                with open(path, "rb") as f:
+                    data = f.read()
+                item["image"] = f"data:{media_type(path)};base64," + base64.b64encode(data).decode("ascii")
+    return payload
+
+
+class ImageCache:
+    def __init__(self, root=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, ttl=IMAGE_CACHE_TTL,
+                 url_ttl=IMAGE_URL_TTL, memory_entries=IMAGE_CACHE_MEMORY_ENTRIES):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.url_ttl = url_ttl
+        self.memory_entries = memory_entries
+        self.store = get_artifact_store()
+        os.makedirs(self.root, exist_ok=True)
+        self.conn = connect(os.path.join(self.root, "index.sqlite"))
+        self._lock = threading.Lock()
+        # key -> (digest, ext, url, created_at)；url -> digest（本缓存生成的图片再作为输入时不必重新下载，
+        # 按最近使用保留 memory_entries 个，更早的从 url 索引列查询）
+        self._memory = {}
+        self._url_digests = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS image_cache ("
+                "key TEXT PRIMARY KEY, digest TEXT NOT NULL, ext TEXT NOT NULL, size INTEGER NOT NULL, "
+                "url TEXT, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_access ON image_cache (last_access)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_digest ON image_cache (digest)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_image_cache_url ON image_cache (url)")
+
+    def blob_path(self, digest, ext):
+        return self.store.path(digest, ext)
+
+    def _image_digest(self, ref):
+        """输入图片的内容哈希，无法获取图片时返回 None"""
+        if ref.startswith("data:"):
+            return hashlib.sha256(base64.b64decode(ref.partition(",")[2])).hexdigest()
+        path = self.store.lookup(ref) if local_path(ref) or ref.startswith(self.store.url_prefix + "/") else None
+        if path:
+            # 本地存储的文件名就是内容哈希
+            name = os.path.splitext(os.path.basename(path))[0]
+            if path.startswith(os.path.join(self.store.root, "blobs")):
+                return name
+            with open(path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            digest = self._url_digests.get(ref)
+            if digest is not None:
+                self._url_digests.move_to_end(ref)
+        if digest is None:
+            with self._lock:
+                row = self.conn.execute("SELECT digest FROM image_cache WHERE url = ? LIMIT 1", (ref,)).fetchone()
+            path = None if row else self.store.lookup(ref)
+            if row:
+                digest = row[0]
+            elif path:
+                digest = os.path.splitext(os.path.basename(path))[0]
+            else:
+                data = fetch_image(ref)
+                if data is None:
+                    return None
+                digest = hashlib.sha256(data).hexdigest()
+            with self._lock:
+                self._remember_url(ref, digest)
+        return digest
+
+    def key(self, payload):
+        """
+        计算请求的缓存键
+        :param payload: 生图接口请求体
+        :return: 缓存键，输入图片无法下载时返回 None（不缓存）
+        """
+        texts, images = [], []
+        for message in payload.get("input", {}).get("messages", []):
+            for item in message.get("content", []):
+                if "text" in item:
+                    texts.append(normalize_prompt(item["text"]))
+                if "image" in item:
+                    digest = self._image_digest(item["image"])
+                    if digest is None:
+                        return None
+                    images.append(digest)
+        material = json.dumps(
+            {"model": payload.get("model"), "texts": texts, "images": images,
+             "parameters": payload.get("parameters", {})},
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key, now=None):
+        """
+        :return: 命中时返回图片地址（有效期内的原 URL 或本服务的下载地址），未命中返回 None
+        """
+        now = now or time.time()
+        entry = self._memory.get(key)
+        with self._lock:
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT digest, ext, url, created_at FROM image_cache WHERE key = ?", (key,)
+                ).fetchone()
+                entry = tuple(row) if row else None
+            if entry is not None:
+                digest, ext, url, created_at = entry
+                path = self.blob_path(digest, ext)
+                # 其他进程可能已经淘汰了该条目
+                if created_at + self.ttl < now or not os.path.exists(path):
+                    self._memory.pop(key, None)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, entry)
+            with self.conn:
+                self.conn.execute("UPDATE image_cache SET last_access = ? WHERE key = ?", (now, key))
+        if url and created_at + self.url_ttl >= now:
+            return url
+        return self.store.url_for(digest, ext)
+
+    def _remember(self, key, entry):
+        if len(self._memory) >= self.memory_entries:
+            self._memory.pop(next(iter(self._memory)))
+        self._memory[key] = entry
+
+    def _remember_url(self, url, digest):
+        # 在锁内调用
+        self._url_digests[url] = digest
+        self._url_digests.move_to_end(url)
+        while len(self._url_digests) > self.memory_entries:
+            self._url_digests.popitem(last=False)
+
+    def put(self, key, url, data, now=None):
+        """
+        保存生成的图片
+        :param url: 接口返回的图片地址
+        :param data: 图片字节
+        """
+        digest, ext, size = self.store.save_bytes(data, extension(url))
+        self._record(key, url, digest, ext, size, now)
+
+    def _record(self, key, url, digest, ext, size, now=None):
+        now = now or time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO image_cache (key, digest, ext, size, url, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, digest, ext, size, url, now, now),
+            )
+            self._remember(key, (digest, ext, url, now))
+            self._remember_url(url, digest)
+            self.stores += 1
+        self.evict(now)
+
+    def store_async(self, key, url):
+        """
+        生成的图片由 artifact_store 在后台分块下载（与其他用途共用同一次下载），完成后写入索引，不增加本次生图的耗时
+        :return: Future
+        """
+        def done(future):
+            result = future.result()
+            if result is not None:
+                self._record(key, url, *result)
+
+        future = self.store.save_async(url)
+        future.add_done_callback(done)
+        return future
+
+    def evict(self, now=None):
+        """
+        删除过期条目，再按最近访问时间淘汰到容量以内
+        图片文件可能已经作为下载地址交给了客户端，这里不删除，由 artifact_store 按磁盘容量清理
+        :return: 删除的条目数
+        """
+        now = now or time.time()
+        removed = []
+        with self._lock, self.conn:
+            rows = self.conn.execute("SELECT key FROM image_cache WHERE created_at < ?", (now - self.ttl,)).fetchall()
+            removed.extend(row[0] for row in rows)
+            self.conn.executemany("DELETE FROM image_cache WHERE key = ?", rows)
+            total = self._stored_bytes()
+            if total > self.max_bytes:
+                # 逐条删除最久未访问的条目，图片不再被引用时才释放其字节数
+                for key, digest, size in self.conn.execute(
+                    "SELECT key, digest, size FROM image_cache ORDER BY last_access"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM image_cache WHERE key = ?", (key,))
+                    removed.append(key)
+                    if not self._referenced(digest):
+                        total -= size
+            for key in removed:
+                self._memory.pop(key, None)
+            self.evictions += len(removed)
+        return len(removed)
+
+    def _referenced(self, digest):
+        return self.conn.execute("SELECT 1 FROM image_cache WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None
+
+    def _stored_bytes(self):
+        # 同一张图片被多个键引用时只计一次
+        return self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT digest, MAX(size) AS size FROM image_cache GROUP BY digest)"
+        ).fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            stored_bytes = self._stored_bytes()
+            entries = self.conn.execute("SELECT COUNT(*) FROM image_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": stored_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """
+    获取进程内共享的生图缓存（首次使用时创建缓存目录和索引）
+    :return: ImageCache
+    """
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache()
+    return _image_cache
@@ -0,0 +1,139 @@
+# 进程内共享的模型客户端注册表：首次使用时才创建客户端，同一 (model, base_url) 只创建一个，
+# 同一 base_url 的客户端共用一个 httpx 连接池；.env 整个进程只读取一次
+# 导入本模块不会导入 openai SDK，也不会访问网络
+import functools
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from custom.metrics import token_usage_handler
+from custom.rate_limit import get_limiter
+
+DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+# 每个 base_url 连接池的最大连接数
+LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", "32"))
+
+_env_loaded = False
+_lock = threading.RLock()
+_clients = {}
+_http_clients = {}
+
+
+def load_env():
+    """读取 .env（重复调用不会再次读取文件）"""
+    global _env_loaded
+    if not _env_loaded:
+        with _lock:
+            if not _env_loaded:
+                load_dotenv()
+                _env_loaded = True
+
+
+def _http_clients_for(base_url):
+    if base_url not in _http_clients:
+        limits = httpx.Limits(max_connections=LLM_POOL_MAXSIZE, max_keepalive_connections=LLM_POOL_MAXSIZE)
+        _http_clients[base_url] = (httpx.Client(limits=limits), httpx.AsyncClient(limits=limits))
+    return _http_clients[base_url]
+
+
+def get_llm(model, base_url=DASHSCOPE_BASE_URL, limiter=None):
+    """
+    获取共享的 ChatOpenAI 客户端（首次调用时创建）
+    :param model: 模型名称
+    :param base_url: OpenAI 兼容接口地址
+    :param limiter: 跨进程限流桶名称（llm/vl），None 表示不限流
+    :return: ChatOpenAI
+    """
+    key = (model, base_url, limiter)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        if key not in _clients:
+            # openai SDK 导入较慢，推迟到第一次真正使用模型时
+            from langchain_openai import ChatOpenAI
+            load_env()
+            http_client, http_async_client = _http_clients_for(base_url)
+            _clients[key] = ChatOpenAI(
+                model=model,
+                api_key=os.getenv("DASHSCOPE_API_KEY", None),
+                base_url=base_url,
+                rate_limiter=get_limiter(limiter) if limiter else None,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                callbacks=[token_usage_handler],  # 按节点、模型统计 token
+            )
+        return _clients[key]
+
+
+class Lazy:
+    """占位对象：第一次访问属性（invoke、batch、with_structured_output 等）时才调用 factory 创建真实对象"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._target_lock = threading.Lock()
+
+    def _resolve(self):
+        if self._target is None:
+            with self._target_lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    # 调用方法显式定义：langgraph 编译时会读取节点函数引用的属性（如 llm.invoke）来查找子图，
+    # 走 __getattr__ 会在编译时就创建客户端
+    def invoke(self, *args, **kwargs):
+        return self._resolve().invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self._resolve().ainvoke(*args, **kwargs)
+
+    def batch(self, *args, **kwargs):
+        return self._resolve().batch(*args, **kwargs)
+
+    async def abatch(self, *args, **kwargs):
+        return await self._resolve().abatch(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self._resolve().stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self._resolve().astream(*args, **kwargs)
+
+
+def lazy_llm(model, base_url=DASHSCOPE_BASE_URL, limiter=None):
+    """模块级使用的延迟客户端，参数同 get_llm"""
+    return Lazy(lambda: get_llm(model, base_url, limiter))
+
+
+def once(factory):
+    """
+    装饰无参工厂函数：第一次调用时执行并缓存结果，并发调用也只执行一次（用于延迟编译图、创建 checkpointer）
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(factory)
+    def wrapper():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(factory())
+        return result[0]
+    return wrapper
+
+
+async def aclose_llm_clients():
+    """关闭共享的 httpx 连接池（应用 shutdown 时调用）"""
+    with _lock:
+        http_clients = list(_http_clients.values())
+        _http_clients.clear()
+        _clients.clear()
+    for http_client, http_async_client in http_clients:
+        http_client.close()
+        await http_async_client.aclose()
+
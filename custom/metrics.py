@@ -0,0 +1,233 @@
+# 图节点指标：耗时直方图、调用/错误次数、按节点和模型统计的 LLM token 数，以 Prometheus 文本格式导出
+# 节点用 instrument() 包装后注册到图中；token 由注册表创建的模型客户端上的回调统计，
+# 通过 contextvar 归属到当前正在执行的节点
+import bisect
+import contextvars
+import os
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.utils import accepts_config
+from langgraph.errors import GraphBubbleUp
+
+# 关闭后 instrument() 直接返回原节点，不做任何统计
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# 节点耗时直方图的桶（秒），生图节点可达数十秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# 当前正在执行的 (图, 节点)，图外的模型调用（如后台风格池）记为 none
+_current_node = contextvars.ContextVar("metrics_current_node", default=("none", "none"))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), n=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [各桶计数(非累计)..., 超出最后一个桶的计数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, labels=()):
+        counts = self._values.get(labels)
+        return sum(counts[:-1]) if counts else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        for labels, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+NODE_LATENCY = Histogram("graph_node_duration_seconds", "图节点执行耗时", ("graph", "node"))
+NODE_CALLS = Counter("graph_node_calls_total", "图节点执行次数", ("graph", "node"))
+NODE_ERRORS = Counter("graph_node_errors_total", "图节点抛出异常的次数（不含 interrupt 暂停）", ("graph", "node"))
+LLM_CALLS = Counter("llm_calls_total", "模型调用次数", ("graph", "node", "model"))
+LLM_TOKENS = Counter("llm_tokens_total", "模型调用消耗的 token 数", ("graph", "node", "model", "type"))
+
+_metrics = [NODE_LATENCY, NODE_CALLS, NODE_ERRORS, LLM_CALLS, LLM_TOKENS]
+_collectors = {}
+
+
+def register_collector(name, collect):
+    """
+    注册额外的指标来源（在 render 时调用），同名重复注册时覆盖，多个应用在同一进程中不会重复导出
+    :param name: 来源名称
+    :param collect: 无参函数，返回 Prometheus 文本行列表
+    """
+    _collectors[name] = collect
+
+
+def register_stats(prefix, stats, help=""):
+    """
+    把 stats() 返回的字典中的数值字段导出为 gauge，如 jobs.stats、style_pool.stats
+    :param prefix: 指标名前缀（同时作为来源名称）
+    :param stats: 返回 dict 的无参函数
+    """
+    def collect():
+        lines = []
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines.extend([f"# HELP {name} {help or prefix} {key}", f"# TYPE {name} gauge", f"{name} {_number(value)}"])
+        return lines
+    register_collector(prefix, collect)
+
+
+def render():
+    """
+    导出全部指标
+    :return: Prometheus 文本格式
+    """
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in list(_collectors.values()):
+        try:
+            lines.extend(collect())
+        except Exception as e:
+            print(f"指标采集失败：{e}")
+    return "\n".join(lines) + "\n"
+
+
+def _call(fn, takes_config, state, config):
+    return fn(state, config) if takes_config else fn(state)
+
+
+def instrument(graph, node, func, afunc=None):
+    """
+    包装图节点：记录耗时、调用次数、错误次数，节点内的模型调用按该节点统计 token
+    :param graph: 图名称（指标标签）
+    :param node: 节点名称（指标标签）
+    :param func: 同步实现
+    :param afunc: 异步实现，不传时 ainvoke 在线程中执行同步实现
+    :return: 可直接传给 add_node 的 RunnableLambda
+    """
+    if not METRICS_ENABLED:
+        return RunnableLambda(func, afunc=afunc, name=node)
+    labels = (graph, node)
+    func_config = accepts_config(func)
+    afunc_config = afunc is not None and accepts_config(afunc)
+
+    def _finish(start, token):
+        NODE_LATENCY.observe(labels, time.perf_counter() - start)
+        NODE_CALLS.inc(labels)
+        _current_node.reset(token)
+
+    def wrapper(state, config):
+        token = _current_node.set(labels)
+        start = time.perf_counter()
+        try:
+            return _call(func, func_config, state, config)
+        except GraphBubbleUp:
+            # interrupt 暂停不算错误
+            raise
+        except Exception:
+            NODE_ERRORS.inc(labels)
+            raise
+        finally:
+            _finish(start, token)
+
+    async def awrapper(state, config):
+        token = _current_node.set(labels)
+        start = time.perf_counter()
+        try:
+            return await (afunc(state, config) if afunc_config else afunc(state))
+        except GraphBubbleUp:
+            raise
+        except Exception:
+            NODE_ERRORS.inc(labels)
+            raise
+        finally:
+            _finish(start, token)
+
+    return RunnableLambda(wrapper, afunc=awrapper if afunc is not None else None, name=node)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """模型回调：按当前节点和模型累计调用次数与 token 数"""
+
+    # 在调用线程内同步执行，才能读到当前节点的 contextvar
+    run_inline = True
+
+    def on_llm_end(self, response, **kwargs):
+        graph, node = _current_node.get()
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name") or "unknown"
+        prompt_tokens = completion_tokens = 0
+        usage = llm_output.get("token_usage")
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens") or 0
+            completion_tokens = usage.get("completion_tokens") or 0
+        else:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+        LLM_CALLS.inc((graph, node, model))
+        LLM_TOKENS.inc((graph, node, model, "prompt"), prompt_tokens)
+        LLM_TOKENS.inc((graph, node, model, "completion"), completion_tokens)
+
+
+token_usage_handler = TokenUsageHandler()
@@ -0,0 +1,198 @@
+# 跨进程令牌桶限流 + 进程内优先级排队
+# 令牌桶状态保存在共享文件中并用文件锁保护，多个 uvicorn worker 共用同一份 DashScope 配额
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import struct
+import threading
+import time
+from langchain_core.rate_limiters import BaseRateLimiter
+
+try:
+    import fcntl
+except ImportError:  # Windows 下退化为进程内限流
+    fcntl = None
+
+# 令牌桶状态文件目录，同一台机器上的所有进程需指向同一目录
+RATE_LIMIT_DIR = os.getenv("RATE_LIMIT_DIR", "/tmp/agent-demo-ratelimit")
+
+# 优先级：数值越小越先获得令牌
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 10
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=PRIORITY_NORMAL)
+
+# (每秒令牌数, 桶容量)
+BUCKETS = {
+    "llm": (float(os.getenv("RATE_LIMIT_LLM_QPS", "5")), float(os.getenv("RATE_LIMIT_LLM_BURST", "5"))),
+    "vl": (float(os.getenv("RATE_LIMIT_VL_QPS", "2")), float(os.getenv("RATE_LIMIT_VL_BURST", "2"))),
+    "image": (float(os.getenv("RATE_LIMIT_IMAGE_QPS", "2")), float(os.getenv("RATE_LIMIT_IMAGE_BURST", "2"))),
+}
+
+_STATE = struct.Struct("dd")  # (剩余令牌数, 上次补充时间)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """在该上下文中发起的模型/生图请求使用指定优先级排队"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class SharedTokenBucket:
+    """令牌桶，状态存放在文件中，通过 flock 在进程间互斥"""
+
+    def __init__(self, name, rate, capacity, directory=RATE_LIMIT_DIR):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.path = os.path.join(directory, f"{name}.bucket")
+        self._fd = None
+        self._pid = None
+        # flock 不区分同一进程内的线程，需要再加一把线程锁
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _file(self):
+        # fork 出来的子进程不能复用父进程的文件描述符（会共享同一把 flock）
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def try_take(self):
+        """
+        尝试取一个令牌
+        :return: 0 表示成功，否则为预计还需等待的秒数
+        """
+        with self._lock:
+            fd = self._file()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(fd, _STATE.size, 0)
+                tokens, last = _STATE.unpack(data) if len(data) == _STATE.size else (self.capacity, now)
+                tokens = min(self.capacity, tokens + max(0.0, now - last) * self.rate)
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / self.rate
+                os.pwrite(fd, _STATE.pack(tokens, now), 0)
+                return wait
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class SharedRateLimiter(BaseRateLimiter):
+    """
+    按优先级排队的跨进程限流器
+    可直接作为 ChatOpenAI(rate_limiter=...) 使用，也可在任意请求前调用 acquire()
+    """
+
+    def __init__(self, bucket, poll_interval=0.05):
+        self.bucket = bucket
+        self.poll_interval = poll_interval
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def _leave(self, entry, acquired, started):
+        # 调用方需持有 self._cond
+        self._heap.remove(entry)
+        heapq.heapify(self._heap)
+        if acquired:
+            self.acquired += 1
+            self.waited_seconds += time.perf_counter() - started
+        self._cond.notify_all()
+
+    def acquire(self, *, blocking=True, priority=None):
+        entry = (current_priority() if priority is None else priority, next(self._seq))
+        started = time.perf_counter()
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+        acquired = False
+        try:
+            while True:
+                with self._cond:
+                    # 只有排在队首的请求才去取令牌，优先级更高的请求到达后会排到前面
+                    if self._heap[0] != entry:
+                        if not blocking:
+                            return False
+                        self._cond.wait(self.poll_interval)
+                        continue
+                # 取令牌时不持有 _cond：flock 在其他进程持有锁时会阻塞，不能让事件循环上的 aacquire 跟着等待
+                wait = self.bucket.try_take()
+                if wait == 0:
+                    acquired = True
+                    return True
+                if not blocking:
+                    return False
+                with self._cond:
+                    self._cond.wait(min(wait, self.poll_interval))
+        finally:
+            with self._cond:
+                self._leave(entry, acquired, started)
+
+    async def aacquire(self, *, blocking=True, priority=None):
+        entry = (current_priority() if priority is None else priority, next(self._seq))
+        started = time.perf_counter()
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+        acquired = False
+        try:
+            while True:
+                with self._cond:
+                    at_head = self._heap[0] == entry
+                # flock 在其他进程持有锁时会阻塞，放到线程中执行，不卡住事件循环
+                wait = await asyncio.to_thread(self.bucket.try_take) if at_head else self.poll_interval
+                if wait == 0:
+                    acquired = True
+                    return True
+                if not blocking:
+                    return False
+                await asyncio.sleep(min(wait, self.poll_interval))
+        finally:
+            with self._cond:
+                self._leave(entry, acquired, started)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "bucket": self.bucket.name,
+                "rate": self.bucket.rate,
+                "capacity": self.bucket.capacity,
+                "waiting": len(self._heap),
+                "acquired": self.acquired,
+                "avg_wait": self.waited_seconds / self.acquired if self.acquired else 0.0,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """
+    获取指定桶（llm/vl/image）的进程内单例限流器
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            rate, capacity = BUCKETS[name]
+            _limiters[name] = SharedRateLimiter(SharedTokenBucket(name, rate, capacity))
+        return _limiters[name]
@@ -0,0 +1,257 @@
+# 外部服务调用的容错层：抖动指数退避重试、对冲请求、熔断器
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+import requests
+
+# 视为可重试的 HTTP 状态码（限流与服务端错误）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，直接失败不再请求后端"""
+
+
+def is_retryable(exc):
+    """超时、连接错误、429/5xx 可以重试；4xx 等客户端错误不重试"""
+    response = getattr(exc, "response", None)
+    if response is not None and getattr(response, "status_code", None) is not None:
+        return response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, httpx.TransportError))
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态，放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyTracker:
+    """记录最近的成功请求耗时，用于计算对冲延迟（p95）"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, q):
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    def __init__(self, name, max_attempts=3, backoff_base=0.5, backoff_max=8.0,
+                 hedge=False, hedge_delay=None, breaker=None):
+        """
+        :param max_attempts: 最多尝试次数（含首次）
+        :param backoff_base: 退避基数（秒），第 n 次重试最多等待 backoff_base * 2**n
+        :param hedge: 是否启用对冲请求
+        :param hedge_delay: 对冲延迟（秒），为None时使用最近请求耗时的 p95
+        """
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._executor = None
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "attempts": 0, "retries": 0, "failures": 0,
+            "hedges": 0, "hedge_wins": 0, "short_circuits": 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _backoff(self, attempt):
+        # full jitter：在 [0, min(上限, 基数*2^n)] 之间随机等待，避免重试风暴
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _current_hedge_delay(self):
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        return self.latency.percentile(0.95)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"{self.name}-hedge")
+        return self._executor
+
+    def _timed(self, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    def _call_hedged(self, fn, delay):
+        executor = self._get_executor()
+        # 在调用方的 context 中执行，对冲请求保留限流优先级、生图缓存开关等 contextvar
+        primary = executor.submit(contextvars.copy_context().run, self._timed, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedge = executor.submit(contextvars.copy_context().run, self._timed, fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, fn):
+        """
+        同步调用，fn 抛出可重试异常时退避重试
+        :raises CircuitOpenError: 熔断器打开
+        """
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                self._count("short_circuits")
+                raise CircuitOpenError(f"{self.name} 熔断中，暂停请求 {self.breaker.reset_timeout}s")
+            self._count("attempts")
+            try:
+                delay = self._current_hedge_delay()
+                result = self._call_hedged(fn, delay) if delay is not None else self._timed(fn)
+            except Exception as e:
+                if not is_retryable(e):
+                    # 后端有响应（如 4xx），说明服务可用
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= self.max_attempts:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _atimed(self, coro_fn):
+        start = time.perf_counter()
+        result = await coro_fn()
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    async def _acall_hedged(self, coro_fn, delay):
+        primary = asyncio.ensure_future(self._atimed(coro_fn))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedge = asyncio.ensure_future(self._atimed(coro_fn))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 取消较慢的那个请求
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, coro_fn):
+        """call 的异步版本，coro_fn 为返回协程的无参函数"""
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                self._count("short_circuits")
+                raise CircuitOpenError(f"{self.name} 熔断中，暂停请求 {self.breaker.reset_timeout}s")
+            self._count("attempts")
+            try:
+                delay = self._current_hedge_delay()
+                if delay is not None:
+                    result = await self._acall_hedged(coro_fn, delay)
+                else:
+                    result = await self._atimed(coro_fn)
+            except Exception as e:
+                if not is_retryable(e):
+                    # 后端有响应（如 4xx），说明服务可用
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt + 1 >= self.max_attempts:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "hedge_delay": self._current_hedge_delay(),
+        }
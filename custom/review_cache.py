@@ -0,0 +1,161 @@
+# 图片评审的预处理与结果缓存：下载图片计算内容哈希，按 (哈希, 提示词) 缓存评审结果，
+# 并可把 1280×1280 的原图缩成小尺寸 JPEG 缩略图再交给视觉模型，降低延迟与 token 消耗
+import asyncio
+import base64
+import copy
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from custom.artifact_store import get_artifact_store
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时只缓存，不缩放
+    Image = None
+
+# 缩略图最长边像素，0 表示不缩放（直接把原图 URL 交给视觉模型）
+THUMBNAIL_SIZE = int(os.getenv("REVIEW_THUMBNAIL_SIZE", "512"))
+THUMBNAIL_QUALITY = int(os.getenv("REVIEW_THUMBNAIL_QUALITY", "85"))
+# 缓存的评审结果条数，0 表示关闭缓存
+REVIEW_CACHE_SIZE = int(os.getenv("REVIEW_CACHE_SIZE", "512"))
+FETCH_TIMEOUT = float(os.getenv("REVIEW_FETCH_TIMEOUT", "30"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    # 图片在 OSS 等外部存储上，不能复用带 DashScope 鉴权头的会话
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=16)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def fetch_image(url, timeout=FETCH_TIMEOUT):
+    """
+    下载图片
+    :param url: 图片地址（file:// 地址、本服务的下载地址、已经在本地保存过的生成结果直接读取本地文件）
+    :return: 图片字节，失败返回None
+    """
+    path = unquote(urlparse(url).path) if url.startswith("file://") else get_artifact_store().lookup(url)
+    if path:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError as e:
+            print(f"读取本地图片失败：{e}")
+            return None
+    try:
+        response = _get_session().get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException as e:
+        print(f"下载待评审图片失败：{e}")
+        return None
+
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """
+    把图片缩放到最长边不超过 size 并编码为 JPEG data URI
+    :param data: 原图字节
+    :return: data:image/jpeg;base64,... ，无法缩放时返回None
+    """
+    if Image is None or size <= 0:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert("RGB")
+            image.thumbnail((size, size))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality)
+    except Exception as e:
+        print(f"缩略图生成失败：{e}")
+        return None
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def prepare_review_image(url, size=THUMBNAIL_SIZE):
+    """
+    评审前的预处理
+    :param url: 生成的图片地址
+    :param size: 缩略图最长边，0 表示不缩放
+    :return: (图片内容哈希, 交给视觉模型的图片地址)；下载失败时哈希为None、地址为原 URL
+    """
+    if size <= 0 and REVIEW_CACHE_SIZE <= 0:
+        return None, url
+    data = fetch_image(url)
+    if data is None:
+        return None, url
+    digest = hashlib.sha256(data).hexdigest()
+    return digest, make_thumbnail(data, size) or url
+
+
+async def aprepare_review_image(url, size=THUMBNAIL_SIZE):
+    """prepare_review_image 的异步版本（下载与缩放放到线程中执行）"""
+    return await asyncio.to_thread(prepare_review_image, url, size)
+
+
+class ReviewCache:
+    """按 (图片内容哈希, 提示词) 缓存评审结果，超过 max_size 时淘汰最久未使用的条目"""
+
+    def __init__(self, max_size=REVIEW_CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        # 图片 URL -> 内容哈希，图回放时同一 URL 无需重新下载即可命中
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest, prompt):
+        """
+        :return: 缓存的评审结果，未命中返回None
+        """
+        if digest is None or self.max_size <= 0:
+            return None
+        with self._lock:
+            review = self._items.get((digest, prompt))
+            if review is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((digest, prompt))
+            self.hits += 1
+            return copy.deepcopy(review)
+
+    def get_by_url(self, url, prompt):
+        """
+        按图片 URL 查找（该 URL 之前评审过时免去下载）
+        :return: 缓存的评审结果，未命中返回None
+        """
+        with self._lock:
+            digest = self._digests.get(url)
+        return self.get(digest, prompt) if digest is not None else None
+
+    def put(self, digest, prompt, review, url=None):
+        if digest is None or self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[(digest, prompt)] = copy.deepcopy(review)
+            self._items.move_to_end((digest, prompt))
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            if url is not None:
+                self._digests[url] = digest
+                self._digests.move_to_end(url)
+                while len(self._digests) > self.max_size:
+                    self._digests.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self._items), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
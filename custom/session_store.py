@@ -0,0 +1,128 @@
+# 有界的多轮会话存储：跨会话 LRU 淘汰 + 单会话消息窗口 + 可选磁盘持久化
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+# 内存中最多保留的会话数
+MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+# 每个会话保留的最近消息条数
+MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+# 每个会话保留的最近消息的估算 token 数
+MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "2000"))
+# 持久化目录，不设置时只保存在内存中
+SESSION_DIR = os.getenv("SESSION_DIR") or None
+
+
+def estimate_tokens(message):
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    cjk = sum(1 for ch in content if "⺀" <= ch <= "鿿" or "豈" <= ch <= "﫿")
+    return cjk + (len(content) - cjk + 3) // 4 + 1
+
+
+class WindowedChatMessageHistory(BaseChatMessageHistory):
+    """只保留最近 max_messages 条、总计不超过 max_tokens 的消息"""
+
+    def __init__(self, max_messages=MAX_MESSAGES, max_tokens=MAX_TOKENS, path=None, messages=None):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.path = path
+        self.messages = []
+        self._tokens = []
+        self._lock = threading.Lock()
+        if messages:
+            self._append(messages)
+
+    def _append(self, messages):
+        for message in messages:
+            self.messages.append(message)
+            self._tokens.append(estimate_tokens(message))
+        # 从最早的消息开始丢弃，至少保留最新的一条
+        total = sum(self._tokens)
+        drop = 0
+        while len(self.messages) - drop > 1 and (
+            len(self.messages) - drop > self.max_messages or total > self.max_tokens
+        ):
+            total -= self._tokens[drop]
+            drop += 1
+        if drop:
+            del self.messages[:drop]
+            del self._tokens[:drop]
+
+    def add_messages(self, messages):
+        with self._lock:
+            self._append(messages)
+            if self.path:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(messages_to_dict(self.messages), f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self._lock:
+            self.messages = []
+            self._tokens = []
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class SessionStore:
+    """按 session_id 获取会话历史，超过 max_sessions 时淘汰最久未使用的会话"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, max_messages=MAX_MESSAGES, max_tokens=MAX_TOKENS,
+                 persist_dir=SESSION_DIR):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.persist_dir = persist_dir
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def _path(self, session_id):
+        if not self.persist_dir:
+            return None
+        name = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.persist_dir, f"{name}.json")
+
+    def _load(self, session_id):
+        path = self._path(session_id)
+        messages = None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                messages = messages_from_dict(json.load(f))
+        return WindowedChatMessageHistory(self.max_messages, self.max_tokens, path, messages)
+
+    def get(self, session_id):
+        """
+        获取会话历史（不存在时创建，已持久化的会话从磁盘恢复）
+        :param session_id: 会话 id
+        :return: WindowedChatMessageHistory
+        """
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is not None:
+                self._sessions.move_to_end(session_id)
+                return history
+            history = self._load(session_id)
+            self._sessions[session_id] = history
+            while len(self._sessions) > self.max_sessions:
+                # 持久化模式下消息已写入磁盘，淘汰只释放内存
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            return history
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
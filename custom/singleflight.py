@@ -0,0 +1,137 @@
+# 进程内请求合并（singleflight）：同一时刻相同键的调用只有第一个真正执行，其余调用等待并共享它的结果或异常
+# 同步与异步调用共用同一个等待表，线程中的同步调用和事件循环中的异步调用也能互相合并
+# 只合并正在执行的调用，结束后立即移除，不做结果缓存（跨请求复用由 image_cache 等负责）
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+
+class _LeaderGone(Exception):
+    """执行方被取消或中断（如 SSE 客户端断开），等待方重新竞争执行，而不是跟着失败"""
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0  # 真正发出的上游调用次数
+        self.shared = 0  # 合并到已有调用、省下的上游调用次数
+        self.abandoned = 0  # 执行方被取消、由等待方重新执行的次数
+
+    def _join(self, key):
+        """
+        :return: (future, 是否由当前调用执行)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.calls += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _abandon(self, key, future):
+        # 执行方被取消或中断：只把普通异常共享给等待方，取消/中断不传播，移除条目后由等待方重新执行
+        with self._lock:
+            self.abandoned += 1
+        self._finish(key, future, error=_LeaderGone())
+
+    def _rejoin(self):
+        # 等待方改为自己执行，上一次合并没有省下调用
+        with self._lock:
+            self.shared -= 1
+
+    def do(self, key, fn):
+        """
+        :param key: 调用的键，键相同视为同一个请求
+        :param fn: 无参函数
+        :return: fn 的返回值（合并的调用拿到的是同一个对象）
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return fn()
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _LeaderGone:
+                self._rejoin()
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._abandon(key, future)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ado(self, key, afn):
+        """
+        do 的异步版本
+        :param afn: 返回协程的无参函数
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return await afn()
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # shield：等待方被取消时不能取消共享的调用
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderGone:
+                self._rejoin()
+        try:
+            result = await afn()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            # 执行方的请求被取消（如客户端断开）时，其他合并的请求不受影响
+            self._abandon(key, future)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._calls)
+        total = self.calls + self.shared
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "saved_ratio": round(self.shared / total, 4) if total else 0.0,
+            "abandoned": self.abandoned,
+            "inflight": inflight,
+        }
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name):
+    """
+    获取指定名称（image/invoice）的进程内单例
+    """
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(name)
+        return _flights[name]
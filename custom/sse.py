@@ -0,0 +1,52 @@
+# Server-Sent Events：把图每个节点的输出在产生后立即推送给客户端
+import asyncio
+import json
+from fastapi.responses import StreamingResponse
+from custom.artifact_store import get_artifact_store
+
+
+def sse_event(event, data):
+    """格式化一条 SSE 消息"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def stream_graph_updates(graph, graph_input, config=None, on_finish=None, artifacts=()):
+    """
+    以 SSE 格式逐条产出图的节点更新
+    事件名为节点名，数据为节点返回值；暂停时发送 interrupt 事件，结束时发送 end 事件
+    :param on_finish: 图正常跑完（没有暂停）时的回调，在线程中执行（可以是 SQLite 写入等阻塞操作）
+    :param artifacts: 图片字段名（如 final_image），节点输出这些字段后再发送 artifact 事件，给出本服务的下载地址
+    """
+    interrupted = False
+    try:
+        async for update in graph.astream(graph_input, config=config, stream_mode="updates"):
+            for node, output in update.items():
+                if node == "__interrupt__":
+                    interrupted = True
+                    yield sse_event("interrupt", [item.value for item in output])
+                else:
+                    yield sse_event(node, output or {})
+                    for key in artifacts:
+                        if (output or {}).get(key):
+                            url = await asyncio.to_thread(get_artifact_store().artifact_url, output[key])
+                            if url:
+                                yield sse_event("artifact", {"field": key, "url": url})
+    except Exception as e:
+        # 异常详情（可能含接口地址、错误响应体、路径）只写日志，客户端只收到通用提示和 task_id
+        task_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        print(f"流式执行失败（task_id={task_id}）：{e!r}")
+        yield sse_event("error", {"error": "graph execution failed", "task_id": task_id})
+        return
+    if not interrupted and on_finish is not None:
+        await asyncio.to_thread(on_finish)
+    yield sse_event("end", {"interrupted": interrupted})
+
+
+def sse_response(events):
+    """包装为 text/event-stream 响应，关闭代理缓冲"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,352 @@
+# 报销任务存储：多个 uvicorn worker 共享任务状态，/approve 落到任何 worker 都能找到任务
+# 默认 SQLite（WAL 模式，与 checkpoint 共用一个数据库文件），可选 Redis 兼容服务（需要安装 redis 包）
+# 列表接口使用 keyset 分页（按 (排序字段, task_id) 游标），翻到多深都只走索引，不随总行数变慢
+import asyncio
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from custom.checkpoint import CHECKPOINT_DB, connect
+
+# sqlite / redis
+TASK_STORE = os.getenv("TASK_STORE", "sqlite")
+# SQLite 文件，默认与 checkpoint 同一个文件（一个库即可部署多 worker）
+TASK_DB = os.getenv("TASK_DB", CHECKPOINT_DB)
+TASK_REDIS_URL = os.getenv("TASK_REDIS_URL", "redis://localhost:6379/0")
+# 列表接口每页条数上限
+TASK_PAGE_MAX = int(os.getenv("TASK_PAGE_MAX", "200"))
+
+STATUS_NEED_APPROVAL = "need_approval"
+# 已被某个审批请求认领、正在恢复执行，其他请求不会重复审批
+STATUS_APPROVING = "approving"
+STATUS_DONE = "done"
+STATUS_FINISHED = "finished"
+STATUS_FAILED = "failed"
+STATUSES = (STATUS_NEED_APPROVAL, STATUS_APPROVING, STATUS_DONE, STATUS_FINISHED, STATUS_FAILED)
+# 列表排序字段：创建时间（等待时长）或金额
+SORT_KEYS = ("created_at", "amount")
+
+
+def encode_cursor(value, task_id):
+    """
+    :param value: 排序字段的值（created_at 或 amount）
+    """
+    return f"{float(value)!r}_{task_id}"
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: 上一页返回的 next_cursor
+    :return: (排序字段的值, task_id)，格式不对时抛出 ValueError
+    """
+    value, _, task_id = cursor.partition("_")
+    if not task_id:
+        raise ValueError(f"无效的游标：{cursor}")
+    return float(value), task_id
+
+
+def _check_sort(sort):
+    if sort not in SORT_KEYS:
+        raise ValueError(f"不支持的排序字段：{sort}")
+
+
+class TaskStore(ABC):
+    """任务存储接口：同步实现由子类提供，异步接口在线程中调用同步实现"""
+
+    @abstractmethod
+    def put(self, task_id, status, amount=None, approved=None, result=None):
+        """新建或更新任务，更新时保留 created_at"""
+
+    @abstractmethod
+    def get(self, task_id):
+        """
+        :return: 任务字典，不存在时返回 None
+        """
+
+    @abstractmethod
+    def list(self, status=None, limit=50, cursor=None, sort="created_at", descending=False):
+        """
+        按排序字段列出任务（不含 result），默认按创建时间从早到晚
+        :param status: 只列出该状态的任务，None 表示全部（按金额排序时应指定状态才能走索引）
+        :param cursor: 上一页返回的 next_cursor，翻页时排序方式需与上一页一致
+        :param sort: created_at 或 amount
+        :param descending: 是否倒序
+        :return: (任务列表, next_cursor)，没有下一页时 next_cursor 为 None
+        """
+
+    @abstractmethod
+    def claim(self, task_ids, from_status, to_status):
+        """
+        原子地把处于 from_status 的任务改为 to_status（多个 worker 同时审批同一任务时只有一个成功）
+        :return: 状态修改成功的 task_id 集合
+        """
+
+    @abstractmethod
+    def release_stale(self, from_status, to_status, older_than):
+        """
+        把停留在 from_status、updated_at 早于 older_than 的任务改为 to_status（认领后客户端断开或 worker 崩溃的任务）
+        :return: 修改的任务数
+        """
+
+    async def aput(self, task_id, status, amount=None, approved=None, result=None):
+        return await asyncio.to_thread(self.put, task_id, status, amount, approved, result)
+
+    async def aget(self, task_id):
+        return await asyncio.to_thread(self.get, task_id)
+
+    async def alist(self, status=None, limit=50, cursor=None, sort="created_at", descending=False):
+        return await asyncio.to_thread(self.list, status, limit, cursor, sort, descending)
+
+    async def aclaim(self, task_ids, from_status, to_status):
+        return await asyncio.to_thread(self.claim, task_ids, from_status, to_status)
+
+    async def arelease_stale(self, from_status, to_status, older_than):
+        return await asyncio.to_thread(self.release_stale, from_status, to_status, older_than)
+
+
+def _dumps(result):
+    return None if result is None else json.dumps(result, ensure_ascii=False, default=str)
+
+
+class SqliteTaskStore(TaskStore):
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS expense_tasks ("
+                "task_id TEXT PRIMARY KEY, status TEXT NOT NULL, amount REAL, approved INTEGER, result TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # 状态过滤 + 按创建时间/金额翻页，以及不过滤状态时按创建时间翻页
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_expense_tasks_status ON expense_tasks (status, created_at, task_id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_expense_tasks_amount ON expense_tasks (status, amount, task_id)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_expense_tasks_created ON expense_tasks (created_at, task_id)"
+            )
+
+    def put(self, task_id, status, amount=None, approved=None, result=None):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO expense_tasks (task_id, status, amount, approved, result, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET status = excluded.status, "
+                "amount = COALESCE(excluded.amount, amount), approved = excluded.approved, "
+                "result = COALESCE(excluded.result, result), updated_at = excluded.updated_at",
+                (task_id, status, amount, None if approved is None else int(approved), _dumps(result), now, now),
+            )
+
+    def get(self, task_id):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT task_id, status, amount, approved, created_at, updated_at, result "
+                "FROM expense_tasks WHERE task_id = ?",
+                (task_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        task = self._row(row)
+        task["result"] = json.loads(row[6]) if row[6] else None
+        return task
+
+    def list(self, status=None, limit=50, cursor=None, sort="created_at", descending=False):
+        _check_sort(sort)
+        limit = max(1, min(limit, TASK_PAGE_MAX))
+        where, params = [], []
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if sort == "amount":
+            where.append("amount IS NOT NULL")
+        if cursor:
+            where.append(f"({sort}, task_id) {'<' if descending else '>'} (?, ?)")
+            params.extend(decode_cursor(cursor))
+        direction = "DESC" if descending else "ASC"
+        sql = "SELECT task_id, status, amount, approved, created_at, updated_at FROM expense_tasks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort} {direction}, task_id {direction} LIMIT ?"
+        with self._lock:
+            rows = self.conn.execute(sql, (*params, limit + 1)).fetchall()
+        tasks = [self._row(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = tasks[-1]
+            next_cursor = encode_cursor(last[sort], last["task_id"])
+        return tasks, next_cursor
+
+    def claim(self, task_ids, from_status, to_status):
+        claimed = set()
+        now = time.time()
+        with self._lock, self.conn:
+            for task_id in task_ids:
+                cur = self.conn.execute(
+                    "UPDATE expense_tasks SET status = ?, updated_at = ? WHERE task_id = ? AND status = ?",
+                    (to_status, now, task_id, from_status),
+                )
+                if cur.rowcount:
+                    claimed.add(task_id)
+        return claimed
+
+    def release_stale(self, from_status, to_status, older_than):
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "UPDATE expense_tasks SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (to_status, time.time(), from_status, older_than),
+            )
+        return cur.rowcount
+
+    @staticmethod
+    def _row(row):
+        return {
+            "task_id": row[0],
+            "status": row[1],
+            "amount": row[2],
+            "approved": None if row[3] is None else bool(row[3]),
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+
+class RedisTaskStore(TaskStore):
+    """
+    每个任务一个 hash；每个状态各有按 created_at、按 amount 排序的 zset，另有全部任务的两个 zset
+    同分数的成员按 task_id 字典序排列，与 SQLite 的 (排序字段, task_id) 顺序一致
+    """
+
+    def __init__(self, client, prefix="expense"):
+        self.client = client
+        self.prefix = prefix
+
+    def _task_key(self, task_id):
+        return f"{self.prefix}:task:{task_id}"
+
+    def _index_key(self, status=None, sort="created_at"):
+        suffix = "" if sort == "created_at" else f":{sort}"
+        return f"{self.prefix}:tasks:{status or 'all'}{suffix}"
+
+    def _reindex(self, pipe, task_id, status, created_at, amount):
+        # 从其他状态的索引中移除，加入新状态和全部任务的索引
+        for other in STATUSES:
+            if other != status:
+                pipe.zrem(self._index_key(other), task_id)
+                pipe.zrem(self._index_key(other, "amount"), task_id)
+        for index_status in (status, None):
+            pipe.zadd(self._index_key(index_status), {task_id: created_at})
+            if amount is not None:
+                pipe.zadd(self._index_key(index_status, "amount"), {task_id: amount})
+
+    def put(self, task_id, status, amount=None, approved=None, result=None):
+        now = time.time()
+        key = self._task_key(task_id)
+        created_at, stored_amount = self.client.hmget(key, ["created_at", "amount"])
+        created_at = float(created_at) if created_at is not None else now
+        if amount is None and stored_amount is not None:
+            amount = float(stored_amount)
+        fields = {"task_id": task_id, "status": status, "created_at": created_at, "updated_at": now,
+                  "approved": "" if approved is None else int(approved)}
+        if amount is not None:
+            fields["amount"] = amount
+        if result is not None:
+            fields["result"] = _dumps(result)
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping=fields)
+        self._reindex(pipe, task_id, status, created_at, amount)
+        pipe.execute()
+
+    def _transition(self, task_id, from_status, to_status, older_than=None):
+        key = self._task_key(task_id)
+
+        def transition(pipe):
+            # WATCH 期间读取，状态被其他 worker 改动时 EXEC 失败并重试
+            status, created_at, amount, updated_at = pipe.hmget(key, ["status", "created_at", "amount", "updated_at"])
+            if status is None or status.decode() != from_status:
+                return False
+            if older_than is not None and float(updated_at) >= older_than:
+                return False
+            pipe.multi()
+            pipe.hset(key, mapping={"status": to_status, "updated_at": time.time()})
+            self._reindex(pipe, task_id, to_status, float(created_at),
+                          float(amount) if amount is not None else None)
+            return True
+
+        return self.client.transaction(transition, key, value_from_callable=True)
+
+    def claim(self, task_ids, from_status, to_status):
+        return {task_id for task_id in task_ids if self._transition(task_id, from_status, to_status)}
+
+    def release_stale(self, from_status, to_status, older_than):
+        # 处于中间状态的任务很少，逐个检查 updated_at
+        task_ids = [member.decode() for member in self.client.zrange(self._index_key(from_status), 0, -1)]
+        return sum(1 for task_id in task_ids if self._transition(task_id, from_status, to_status, older_than))
+
+    def get(self, task_id):
+        fields = self.client.hgetall(self._task_key(task_id))
+        if not fields:
+            return None
+        task = self._task(fields)
+        result = fields.get(b"result")
+        task["result"] = json.loads(result) if result else None
+        return task
+
+    def list(self, status=None, limit=50, cursor=None, sort="created_at", descending=False):
+        _check_sort(sort)
+        limit = max(1, min(limit, TASK_PAGE_MAX))
+        index_key = self._index_key(status, sort)
+        after = decode_cursor(cursor) if cursor else None
+        ids = []
+        start = 0
+        # 从游标的分数开始取，跳过同分数且 task_id 在游标之前（含游标）的成员
+        while len(ids) <= limit:
+            if descending:
+                batch = self.client.zrevrangebyscore(
+                    index_key, after[0] if after else "+inf", "-inf", start=start, num=limit + 1, withscores=True
+                )
+            else:
+                batch = self.client.zrangebyscore(
+                    index_key, after[0] if after else "-inf", "+inf", start=start, num=limit + 1, withscores=True
+                )
+            if not batch:
+                break
+            start += len(batch)
+            for member, score in batch:
+                task_id = member.decode()
+                if after and ((score, task_id) >= after if descending else (score, task_id) <= after):
+                    continue
+                ids.append((task_id, score))
+        pipe = self.client.pipeline()
+        for task_id, _ in ids[:limit]:
+            pipe.hgetall(self._task_key(task_id))
+        tasks = [self._task(fields) for fields in pipe.execute() if fields]
+        next_cursor = encode_cursor(ids[limit - 1][1], ids[limit - 1][0]) if len(ids) > limit else None
+        return tasks, next_cursor
+
+    @staticmethod
+    def _task(fields):
+        amount = fields.get(b"amount")
+        approved = fields.get(b"approved")
+        return {
+            "task_id": fields[b"task_id"].decode(),
+            "status": fields[b"status"].decode(),
+            "amount": float(amount) if amount is not None else None,
+            "approved": bool(int(approved)) if approved else None,
+            "created_at": float(fields[b"created_at"]),
+            "updated_at": float(fields[b"updated_at"]),
+        }
+
+
+def make_task_store(kind=TASK_STORE):
+    """按 TASK_STORE 创建任务存储"""
+    if kind == "redis":
+        # 可选依赖，只有使用 Redis 时才需要安装
+        import redis
+        return RedisTaskStore(redis.Redis.from_url(TASK_REDIS_URL))
+    if kind != "sqlite":
+        raise ValueError(f"未知的任务存储：{kind}")
+    return SqliteTaskStore(connect(TASK_DB))
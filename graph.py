@@ -1,15 +1,10 @@
 from typing import TypedDict
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from custom.amount_extractor import extract_confident_amount, parse_amount
+from custom.llm_registry import lazy_llm, load_env
+load_env()
 
-llm = ChatOpenAI(
-    model="qwen3-max-2026-01-23",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+llm = lazy_llm("qwen3-max-2026-01-23")
 
 LIMIT = 500
 
@@ -23,9 +18,13 @@ class ExpenseState(TypedDict):
 
 # 🧾 节点1：解析发票
 def parse_invoice_node(state: ExpenseState):
+    # 规则能确定金额时直接返回，不确定时才调用 LLM
+    amount = extract_confident_amount(state['invoice_text'])
+    if amount is not None:
+        return {"amount": amount}
     prompt = f"从下面发票文本中提取总金额，只返回数字：\n{state['invoice_text']}"
     result = llm.invoke(prompt).content
-    return {"amount": float(result)}
+    return {"amount": parse_amount(result)}
 
 
 # 📏 节点2：合规判断
@@ -72,9 +71,8 @@ graph.add_conditional_edges("policy_check", route)
 graph.add_edge("human_review", "bookkeeping")
 graph.add_edge("bookkeeping", END)
 
-app = graph.compile()
-
-
-# ▶️ 运行
-initial_state = {"invoice_text": "酒店住宿费用，总计 860 元"}
-app.invoke(initial_state)
+# ▶️ 运行（只在直接执行脚本时编译并运行，导入模块不会创建模型客户端、不会调用模型）
+if __name__ == "__main__":
+    app = graph.compile()
+    initial_state = {"invoice_text": "酒店住宿费用，总计 860 元"}
+    app.invoke(initial_state)
@@ -1,6 +1,5 @@
 from langchain.tools import tool
 from langchain.chat_models import init_chat_model
-from langchain_openai import ChatOpenAI
 from langchain.messages import AnyMessage
 from typing_extensions import TypedDict, Annotated
 import operator
@@ -9,9 +8,8 @@ from langchain.messages import ToolMessage
 from typing import Literal
 from langgraph.graph import MessagesState, StateGraph, START, END
 
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from custom.llm_registry import Lazy, lazy_llm, load_env
+load_env()
 
 # model = init_chat_model(
 #     "qwen3-max",
@@ -19,11 +17,7 @@ load_dotenv()
 #     api_key=os.getenv("DASHSCOPE_API_KEY", None),
 #     temperature=0
 # )
-model = ChatOpenAI(
-    model="qwen3-max-2026-01-23",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+model = lazy_llm("qwen3-max-2026-01-23")
 
 # res = llm.invoke("what is your name?")
 # print(res.content)
@@ -65,7 +59,7 @@ def divide(a: int, b: int) -> float:
 # Augment the LLM with tools
 tools = [add, multiply, divide]
 tools_by_name = {tool.name: tool for tool in tools}
-model_with_tools = model.bind_tools(tools)
+model_with_tools = Lazy(lambda: model.bind_tools(tools))
 
 # Define the state
 class MessageState(TypedDict):
@@ -130,16 +124,16 @@ agent_builder.add_conditional_edges(
 )
 agent_builder.add_edge("tool_node", "llm_call")
 
-# Compile the agent
-agent = agent_builder.compile()
 
 # Show the agent
 # from IPython.display import Image, display
 # display(Image(agent.get_graph(xray=True).draw_mermaid_png()))
 
-# Invoke
-from langchain.messages import HumanMessage
-messages = [HumanMessage(content="Add 3 and 4.")]
-messages = agent.invoke({"messages": messages})
-for m in messages["messages"]:
-    m.pretty_print()
\ No newline at end of file
+# Compile and invoke（只在直接执行脚本时编译并运行，导入模块不会创建模型客户端、不会调用模型）
+if __name__ == "__main__":
+    agent = agent_builder.compile()
+    from langchain.messages import HumanMessage
+    messages = [HumanMessage(content="Add 3 and 4.")]
+    messages = agent.invoke({"messages": messages})
+    for m in messages["messages"]:
+        m.pretty_print()
\ No newline at end of file
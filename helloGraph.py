@@ -10,7 +10,8 @@ graph.add_edge(START, "mock_llm")
 graph.add_edge("mock_llm", END)
 graph = graph.compile()
 
-result = graph.invoke({"messages": [{"role": "user", "content": "hi!"}]})
+if __name__ == "__main__":
+    result = graph.invoke({"messages": [{"role": "user", "content": "hi!"}]})
 
-print("\n=== 最终结果 ===")
-print(result)
\ No newline at end of file
+    print("\n=== 最终结果 ===")
+    print(result)
\ No newline at end of file
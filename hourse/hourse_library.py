@@ -0,0 +1,201 @@
+# 按风格复用的马图库：马的图片只取决于风格，与用户无关
+# 每个归一化后的风格保存若干张不同的马图（变体），hourse_generate 随机取一张，库中没有时才实时生图；
+# 某个风格被选择的次数达到阈值后在后台补齐变体。索引保存在 SQLite（默认与 checkpoint 同一个文件），多个 worker 进程共享
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from custom.checkpoint import CHECKPOINT_DB, connect
+from custom.rate_limit import PRIORITY_BULK, request_priority
+
+HOURSE_LIBRARY_DB = os.getenv("HOURSE_LIBRARY_DB", CHECKPOINT_DB)
+# 每个风格保留的变体数，0 表示关闭图库
+HOURSE_LIBRARY_VARIANTS = int(os.getenv("HOURSE_LIBRARY_VARIANTS", "3"))
+# 风格被选择多少次后在后台补齐变体
+HOURSE_LIBRARY_POPULAR = int(os.getenv("HOURSE_LIBRARY_POPULAR", "2"))
+# 图片有效期（秒），默认与 DashScope 图片 URL 的有效期一致
+HOURSE_LIBRARY_TTL = int(os.getenv("HOURSE_LIBRARY_TTL", str(23 * 3600)))
+# 后台生成变体的并发数
+HOURSE_LIBRARY_WORKERS = int(os.getenv("HOURSE_LIBRARY_WORKERS", "2"))
+
+_PUNCTUATION = re.compile(r"[\s\W_]+")
+
+
+def normalize_style(style):
+    """
+    风格归一化：全角转半角、去掉空白和标点、忽略大小写和结尾的“风格”二字
+    如“水墨 风格”“水墨风格。”都归为“水墨”
+    """
+    text = _PUNCTUATION.sub("", unicodedata.normalize("NFKC", style)).lower()
+    if text.endswith("风格") and len(text) > 2:
+        text = text[:-2]
+    return text
+
+
+class HourseLibrary:
+    def __init__(self, produce, path=HOURSE_LIBRARY_DB, variants=HOURSE_LIBRARY_VARIANTS,
+                 popular=HOURSE_LIBRARY_POPULAR, ttl=HOURSE_LIBRARY_TTL, workers=HOURSE_LIBRARY_WORKERS):
+        """
+        :param produce: produce(style) 生成一张新的马图，返回图片地址，失败返回None（在后台线程中调用）
+        :param variants: 每个风格保留的变体数
+        :param popular: 风格被选择多少次后在后台补齐变体
+        """
+        self.produce = produce
+        self.path = path
+        self.variants = variants
+        self.popular = popular
+        self.ttl = ttl
+        self.workers = workers
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._filling = set()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.errors = 0
+
+    def _connection(self):
+        # 第一次使用时才打开数据库
+        if self._conn is None:
+            conn = connect(self.path)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS hourse_library ("
+                    "style TEXT NOT NULL, image TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (style, image))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS hourse_style_requests ("
+                    "style TEXT PRIMARY KEY, requests INTEGER NOT NULL, last_request REAL NOT NULL)"
+                )
+            self._conn = conn
+        return self._conn
+
+    @property
+    def enabled(self):
+        return self.variants > 0
+
+    def pick(self, style, now=None, record=True):
+        """
+        随机取一张该风格的马图，并记录一次风格选择（见 record）
+        :param style: 用户选择的风格（原文，生成变体时作为提示词）
+        :param record: False 时只查询，不计入选择次数和命中率（如推测执行）
+        :return: 图片地址，库中没有时返回None
+        """
+        now = now or time.time()
+        key = normalize_style(style)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM hourse_library WHERE style = ? AND created_at < ?", (key, now - self.ttl))
+            images = [row[0] for row in conn.execute(
+                "SELECT image FROM hourse_library WHERE style = ?", (key,)
+            ).fetchall()]
+            if record and images:
+                self.hits += 1
+            elif record:
+                self.misses += 1
+        if record:
+            self.record(style, now, len(images))
+        return random.choice(images) if images else None
+
+    def record(self, style, now=None, count=None):
+        """
+        记录一次风格选择；风格足够热门且变体不足时在后台补齐
+        :param count: 该风格当前的变体数，不传时查询
+        """
+        now = now or time.time()
+        key = normalize_style(style)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT INTO hourse_style_requests (style, requests, last_request) VALUES (?, 1, ?) "
+                    "ON CONFLICT(style) DO UPDATE SET requests = requests + 1, last_request = excluded.last_request",
+                    (key, now),
+                )
+                requests = conn.execute(
+                    "SELECT requests FROM hourse_style_requests WHERE style = ?", (key,)
+                ).fetchone()[0]
+        if count is None:
+            count = self.count(style)
+        if requests >= self.popular and count < self.variants:
+            self._fill(style, key)
+
+    def add(self, style, image, now=None):
+        """
+        加入一张马图（该风格的变体已满时忽略）
+        :return: 是否加入
+        """
+        now = now or time.time()
+        key = normalize_style(style)
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO hourse_library (style, image, created_at) "
+                    "SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM hourse_library WHERE style = ? AND created_at >= ?) < ?",
+                    (key, image, now, key, now - self.ttl, self.variants),
+                )
+            return cur.rowcount > 0
+
+    def count(self, style):
+        key = normalize_style(style)
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM hourse_library WHERE style = ? AND created_at >= ?", (key, time.time() - self.ttl)
+            ).fetchone()[0]
+
+    def _fill(self, style, key):
+        # 同一风格同时只有一个补齐任务
+        with self._lock:
+            if key in self._filling:
+                return
+            self._filling.add(key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hourse-library")
+        self._pool.submit(self._fill_style, style, key)
+
+    def _fill_style(self, style, key):
+        try:
+            # 后台生成不抢占用户请求的配额
+            with request_priority(PRIORITY_BULK):
+                while self.count(style) < self.variants:
+                    image = self.produce(style)
+                    if not image:
+                        with self._lock:
+                            self.errors += 1
+                        break
+                    self.add(style, image)
+                    with self._lock:
+                        self.generated += 1
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"马图库补齐失败：{e}")
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def stats(self):
+        with self._lock:
+            conn = self._connection()
+            styles, images = conn.execute(
+                "SELECT COUNT(DISTINCT style), COUNT(*) FROM hourse_library WHERE created_at >= ?",
+                (time.time() - self.ttl,),
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "styles": styles,
+                "images": images,
+                "variants": self.variants,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "generated": self.generated,
+                "filling": len(self._filling),
+                "errors": self.errors,
+            }
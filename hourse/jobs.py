@@ -0,0 +1,263 @@
+# 后台任务队列：HTTP 请求只负责提交，图在有界 worker 池中执行
+# 任务状态写入 SQLite（与 checkpoint 共用一个数据库文件），多个 uvicorn worker 共享，GET /jobs/{id} 落到任何 worker 都能查到
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from custom.checkpoint import CHECKPOINT_DB, connect
+
+# worker 数量
+JOB_WORKERS = int(os.getenv("HOURSE_JOB_WORKERS", "4"))
+# 排队任务上限，超过后拒绝提交
+JOB_QUEUE_SIZE = int(os.getenv("HOURSE_JOB_QUEUE_SIZE", "100"))
+# thread 或 process；process 模式要求 checkpointer 能跨进程共享（worker 进程以 spawn 方式启动）
+JOB_EXECUTOR = os.getenv("HOURSE_JOB_EXECUTOR", "thread")
+# 最多保留多少个已结束任务的结果
+JOB_RETAIN = int(os.getenv("HOURSE_JOB_RETAIN", "1000"))
+# 任务状态表所在的 SQLite 文件，默认与 checkpoint 同一个文件
+JOB_DB = os.getenv("HOURSE_JOB_DB", CHECKPOINT_DB)
+
+
+class QueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+class JobTable:
+    """任务状态表：每个进程各自打开连接（process 模式下 worker 进程也直接写入）"""
+
+    def __init__(self, path=JOB_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _get_conn(self):
+        # 在锁内调用；fork 出的子进程不能沿用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            conn = connect(self.path)
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS hourse_jobs ("
+                    "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL, "
+                    "started_at REAL, finished_at REAL, result TEXT, error TEXT)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_hourse_jobs_finished ON hourse_jobs (finished_at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def create(self, job_id, kind, created_at):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "INSERT INTO hourse_jobs (job_id, kind, status, created_at) VALUES (?, ?, 'queued', ?)",
+                    (job_id, kind, created_at),
+                )
+
+    def start(self, job_id, started_at):
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "UPDATE hourse_jobs SET status = 'running', started_at = ? WHERE job_id = ?", (started_at, job_id)
+                )
+
+    def finish(self, job_id, outcome):
+        """
+        :param outcome: 包含 result 或 error，以及 started_at/finished_at（可选）
+        """
+        if "result" in outcome:
+            status, result = "done", json.dumps(outcome["result"], ensure_ascii=False, default=str)
+        else:
+            status, result = "failed", None
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                # 只更新还没结束的任务（worker 已写入结果时，父进程的兜底不覆盖）
+                conn.execute(
+                    "UPDATE hourse_jobs SET status = ?, started_at = COALESCE(?, started_at), finished_at = ?, "
+                    "result = ?, error = ? WHERE job_id = ? AND finished_at IS NULL",
+                    (status, outcome.get("started_at"), outcome.get("finished_at", time.time()), result,
+                     outcome.get("error"), job_id),
+                )
+
+    def prune(self, retain):
+        """只保留最近结束的 retain 个任务"""
+        with self._lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "DELETE FROM hourse_jobs WHERE finished_at IS NOT NULL AND finished_at < ("
+                    "SELECT finished_at FROM hourse_jobs WHERE finished_at IS NOT NULL "
+                    "ORDER BY finished_at DESC LIMIT 1 OFFSET ?)",
+                    (max(0, retain - 1),),
+                )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT kind, status, created_at, started_at, finished_at, result, error FROM hourse_jobs "
+                "WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        info = {"job_id": job_id, "kind": row[0], "status": row[1], "created_at": row[2]}
+        if row[4] is not None:
+            info["started_at"] = row[3]
+            info["finished_at"] = row[4]
+            if row[1] == "done":
+                info["result"] = json.loads(row[5])
+            else:
+                info["error"] = row[6]
+        return info
+
+
+# 每个进程每个数据库文件一个 JobTable（process 模式下 worker 进程按路径取用）
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _get_table(path):
+    with _tables_lock:
+        table = _tables.get(path)
+        if table is None:
+            table = _tables[path] = JobTable(path)
+        return table
+
+
+def _run_timed(fn, args, job_id, db):
+    # 在 worker 内记录开始/结束时间并写入状态表（process 模式下父进程无法直接观测）
+    table = _get_table(db)
+    started_at = time.time()
+    table.start(job_id, started_at)
+    try:
+        result = fn(*args)
+    except Exception as e:
+        outcome = {"started_at": started_at, "finished_at": time.time(), "error": repr(e)}
+    else:
+        outcome = {"started_at": started_at, "finished_at": time.time(), "result": result}
+    table.finish(job_id, outcome)
+    # 结果已写入状态表，不再经由 Future 传回父进程
+    return {"started_at": started_at, "finished_at": outcome["finished_at"], "ok": "result" in outcome}
+
+
+class JobManager:
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, executor=JOB_EXECUTOR, retain=JOB_RETAIN,
+                 db=JOB_DB):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor_type = executor
+        self.retain = retain
+        self.db = db
+        self._table = _get_table(db)
+        self._executor = None
+        # 本进程提交、还没结束的任务（用于排队深度统计）；任务状态以状态表为准
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._busy_seconds = 0.0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        # 延迟创建，避免 import 时就拉起进程/线程
+        if self._executor is None:
+            if self.executor_type == "process":
+                # spawn：不继承父进程已打开的 SQLite 连接（checkpoint、生图缓存、马图库）和后台线程持有的锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hourse-job")
+        return self._executor
+
+    def _counts(self):
+        queued = running = 0
+        for future in self._jobs.values():
+            if future.running():
+                running += 1
+            elif not future.done():
+                queued += 1
+        return queued, running
+
+    def submit(self, kind, fn, *args):
+        """
+        提交任务
+        :param kind: 任务类型（submit/select_style），仅用于展示
+        :param fn: 在 worker 中执行的函数，process 模式下必须可 pickle
+        :return: job_id
+        """
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            if self._counts()[0] >= self.queue_size:
+                self.rejected += 1
+                raise QueueFullError(f"排队任务数已达上限 {self.queue_size}")
+            # 先写入状态表再提交，提交后立即查询也能查到
+            self._table.create(job_id, kind, time.time())
+            future = self._get_executor().submit(_run_timed, fn, args, job_id, self.db)
+            self._jobs[job_id] = future
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _on_done(self, job_id, future):
+        if future.cancelled() or future.exception() is not None:
+            outcome = {}
+            # 被取消或 worker 进程异常退出时没有写入结果，由父进程标记失败
+            error = "cancelled" if future.cancelled() else repr(future.exception())
+            try:
+                self._table.finish(job_id, {"error": error})
+            except Exception as e:
+                print(f"任务状态写入失败：{e}")
+        else:
+            outcome = future.result()
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            if "started_at" in outcome:
+                self._busy_seconds += outcome["finished_at"] - outcome["started_at"]
+            if outcome.get("ok"):
+                self.completed += 1
+            else:
+                self.failed += 1
+        try:
+            self._table.prune(self.retain)
+        except Exception as e:
+            print(f"清理任务状态失败：{e}")
+
+    def get(self, job_id):
+        """
+        查询任务状态（包括其他 worker 进程提交的任务）
+        :return: 任务信息字典，不存在时返回None
+        """
+        return self._table.get(job_id)
+
+    def stats(self):
+        """当前进程的队列深度与 worker 利用率，用于调整 worker 数量"""
+        with self._lock:
+            queued, running = self._counts()
+            uptime = max(time.time() - self._started_at, 1e-9)
+            return {
+                "executor": self.executor_type,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "queue_depth": queued,
+                "running": running,
+                # 当前正在工作的 worker 占比
+                "utilisation": running / self.workers,
+                # 启动以来 worker 的累计忙碌时间占比
+                "busy_ratio": min(1.0, self._busy_seconds / (uptime * self.workers)),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
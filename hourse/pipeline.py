@@ -0,0 +1,80 @@
+# 马年合照任务的执行逻辑（在后台 worker 中运行，不占用 HTTP 请求）
+from langchain.messages import HumanMessage
+from langgraph.types import Command
+from custom.artifact_store import get_artifact_store
+from custom.image_cache import image_cache_bypass
+from custom.rate_limit import PRIORITY_INTERACTIVE, request_priority
+
+
+def start_task(thread_id, prompt):
+    """
+    运行图直到风格选择处暂停
+    :param thread_id: 图的 thread_id，后续恢复执行使用
+    :param prompt: 用户输入
+    :return: 任务结果（等待选择风格时返回风格列表）
+    """
+    from hourseAgent import get_agent, get_checkpointer
+    app_graph, checkpointer = get_agent(), get_checkpointer()
+
+    # !使用 thread_id 调用 agent, 为了后续恢复执行
+    config = {"configurable": {"thread_id": thread_id}}
+    result = app_graph.invoke(
+        {
+            "messages": [HumanMessage(content=prompt)],
+            # "person": data.person_image_url
+        },
+        config=config
+    )
+
+    # 检查是否被 interrupt 暂停
+    state_snapshot = app_graph.get_state(config)
+
+    if state_snapshot.next:  # 如果有下一个节点，说明被暂停了
+        # 从 interrupt 值中获取风格列表
+        interrupt_value = state_snapshot.tasks[0].interrupts[0].value
+        return {
+            "task_id": thread_id,
+            "status": "waiting_style_selection",
+            "styles": interrupt_value["styles"],
+            "message": interrupt_value["message"]
+        }
+
+    # 如果没有暂停，直接返回最终结果
+    checkpointer.mark_finished(thread_id)
+    return _final_response(thread_id, result)
+
+
+def resume_task(thread_id, selected_style, fresh=False):
+    """
+    用户选择风格后恢复执行
+    :param thread_id: 提交任务时返回的 task_id
+    :param selected_style: 用户选择的风格
+    :param fresh: True 时不使用生图缓存，重新生成图片
+    :return: 任务结果
+    """
+    from hourseAgent import get_agent, get_checkpointer
+    app_graph, checkpointer = get_agent(), get_checkpointer()
+
+    config = {"configurable": {"thread_id": thread_id}}
+
+    # 使用 Command 恢复执行，并传入用户选择；用户正在等待，限流排队时优先于批量任务
+    with request_priority(PRIORITY_INTERACTIVE), image_cache_bypass(fresh):
+        result = app_graph.invoke(
+            Command(resume=selected_style),
+            config=config
+        )
+    # 任务结束，checkpoint 在 TTL 后被清理
+    checkpointer.mark_finished(thread_id)
+    return _final_response(thread_id, result)
+
+
+def _final_response(thread_id, result):
+    # 生图服务失败时节点不返回图片，这里标记为失败而不是抛出 KeyError
+    final_image = result.get("final_image")
+    return {
+        "task_id": thread_id,
+        "status": "completed" if final_image else "failed",
+        "final_image": final_image,
+        # 本服务的下载地址：不会过期，可缓存，支持断点续传
+        "final_image_url": get_artifact_store().artifact_url(final_image)
+    }
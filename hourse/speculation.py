@@ -0,0 +1,190 @@
+# 风格选择期间的推测执行：图在 style_select 暂停等待用户选择时（通常十几秒），
+# 提前为每个候选风格生成马图和人物图；恢复执行时直接采用所选风格的结果，取消其余风格还在排队的生成
+# 默认关闭；推测任务以批量优先级执行，不抢占用户请求的限流配额
+# 结果只保存在当前进程内，恢复请求落到其他 worker 进程时不命中（生成的图片仍会进入生图缓存和马图库）
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from custom.rate_limit import PRIORITY_BULK, request_priority
+from hourse.hourse_library import normalize_style
+
+HOURSE_SPECULATE = os.getenv("HOURSE_SPECULATE", "false").lower() == "true"
+# 费用上限：同时进行的推测生图次数，余量不够时新任务只推测靠前的几个风格或不推测
+# 应小于生图连接池大小（DASHSCOPE_POOL_MAXSIZE），给用户请求留出连接
+HOURSE_SPECULATE_MAX_CALLS = int(os.getenv("HOURSE_SPECULATE_MAX_CALLS", "16"))
+# 费用上限：每个任务最多推测几个风格（风格列表中靠前的优先）
+HOURSE_SPECULATE_MAX_STYLES = int(os.getenv("HOURSE_SPECULATE_MAX_STYLES", "4"))
+# 用户一直不选择时，推测结果保留多久（秒）
+HOURSE_SPECULATE_TTL = float(os.getenv("HOURSE_SPECULATE_TTL", "600"))
+
+
+class Speculator:
+    def __init__(self, produce, enabled=HOURSE_SPECULATE, max_calls=HOURSE_SPECULATE_MAX_CALLS,
+                 max_styles=HOURSE_SPECULATE_MAX_STYLES, ttl=HOURSE_SPECULATE_TTL):
+        """
+        :param produce: {类型: produce(style)}，如 {"hourse": ..., "person": ...}，返回图片地址列表（在后台线程中调用）
+        :param max_calls: 同时进行的推测生图次数上限
+        :param max_styles: 每个任务推测的风格数上限
+        """
+        self.produce = produce
+        self.enabled = enabled
+        self.max_calls = max_calls
+        self.max_styles = max_styles
+        self.ttl = ttl
+        self._running = 0  # 已提交、还没结束的推测生图次数
+        self._tasks = {}  # thread_id -> {"created_at": ..., "futures": {(类型, 风格): Future}}
+        # 可重入：取消 Future 时在持有锁的线程中同步调用 _finished
+        self._lock = threading.RLock()
+        self._pool = None
+        self.started = 0  # 开始推测的任务数
+        self.skipped = 0  # 超过费用上限未推测的任务数
+        self.partial = 0  # 费用上限内只推测了部分风格的任务数
+        self.jobs = 0  # 提交的推测生图次数
+        self.adopted = 0  # 恢复时直接采用的推测结果数
+        self.missed = 0  # 恢复时没有可用推测结果的次数（所选风格不在候选中、已过期、在其他进程推测等）
+        self.cancelled = 0  # 落选后在开始前取消的推测生图次数（没有产生费用）
+        self.wasted = 0  # 落选但已经开始或完成的推测生图次数（产生了费用）
+        self.expired = 0  # 一直没有恢复、超过 TTL 被丢弃的任务数
+
+    def start(self, thread_id, styles):
+        """
+        为一个刚暂停等待选择风格的任务推测所有候选风格（重复调用无副作用）
+        :return: 是否开始推测
+        """
+        if not self.enabled or not thread_id or not styles:
+            return False
+        with self._lock:
+            self._expire(time.time())
+            if thread_id in self._tasks:
+                return False
+            styles = list(dict.fromkeys(styles))[:self.max_styles]
+            # 余量内能推测几个风格（每个风格生成马图和人物图）
+            count = min(len(styles), (self.max_calls - self._running) // len(self.produce))
+            if count <= 0:
+                self.skipped += 1
+                return False
+            if count < len(styles):
+                self.partial += 1
+            if self._pool is None:
+                # 线程数等于费用上限，推测生图提交后立即开始，不排队
+                self._pool = ThreadPoolExecutor(max_workers=self.max_calls, thread_name_prefix="hourse-speculate")
+            futures = {}
+            for style in styles[:count]:
+                for kind, produce in self.produce.items():
+                    self._running += 1
+                    future = self._pool.submit(self._run, produce, style)
+                    future.add_done_callback(self._finished)
+                    futures[(kind, normalize_style(style))] = future
+            self._tasks[thread_id] = {"created_at": time.time(), "futures": futures}
+            self.started += 1
+            self.jobs += len(futures)
+        return True
+
+    @staticmethod
+    def _run(produce, style):
+        # 推测生图不抢占用户请求的配额
+        with request_priority(PRIORITY_BULK):
+            return produce(style)
+
+    def _finished(self, future):
+        # 结束或被取消时释放余量
+        with self._lock:
+            self._running -= 1
+
+    def _drop(self, futures):
+        # 在锁内调用：取消落选的推测，还没开始的不产生费用
+        for future in futures:
+            if future.cancel():
+                self.cancelled += 1
+            else:
+                self.wasted += 1
+
+    def _expire(self, now):
+        # 在锁内调用
+        for thread_id in [t for t, task in self._tasks.items() if now - task["created_at"] > self.ttl]:
+            self._drop(self._tasks.pop(thread_id)["futures"].values())
+            self.expired += 1
+
+    def take(self, thread_id, kind, style):
+        """
+        恢复执行时取出所选风格的推测结果，并取消其余风格的推测
+        :param kind: 结果类型（hourse/person）
+        :return: Future；没有可用的推测时返回None
+        """
+        if not self.enabled or not thread_id:
+            return None
+        with self._lock:
+            task = self._tasks.get(thread_id)
+            if task is None:
+                self.missed += 1
+                return None
+            key = normalize_style(style)
+            futures = task["futures"]
+            losers = [k for k in futures if k[1] != key]
+            self._drop(futures.pop(k) for k in losers)
+            future = futures.pop((kind, key), None)
+            if not futures:
+                del self._tasks[thread_id]
+            # 还没开始的推测直接取消，由调用方以交互优先级实时生成，而不是排在批量队列后面
+            if future is None or future.cancel():
+                self.missed += 1
+                return None
+            self.adopted += 1
+            return future
+
+    def adopt(self, thread_id, kind, style):
+        """
+        take 的阻塞版本：等待并返回所选风格的推测结果
+        :return: 图片地址列表；没有可用的推测或推测失败时返回None
+        """
+        future = self.take(thread_id, kind, style)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"推测生图失败：{e}")
+            return None
+
+    async def aadopt(self, thread_id, kind, style):
+        """adopt 的异步版本"""
+        future = self.take(thread_id, kind, style)
+        if future is None:
+            return None
+        try:
+            # shield：等待方被取消时不取消推测任务
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except Exception as e:
+            print(f"推测生图失败：{e}")
+            return None
+
+    def discard(self, thread_id):
+        """丢弃一个任务的全部推测（如要求重新生成时）"""
+        with self._lock:
+            task = self._tasks.pop(thread_id, None)
+            if task is not None:
+                self._drop(task["futures"].values())
+
+    def stats(self):
+        with self._lock:
+            decided = self.adopted + self.missed
+            spent = self.adopted + self.wasted
+            return {
+                "enabled": self.enabled,
+                "inflight_tasks": len(self._tasks),
+                "running_calls": self._running,
+                "max_calls": self.max_calls,
+                "started": self.started,
+                "skipped": self.skipped,
+                "partial": self.partial,
+                "jobs": self.jobs,
+                "adopted": self.adopted,
+                "missed": self.missed,
+                "hit_rate": round(self.adopted / decided, 4) if decided else 0.0,
+                "cancelled": self.cancelled,
+                "wasted": self.wasted,
+                "waste_ratio": round(self.wasted / spent, 4) if spent else 0.0,
+                "expired": self.expired,
+            }
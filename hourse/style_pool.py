@@ -0,0 +1,97 @@
+# 预生成的风格列表池：后台补货，style_generate 直接取用，池空时才实时调用 LLM
+import os
+import threading
+import time
+from collections import deque
+from custom.rate_limit import PRIORITY_BULK, request_priority
+
+# 池的目标容量，0 表示关闭预生成
+STYLE_POOL_DEPTH = int(os.getenv("HOURSE_STYLE_POOL_DEPTH", "8"))
+# 低于该数量时触发后台补货
+STYLE_POOL_LOW_WATER = int(os.getenv("HOURSE_STYLE_POOL_LOW_WATER", "3"))
+# 补货失败后的等待时间（秒）
+STYLE_POOL_RETRY_DELAY = float(os.getenv("HOURSE_STYLE_POOL_RETRY_DELAY", "5"))
+
+
+class StylePool:
+    def __init__(self, produce, depth=STYLE_POOL_DEPTH, low_water=STYLE_POOL_LOW_WATER,
+                 retry_delay=STYLE_POOL_RETRY_DELAY):
+        """
+        :param produce: produce(n) 返回 n 个新生成的结果（在后台线程中调用）
+        :param depth: 池的目标容量
+        :param low_water: 低水位，取用后低于该值时补货
+        """
+        self.produce = produce
+        self.depth = depth
+        self.low_water = min(low_water, depth)
+        self.retry_delay = retry_delay
+        self._items = deque()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self.errors = 0
+
+    def start(self):
+        """启动后台补货线程（重复调用无副作用）"""
+        if self.depth <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refill_loop, name="style-pool", daemon=True)
+            self._thread.start()
+        # 首次启动时填满；之后只在取用后低于低水位时唤醒
+        self._wakeup.set()
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            missing = self.depth - len(self._items)
+            if missing <= 0:
+                continue
+            try:
+                # 后台补货不抢占用户请求的配额
+                with request_priority(PRIORITY_BULK):
+                    items = self.produce(missing)
+            except Exception as e:
+                self.errors += 1
+                print(f"风格池补货失败：{e}")
+                time.sleep(self.retry_delay)
+                self._wakeup.set()
+                continue
+            self._items.extend(items)
+            self.produced += len(items)
+
+    def pop(self):
+        """
+        取出一个预生成结果
+        :return: 结果，池为空时返回None
+        """
+        self.start()
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            with self._lock:
+                self.misses += 1
+            self._wakeup.set()
+            return None
+        with self._lock:
+            self.hits += 1
+        if len(self._items) < self.low_water:
+            self._wakeup.set()
+        return item
+
+    def stats(self):
+        return {
+            "size": len(self._items),
+            "depth": self.depth,
+            "low_water": self.low_water,
+            "hits": self.hits,
+            "misses": self.misses,
+            "produced": self.produced,
+            "errors": self.errors,
+        }
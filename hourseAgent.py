@@ -8,26 +8,28 @@
 from langgraph.graph import StateGraph, START, END, MessagesState
 from typing_extensions import TypedDict, Annotated
 import os
-from langchain_openai import ChatOpenAI
+import asyncio
 from langchain.tools import tool
 from langchain.messages import AnyMessage, HumanMessage
 import operator
 from pydantic import BaseModel, Field
 from typing import List
-from dotenv import load_dotenv
-from custom.request import generate_image_by_text
-from custom.image_edit import image_style_change, generate_final
-from langgraph.checkpoint.memory import InMemorySaver
+from custom.request import generate_image_by_text, agenerate_image_by_text
+from custom.image_edit import image_style_change, generate_final, agenerate_final
+from custom.checkpoint import make_checkpointer
+from hourse.style_pool import StylePool
+from hourse.hourse_library import HourseLibrary
+from hourse.speculation import Speculator
+from custom.image_cache import fresh_requested
+from custom.llm_registry import Lazy, lazy_llm, load_env, once
 from langchain_core.runnables import RunnableConfig
-load_dotenv()
+from custom.metrics import instrument
+load_env()
 
 system_prompt = """你是一个优秀的艺术设计专家, 同时也擅长提示词工程。"""
 
-llm = ChatOpenAI(
-    model="qwen3-max-2026-01-23",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+# 第一次调用模型时才创建客户端（与其他模块共享），多进程共享 DashScope 配额
+llm = lazy_llm("qwen3-max-2026-01-23", limiter="llm")
 
 class ImageStyles(BaseModel):
     # 限制列表长度并添加描述
@@ -36,8 +38,8 @@ class ImageStyles(BaseModel):
         min_items=4,
         max_items=4
     )
-structured_llm = llm.with_structured_output(ImageStyles)
-took_llm = llm.bind_tools([])
+structured_llm = Lazy(lambda: llm.with_structured_output(ImageStyles))
+took_llm = Lazy(lambda: llm.bind_tools([]))
 
 # Define the state
 class MessageState(TypedDict):
@@ -53,18 +55,39 @@ class MessageState(TypedDict):
 
 config: RunnableConfig = {"configurable": {"thread_id": "1"}}
 # Define nodes
-def style_generate(state: MessageState):
-    """生成随机的风格名称"""
+def _style_messages():
     from langchain_core.messages import SystemMessage
-    result = structured_llm.invoke([
+    return [
         SystemMessage(content=system_prompt),
         HumanMessage(content="请生成4种随机的图片风格名称, 风格名字不要重复")
-    ])
+    ]
+
+def _produce_styles(n):
+    # 后台并发生成 n 组风格
+    return structured_llm.batch([_style_messages() for _ in range(n)])
+
+# 预生成的风格池，style_generate 优先从池中取，池空时才实时调用 LLM
+style_pool = StylePool(_produce_styles)
+
+def style_generate(state: MessageState, config: RunnableConfig):
+    """生成随机的风格名称"""
+    result = style_pool.pop() or structured_llm.invoke(_style_messages())
+    # 接下来在 style_select 等待用户选择，期间推测生成各候选风格的图片（需开启 HOURSE_SPECULATE）
+    speculator.start(_thread_id(config), result.styles)
     return {
         "styles": result.styles,
         "waiting_human_select_style": True  # 设置等待用户选择
     }
 
+async def astyle_generate(state: MessageState, config: RunnableConfig):
+    """style_generate 的异步版本"""
+    result = style_pool.pop() or await structured_llm.ainvoke(_style_messages())
+    speculator.start(_thread_id(config), result.styles)
+    return {
+        "styles": result.styles,
+        "waiting_human_select_style": True
+    }
+
 # 修改 style_select 节点
 def style_select(state: MessageState):
     """等待用户选择风格（此节点会暂停执行）"""
@@ -83,10 +106,7 @@ def style_select(state: MessageState):
         "waiting_human_select_style": False
     }
 
-def hourse_generate(state: MessageState):
-    """生成带有指定风格的马的图片"""
-    prompt = f"请生成一张符合以下风格的马的图片: {state['style']}"
-    image_urls = generate_image_by_text(prompt)
+def _hourse_result(image_urls):
     if image_urls:
         print("马的图片生成成功，URL列表：")
         for idx, url in enumerate(image_urls, 1):
@@ -96,14 +116,56 @@ def hourse_generate(state: MessageState):
     else:
         print("图片生成失败！")
 
-def person_generate(state: MessageState):
-    """转换照片中的人物为指定风格"""
-    # image_url = state['person']  # Use the person image URL from the state
+def _hourse_prompt(style):
+    return f"请生成一张符合以下风格的马的图片: {style}"
 
-    # image_urls = image_style_change(state['style'], image_url)
-    # 先用生图替代风格转换
-    prompt = f"请生成一张符合以下风格的人物图片: {state['style']}"
-    image_urls = generate_image_by_text(prompt)
+def _produce_hourse(style):
+    # 后台生成新的变体：不读生图缓存，否则同一风格总是拿到同一张图
+    image_urls = generate_image_by_text(_hourse_prompt(style), use_cache=False)
+    return image_urls[0] if image_urls else None
+
+# 按风格复用的马图库：马图只取决于风格，hourse_generate 优先从库中随机取一张，没有时才实时生图
+hourse_library = HourseLibrary(_produce_hourse)
+
+def _library_pick(style, record=True):
+    # 要求重新生成（fresh）时不从图库取图
+    if not hourse_library.enabled or fresh_requested():
+        return None
+    return hourse_library.pick(style, record=record)
+
+def _library_add(style, image_urls):
+    if hourse_library.enabled and image_urls:
+        hourse_library.add(style, image_urls[0])
+
+def _hourse_images(style, record=True):
+    # 优先从马图库取图，没有时实时生成并加入图库
+    # 图库开启时不读生图缓存：缓存命中的 URL 可能快要过期，按当前时间入库后会在过期后继续被取用
+    image_url = _library_pick(style, record)
+    if image_url:
+        return [image_url]
+    image_urls = generate_image_by_text(_hourse_prompt(style), use_cache=not hourse_library.enabled)
+    _library_add(style, image_urls)
+    return image_urls
+
+async def _ahourse_images(style):
+    image_url = await asyncio.to_thread(_library_pick, style)
+    if image_url:
+        return [image_url]
+    image_urls = await agenerate_image_by_text(_hourse_prompt(style), use_cache=not hourse_library.enabled)
+    await asyncio.to_thread(_library_add, style, image_urls)
+    return image_urls
+
+def hourse_generate(state: MessageState, config: RunnableConfig):
+    """生成带有指定风格的马的图片"""
+    image_urls = _speculated(config, "hourse", state['style']) or _hourse_images(state['style'])
+    return _hourse_result(image_urls)
+
+async def ahourse_generate(state: MessageState, config: RunnableConfig):
+    """hourse_generate 的异步版本"""
+    image_urls = await _aspeculated(config, "hourse", state['style']) or await _ahourse_images(state['style'])
+    return _hourse_result(image_urls)
+
+def _person_result(image_urls):
     if image_urls:
         print("人物图片转换成功，URL列表：")
         for idx, url in enumerate(image_urls, 1):
@@ -112,9 +174,60 @@ def person_generate(state: MessageState):
     else:
         print("人物图片转换失败！")
 
-def image_generate(state: MessageState):
-    """生成图片"""
-    image_urls = generate_final(f"图1是人物，图二是马，绘制一张人骑着马在草原上驰骋的图片，风格为{state['style']}", state['person_with_style'], state['hourse_with_style'])
+def _person_prompt(style):
+    return f"请生成一张符合以下风格的人物图片: {style}"
+
+def _person_images(style):
+    # image_url = state['person']  # Use the person image URL from the state
+
+    # image_urls = image_style_change(state['style'], image_url)
+    # 先用生图替代风格转换
+    return generate_image_by_text(_person_prompt(style))
+
+def person_generate(state: MessageState, config: RunnableConfig):
+    """转换照片中的人物为指定风格"""
+    image_urls = _speculated(config, "person", state['style']) or _person_images(state['style'])
+    return _person_result(image_urls)
+
+async def aperson_generate(state: MessageState, config: RunnableConfig):
+    """person_generate 的异步版本"""
+    image_urls = (await _aspeculated(config, "person", state['style'])
+                  or await agenerate_image_by_text(_person_prompt(state['style'])))
+    return _person_result(image_urls)
+
+# 推测执行：用户选择风格期间提前生成各候选风格的马图和人物图，恢复时采用所选风格的结果
+# 推测查询马图库时不计入选择次数，采用后再记录
+speculator = Speculator({
+    "hourse": lambda style: _hourse_images(style, record=False),
+    "person": _person_images,
+})
+
+def _thread_id(config):
+    return (config or {}).get("configurable", {}).get("thread_id")
+
+def _speculated(config, kind, style):
+    # 要求重新生成（fresh）时不采用推测结果
+    if fresh_requested():
+        speculator.discard(_thread_id(config))
+        return None
+    image_urls = speculator.adopt(_thread_id(config), kind, style)
+    if image_urls and kind == "hourse" and hourse_library.enabled:
+        hourse_library.record(style)
+    return image_urls
+
+async def _aspeculated(config, kind, style):
+    if fresh_requested():
+        speculator.discard(_thread_id(config))
+        return None
+    image_urls = await speculator.aadopt(_thread_id(config), kind, style)
+    if image_urls and kind == "hourse" and hourse_library.enabled:
+        await asyncio.to_thread(hourse_library.record, style)
+    return image_urls
+
+def _final_prompt(state: MessageState):
+    return f"图1是人物，图二是马，绘制一张人骑着马在草原上驰骋的图片，风格为{state['style']}"
+
+def _final_result(image_urls):
     if image_urls:
         print("图片生成成功，URL列表：")
         for idx, url in enumerate(image_urls, 1):
@@ -123,13 +236,36 @@ def image_generate(state: MessageState):
     else:
         print("图片生成失败！")
 
+def _inputs_ready(state: MessageState):
+    # 人物图或马图生成失败时不再调用合成接口
+    if state.get('person_with_style') and state.get('hourse_with_style'):
+        return True
+    print("缺少人物图或马的图片，跳过最终图片生成！")
+    return False
+
+def image_generate(state: MessageState):
+    """生成图片"""
+    if not _inputs_ready(state):
+        return {}
+    image_urls = generate_final(_final_prompt(state), state['person_with_style'], state['hourse_with_style'])
+    return _final_result(image_urls)
+
+async def aimage_generate(state: MessageState):
+    """image_generate 的异步版本"""
+    if not _inputs_ready(state):
+        return {}
+    image_urls = await agenerate_final(_final_prompt(state), state['person_with_style'], state['hourse_with_style'])
+    return _final_result(image_urls)
+
 
+# 节点同时注册同步/异步实现：invoke 走同步版本，ainvoke 走异步版本（不阻塞事件循环）
+# 每个节点记录耗时、调用/错误次数和 token，见 /metrics
 agent_builder = StateGraph(MessageState)
-agent_builder.add_node("style_generate", style_generate)
-agent_builder.add_node("style_select", style_select)
-agent_builder.add_node("hourse_generate", hourse_generate)
-agent_builder.add_node("person_generate", person_generate)
-agent_builder.add_node("image_generate", image_generate)
+agent_builder.add_node("style_generate", instrument("hourse", "style_generate", style_generate, astyle_generate))
+agent_builder.add_node("style_select", instrument("hourse", "style_select", style_select))
+agent_builder.add_node("hourse_generate", instrument("hourse", "hourse_generate", hourse_generate, ahourse_generate))
+agent_builder.add_node("person_generate", instrument("hourse", "person_generate", person_generate, aperson_generate))
+agent_builder.add_node("image_generate", instrument("hourse", "image_generate", image_generate, aimage_generate))
 
 agent_builder.set_entry_point("style_generate")
 # 条件路由：生成风格后，进入选择节点
@@ -137,15 +273,30 @@ agent_builder.add_edge(
     "style_generate",
     "style_select"
 )
+# 人物图和马的图片互不依赖：选择风格后并行生成，两者都完成后再合成最终图片
 agent_builder.add_edge("style_select", "person_generate")
-agent_builder.add_edge("person_generate", "hourse_generate")
-# agent_builder.add_edge("person_generate", "image_generate")
-agent_builder.add_edge("hourse_generate", "image_generate")
+agent_builder.add_edge("style_select", "hourse_generate")
+agent_builder.add_edge(["person_generate", "hourse_generate"], "image_generate")
 agent_builder.add_edge("image_generate", END)
 
 
-checkpointer = InMemorySaver()
-agent = agent_builder.compile(checkpointer=checkpointer)
+# 持久化 checkpointer：重启不丢失、多个 worker 进程共享，过期 thread 按 TTL 清理
+# 导入模块时不打开数据库、不编译图，第一次使用时创建并缓存
+get_checkpointer = once(make_checkpointer)
+
+
+@once
+def get_agent():
+    return agent_builder.compile(checkpointer=get_checkpointer())
+
+
+def __getattr__(name):
+    # 兼容 from hourseAgent import agent, checkpointer
+    if name == "agent":
+        return get_agent()
+    if name == "checkpointer":
+        return get_checkpointer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 # Compile the agent
 # Invoke the agent
 # messages = [HumanMessage(content=[
@@ -1,12 +1,48 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+import asyncio
 import uuid
-from hourseAgent import agent as app_graph
 from langchain.messages import AnyMessage, HumanMessage
+from custom.artifact_store import artifact_response, get_artifact_store
+from custom.dashscope_client import aclose_async_client, image_caller
+from custom.image_cache import get_image_cache, image_cache_bypass
+from custom.llm_registry import aclose_llm_clients
+from custom.sse import sse_event, sse_response, stream_graph_updates
+from custom.metrics import register_stats, render as render_metrics
+from custom.rate_limit import PRIORITY_INTERACTIVE, get_limiter, request_priority
+from custom.singleflight import get_flight
 from langgraph.types import Command
+from hourse.jobs import JobManager, QueueFullError
+from hourse.pipeline import start_task, resume_task
 
 app = FastAPI()
 tasks = {}  # 实际应使用数据库
+jobs = JobManager()
+
+def _style_pool_stats():
+    from hourseAgent import style_pool
+    return style_pool.stats()
+
+def _hourse_library_stats():
+    from hourseAgent import hourse_library
+    return hourse_library.stats()
+
+def _speculation_stats():
+    from hourseAgent import speculator
+    return speculator.stats()
+
+# 除节点指标外，导出后台队列、风格池、马图库、推测执行、生图容错层、限流队列、生图缓存、本地图片存储和请求合并的计数（抓取时才读取）
+register_stats("hourse_jobs", jobs.stats)
+register_stats("hourse_style_pool", _style_pool_stats)
+register_stats("hourse_library", _hourse_library_stats)
+register_stats("hourse_speculation", _speculation_stats)
+register_stats("dashscope_image", image_caller.metrics)
+register_stats("rate_limit_llm", lambda: get_limiter("llm").stats())
+register_stats("rate_limit_image", lambda: get_limiter("image").stats())
+register_stats("image_cache", lambda: get_image_cache().stats())
+register_stats("artifact_store", lambda: get_artifact_store().stats())
+register_stats("singleflight_image", get_flight("image").stats)
 
 class SubmitRequest(BaseModel):
     prompt: str  # 用户上传的照片 URL
@@ -14,57 +50,126 @@ class SubmitRequest(BaseModel):
 class StyleSelectRequest(BaseModel):
     task_id: str
     selected_style: str  # 用户选择的风格
+    fresh: bool = False  # True 时不使用生图缓存和马图库，相同风格也重新生成
+@app.on_event("startup")
+async def startup():
+    from hourseAgent import get_agent, get_checkpointer, style_pool
+    # 启动时编译图，第一个请求不再承担编译耗时
+    get_agent()
+    # 定期清理已结束/长期未更新的 checkpoint
+    get_checkpointer().start_gc()
+    # 预先填充风格池
+    style_pool.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    jobs.shutdown()
+    await aclose_async_client()
+    await aclose_llm_clients()
+
+def _enqueue(kind, fn, *args):
+    try:
+        return jobs.submit(kind, fn, *args)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.post("/submit")
-def submit_task(data: SubmitRequest):
-    """提交任务，生成风格列表"""
-    # task_id = str(uuid.uuid4())
-    
-    # !使用 thread_id 调用 agent, 为了后续恢复执行
-    config = {"configurable": {"thread_id": 1}}
-    
-    result = app_graph.invoke(
-        {
-            "messages": [HumanMessage(content=data.prompt)],
-            # "person": data.person_image_url
-        },
-        config=config
-    )
-    
-    # 检查是否被 interrupt 暂停
-    state_snapshot = app_graph.get_state(config)
-    
-    if state_snapshot.next:  # 如果有下一个节点，说明被暂停了
-        # 从 interrupt 值中获取风格列表
-        interrupt_value = state_snapshot.tasks[0].interrupts[0].value
-        return {
-            "task_id": 1,
-            "status": "waiting_style_selection",
-            "styles": interrupt_value["styles"],
-            "message": interrupt_value["message"]
-        }
-    
-    # 如果没有暂停，直接返回最终结果
-    return {
-        "task_id": 1,
-        "status": "completed",
-        "final_image": result["final_image"]
-    }
+async def submit_task(data: SubmitRequest):
+    """提交任务，立即返回 job_id；风格列表通过 GET /jobs/{job_id} 获取"""
+    # 每个任务使用独立的 thread_id，互不阻塞，后续据此恢复执行
+    task_id = str(uuid.uuid4())
+    job_id = _enqueue("submit", start_task, task_id, data.prompt)
+    return {"job_id": job_id, "task_id": task_id, "status": "queued"}
+
 @app.post("/select-style")
-def select_style(data: StyleSelectRequest):
-    """用户选择风格后，恢复执行"""
+async def select_style(data: StyleSelectRequest):
+    """用户选择风格后，在后台恢复执行"""
+    job_id = _enqueue("select_style", resume_task, data.task_id, data.selected_style, data.fresh)
+    return {"job_id": job_id, "task_id": data.task_id, "status": "queued"}
+
+@app.post("/submit/stream")
+async def submit_task_stream(data: SubmitRequest):
+    """提交任务并以 SSE 推送进度：先推送 task_id，再推送每个节点的输出，暂停时推送风格列表"""
+    from hourseAgent import get_agent
+    app_graph = get_agent()
+    task_id = str(uuid.uuid4())
+    config = {"configurable": {"thread_id": task_id}}
+
+    async def events():
+        yield sse_event("task", {"task_id": task_id})
+        async for event in stream_graph_updates(
+            app_graph, {"messages": [HumanMessage(content=data.prompt)]}, config
+        ):
+            yield event
+
+    return sse_response(events())
+
+@app.post("/select-style/stream")
+async def select_style_stream(data: StyleSelectRequest):
+    """选择风格后恢复执行，人物图、马图、最终图片生成后立即推送"""
+    from hourseAgent import get_agent, get_checkpointer
+    app_graph, checkpointer = get_agent(), get_checkpointer()
     config = {"configurable": {"thread_id": data.task_id}}
-    
-    # 使用 Command 恢复执行，并传入用户选择
-    result = app_graph.invoke(
-        Command(resume=data.selected_style),
-        config=config
-    )
-    
-    return {
-        "task_id": data.task_id,
-        "status": "completed",
-        "final_image": result["final_image"]
-    }
+
+    async def events():
+        with request_priority(PRIORITY_INTERACTIVE), image_cache_bypass(data.fresh):
+            async for event in stream_graph_updates(
+                app_graph,
+                Command(resume=data.selected_style),
+                config,
+                on_finish=lambda: checkpointer.mark_finished(data.task_id),
+                artifacts=("final_image",),
+            ):
+                yield event
+
+    return sse_response(events())
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """队列深度、worker 利用率等计数"""
+    return jobs.stats()
+
+@app.get("/styles/pool")
+async def style_pool_stats():
+    """风格池命中/未命中计数"""
+    from hourseAgent import style_pool
+    return style_pool.stats()
+
+@app.get("/styles/library")
+async def hourse_library_stats():
+    """马图库的风格数、图片数、命中率和后台生成次数"""
+    from hourseAgent import hourse_library
+    return await asyncio.to_thread(hourse_library.stats)
+
+@app.get("/styles/speculation")
+async def speculation_stats():
+    """推测执行的采用率、取消/浪费的生图次数"""
+    from hourseAgent import speculator
+    return speculator.stats()
+
+@app.get("/images/cache")
+async def image_cache_stats():
+    """生图缓存命中率、条目数、占用字节数"""
+    return await asyncio.to_thread(get_image_cache().stats)
+
+@app.get("/artifacts/{name}")
+async def get_artifact(name: str, request: Request):
+    """下载生成的图片（final_image_url / SSE artifact 事件给出的地址），支持 ETag 和 Range"""
+    return artifact_response(name, request.headers.get("if-none-match"))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标：各节点耗时直方图、调用/错误次数、token 数，以及队列/风格池/容错层计数"""
+    # 采集时会查询 SQLite（生图缓存、马图库等），放到线程中执行，不阻塞正在推送的流
+    return PlainTextResponse(await asyncio.to_thread(render_metrics), media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询任务状态，完成后 result 中包含风格列表或最终图片（任务可以由其他 worker 进程提交）"""
+    info = await asyncio.to_thread(jobs.get, job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return info
 
 
 # class ApprovalIn(BaseModel):
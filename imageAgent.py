@@ -1,25 +1,26 @@
 from typing import TypedDict, List, Annotated
 from operator import add
-from langchain_openai import ChatOpenAI
-from custom.request import generate_image_by_text
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from custom.request import generate_image_by_text, agenerate_image_by_text
 from langchain_core.messages import HumanMessage
+from custom.llm_registry import lazy_llm, load_env, once
+from custom.metrics import instrument
+from custom.review_cache import ReviewCache, aprepare_review_image, prepare_review_image
 import json
 from langgraph.graph import StateGraph, END
 import os
-from dotenv import load_dotenv
-load_dotenv()
+load_env()
 
-llm = ChatOpenAI(
-    model="qwen3-max-2026-01-23",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+# 第一次调用模型时才创建客户端（与其他模块共享），多进程共享 DashScope 配额
+llm = lazy_llm("qwen3-max-2026-01-23", limiter="llm")
+vlllm = lazy_llm("qwen3-vl-plus", limiter="vl")
 
-vlllm = ChatOpenAI(
-    model="qwen3-vl-plus",
-    api_key=os.getenv("DASHSCOPE_API_KEY", None),
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+# 每轮并行生成的候选数量，1 为原来的单图模式；也可在初始状态中用 num_candidates 覆盖
+IMAGE_CANDIDATES = int(os.getenv("IMAGE_CANDIDATES", "1"))
+# 候选数量上限：每个候选每轮各需一次 LLM 调用和一次生图，客户端传入的值也不能超过
+IMAGE_CANDIDATES_MAX = int(os.getenv("IMAGE_CANDIDATES_MAX", "8"))
 
 class AgentState(TypedDict):
     # 用户原始输入
@@ -34,30 +35,56 @@ class AgentState(TypedDict):
     is_passed: bool
     # 迭代次数，防止无限循环
     iteration_count: int
+    # 多候选模式：本轮的候选数量、候选提示词和对应图片（生成失败为空字符串）
+    num_candidates: int
+    candidate_prompts: List[str]
+    candidate_images: List[str]
     # 历史记录
     history: Annotated[List[str], add]
 
 # 提示词优化节点
-def refiner_node(state: AgentState):
-    print("--- 正在优化设计方案 ---")
-    # 这里会调用 LLM，根据 state['user_input'] 和 state['feedback'] 生成新 Prompt
-    
-    optimize_prompt = f"""你是一个图片生成提示词优化专家，请根据用户输入和修改意见，优化当前的图片生成提示词。
+def _optimize_prompt(state: AgentState):
+    return f"""你是一个图片生成提示词优化专家，请根据用户输入和修改意见，优化当前的图片生成提示词。
     要求优化后的提示词更加注重细节，让图片具有电影画质
     直接返回优化后的提示词，不要添加任何多余的文字
     用户的提示词: {state['current_prompt'] if state['current_prompt'] else state['user_input']}
     修改意见： {state['feedback']}
     """ 
-    new_prompt = llm.invoke(optimize_prompt).content
-    print(f"优化后的提示词: {new_prompt}")
-    return {"current_prompt": new_prompt, "iteration_count": state['iteration_count'] + 1}
+
+def _num_candidates(state: AgentState):
+    return max(1, min(state.get('num_candidates') or IMAGE_CANDIDATES, IMAGE_CANDIDATES_MAX))
+
+def _candidate_prompts(state: AgentState):
+    # 每个候选要求不同的侧重点，避免 K 个方案几乎一样
+    k = _num_candidates(state)
+    base = _optimize_prompt(state)
+    return [base + f"这是 {k} 个候选方案中的第 {i + 1} 个，请在构图、光影或色彩上与其他方案有所区别\n" for i in range(k)]
+
+def _refiner_result(state: AgentState, prompts):
+    for idx, prompt in enumerate(prompts, 1):
+        print(f"优化后的提示词{f' ({idx})' if len(prompts) > 1 else ''}: {prompt}")
+    result = {"current_prompt": prompts[0], "iteration_count": state['iteration_count'] + 1}
+    if len(prompts) > 1:
+        result["candidate_prompts"] = prompts
+    return result
+
+def refiner_node(state: AgentState):
+    print("--- 正在优化设计方案 ---")
+    # 这里会调用 LLM，根据 state['user_input'] 和 state['feedback'] 生成新 Prompt
+    if _num_candidates(state) == 1:
+        return _refiner_result(state, [llm.invoke(_optimize_prompt(state)).content])
+    # 多候选模式：K 个提示词并行生成
+    return _refiner_result(state, [m.content for m in llm.batch(_candidate_prompts(state))])
+
+async def arefiner_node(state: AgentState):
+    print("--- 正在优化设计方案 ---")
+    if _num_candidates(state) == 1:
+        return _refiner_result(state, [(await llm.ainvoke(_optimize_prompt(state))).content])
+    return _refiner_result(state, [m.content for m in await llm.abatch(_candidate_prompts(state))])
 
 # 绘图执行节点
 # todo: 错误处理（重试、添加错误处理节点等）
-def generator_node(state: AgentState):
-    print(f"--- 正在生成图片 (第 {state['iteration_count']} 次尝试) ---")
-    image_urls = generate_image_by_text(state['current_prompt'])
-
+def _generator_result(image_urls):
     if image_urls:
         print("图片生成成功，URL列表：")
         for idx, url in enumerate(image_urls, 1):
@@ -66,9 +93,39 @@ def generator_node(state: AgentState):
         return {"image_data": image_url}
     else:
         print("图片生成失败！")
+        # 清空上一轮的图片，避免评审旧图
+        return {"image_data": ""}
+
+def _candidates_result(results):
+    images = [urls[0] if urls else "" for urls in results]
+    print(f"候选图片生成完成：{sum(1 for image in images if image)}/{len(images)} 张成功")
+    # image_data 先指向第一张成功的图片，评审后替换为最佳候选
+    return {"candidate_images": images, "image_data": next((image for image in images if image), "")}
+
+# 评审不通过后需要重新随机生成，同样的提示词命中生图缓存只会得到同一张图，因此不使用缓存
+def _generate(prompt):
+    return generate_image_by_text(prompt, use_cache=False)
+
+async def _agenerate(prompt):
+    return await agenerate_image_by_text(prompt, use_cache=False)
+
+def generator_node(state: AgentState):
+    print(f"--- 正在生成图片 (第 {state['iteration_count']} 次尝试) ---")
+    if _num_candidates(state) == 1:
+        return _generator_result(_generate(state['current_prompt']))
+    prompts = state['candidate_prompts']
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        return _candidates_result(list(pool.map(_generate, prompts)))
+
+async def agenerator_node(state: AgentState):
+    print(f"--- 正在生成图片 (第 {state['iteration_count']} 次尝试) ---")
+    if _num_candidates(state) == 1:
+        return _generator_result(await _agenerate(state['current_prompt']))
+    results = await asyncio.gather(*(_agenerate(prompt) for prompt in state['candidate_prompts']))
+    return _candidates_result(results)
+
 # 质量评审节点
-def reviewer_node(state: AgentState):
-    print("--- 艺术总监正在评审 ---")
+def _review_message(state: AgentState, image_ref=None):
     reviewer_prompt = f"""你是一位拥有 15 年经验的资深艺术总监。你的任务是根据 图片生成提示词和生成的图片评审 AI 生成的图片质量，给它评分，并给出修改意见。
         评审维度：
             指令契合度 (Alignment)： 画面是否完全遵循了用户的原始需求和 Prompt 中的关键细节？
@@ -84,20 +141,130 @@ def reviewer_node(state: AgentState):
         图片为当前输入的图片地址
     """
 
-    message = HumanMessage(
+    return HumanMessage(
         content=[
             {"type": "text", "text": reviewer_prompt},
             {
                 "type": "image_url",
-                "image_url": {"url": state['image_data']} # image_data 是图片的 URL
+                # image_data 是图片的 URL，image_ref 为预处理后的缩略图（data URI）
+                "image_url": {"url": image_ref or state['image_data']}
             },
         ]
     )
-    
-    response = vlllm.invoke([message])
-    review_result = response.content
-    print(f"评审结果: {review_result}")
-    return json.loads(review_result)
+
+# 没有图片时不调用评审模型，直接判定不通过，进入下一轮优化
+_NO_IMAGE_REVIEW = {"score": 0, "is_passed": False, "feedback": "图片生成失败，请简化提示词后重试"}
+
+def _candidates(state: AgentState):
+    """多候选模式下生成成功的 (提示词, 图片) 列表"""
+    return [
+        {"current_prompt": prompt, "image_data": image}
+        for prompt, image in zip(state['candidate_prompts'], state['candidate_images']) if image
+    ]
+
+# 评审结果缓存：图回放或重复评审相同的图片+提示词时不再调用视觉模型
+review_cache = ReviewCache()
+
+def _cached_review(digest, state: AgentState):
+    # digest 为None时按图片 URL 查找
+    if digest is None:
+        review = review_cache.get_by_url(state['image_data'], state['current_prompt'])
+    else:
+        review = review_cache.get(digest, state['current_prompt'])
+    if review is not None:
+        print(f"评审结果（缓存）: {review}")
+    return review
+
+def _review(state: AgentState):
+    review = _cached_review(None, state)
+    if review is not None:
+        return review
+    # 下载图片计算内容哈希，并缩成缩略图再交给视觉模型
+    digest, image_ref = prepare_review_image(state['image_data'])
+    review = _cached_review(digest, state)
+    if review is None:
+        review_result = vlllm.invoke([_review_message(state, image_ref)]).content
+        print(f"评审结果: {review_result}")
+        review = json.loads(review_result)
+        review_cache.put(digest, state['current_prompt'], review, url=state['image_data'])
+    return review
+
+async def _areview(state: AgentState):
+    review = _cached_review(None, state)
+    if review is not None:
+        return review
+    digest, image_ref = await aprepare_review_image(state['image_data'])
+    review = _cached_review(digest, state)
+    if review is None:
+        review_result = (await vlllm.ainvoke([_review_message(state, image_ref)])).content
+        print(f"评审结果: {review_result}")
+        review = json.loads(review_result)
+        review_cache.put(digest, state['current_prompt'], review, url=state['image_data'])
+    return review
+
+# 单个候选的评审结果无法解析时按 0 分处理，不影响其他候选
+_UNPARSED_REVIEW = {"score": 0, "is_passed": False, "feedback": "评审结果无法解析"}
+
+def _review_candidate(state: AgentState, candidate):
+    try:
+        review = _review({**state, **candidate})
+    except ValueError:
+        review = dict(_UNPARSED_REVIEW)
+    return {**review, **candidate}
+
+async def _areview_candidate(state: AgentState, candidate):
+    try:
+        review = await _areview({**state, **candidate})
+    except ValueError:
+        review = dict(_UNPARSED_REVIEW)
+    return {**review, **candidate}
+
+def _best_review(reviews):
+    best = max(reviews, key=lambda review: review.get("score", 0))
+    print(f"共评审 {len(reviews)} 个候选，最佳得分 {best.get('score', 0)}")
+    return best
+
+def reviewer_node(state: AgentState):
+    print("--- 艺术总监正在评审 ---")
+    if not state.get('image_data'):
+        return _NO_IMAGE_REVIEW
+    if _num_candidates(state) == 1:
+        return _review(state)
+    # 多候选模式：并行评审，任一候选通过即返回，不再等待其余评审
+    candidates = _candidates(state)
+    pool = ThreadPoolExecutor(max_workers=len(candidates))
+    # 复制上下文，线程中的评审调用仍按 reviewer 节点统计 token
+    futures = [pool.submit(contextvars.copy_context().run, _review_candidate, state, c) for c in candidates]
+    reviews = []
+    try:
+        for future in as_completed(futures):
+            review = future.result()
+            if review.get("is_passed"):
+                return review
+            reviews.append(review)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return _best_review(reviews)
+
+async def areviewer_node(state: AgentState):
+    print("--- 艺术总监正在评审 ---")
+    if not state.get('image_data'):
+        return _NO_IMAGE_REVIEW
+    if _num_candidates(state) == 1:
+        return await _areview(state)
+    tasks = [asyncio.ensure_future(_areview_candidate(state, c)) for c in _candidates(state)]
+    reviews = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            review = await next_done
+            if review.get("is_passed"):
+                return review
+            reviews.append(review)
+    finally:
+        # 已有候选通过时取消仍在进行的评审
+        for task in tasks:
+            task.cancel()
+    return _best_review(reviews)
 
     # vlllm.invoke(reviewer_prompt, )
 
@@ -111,10 +278,10 @@ def reviewer_node(state: AgentState):
 # 1. 初始化图
 workflow = StateGraph(AgentState)
 
-# 2. 添加节点
-workflow.add_node("refiner", refiner_node)
-workflow.add_node("generator", generator_node)
-workflow.add_node("reviewer", reviewer_node)
+# 2. 添加节点（同时注册同步/异步实现，invoke 与 ainvoke 均可运行；记录耗时、调用/错误次数和 token）
+workflow.add_node("refiner", instrument("image", "refiner", refiner_node, arefiner_node))
+workflow.add_node("generator", instrument("image", "generator", generator_node, agenerator_node))
+workflow.add_node("reviewer", instrument("image", "reviewer", reviewer_node, areviewer_node))
 
 # 3. 设置入口
 workflow.set_entry_point("refiner")
@@ -143,8 +310,17 @@ workflow.add_conditional_edges(
     }
 )
 
-# 6. 编译
-app = workflow.compile()
+# 6. 编译（第一次使用时编译并缓存）
+@once
+def get_app():
+    return workflow.compile()
+
+
+def __getattr__(name):
+    # 兼容 from imageAgent import app
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
@@ -161,7 +337,7 @@ if __name__ == "__main__":
     }
     
     # 运行智能体
-    result = app.invoke(initial_state)
+    result = get_app().invoke(initial_state)
     
     print("\n=== 最终结果 ===")
     print(f"迭代次数: {result['iteration_count']}")
@@ -0,0 +1,46 @@
+from typing import Optional
+from fastapi import FastAPI, Request
+from pydantic import BaseModel, Field
+from imageAgent import IMAGE_CANDIDATES_MAX, get_app
+from custom.artifact_store import artifact_response
+from custom.dashscope_client import aclose_async_client
+from custom.llm_registry import aclose_llm_clients
+from custom.sse import sse_response, stream_graph_updates
+
+app = FastAPI()
+
+
+class GenerateRequest(BaseModel):
+    user_input: str  # 用户的生图需求
+    # 每轮并行生成的候选数，不传时使用 IMAGE_CANDIDATES
+    num_candidates: Optional[int] = Field(None, ge=1, le=IMAGE_CANDIDATES_MAX)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await aclose_async_client()
+    await aclose_llm_clients()
+
+
+@app.post("/generate/stream")
+async def generate_stream(data: GenerateRequest):
+    """以 SSE 推送每一轮的优化提示词、生成的图片和评审结果"""
+    initial_state = {
+        "user_input": data.user_input,
+        "current_prompt": "",
+        "image_data": "",
+        "feedback": "",
+        "score": 0,
+        "is_passed": False,
+        "iteration_count": 0,
+        "history": []
+    }
+    if data.num_candidates:
+        initial_state["num_candidates"] = data.num_candidates
+    return sse_response(stream_graph_updates(get_app(), initial_state, artifacts=("image_data",)))
+
+
+@app.get("/artifacts/{name}")
+async def get_artifact(name: str, request: Request):
+    """下载生成的图片（SSE artifact 事件给出的地址），支持 ETag 和 Range"""
+    return artifact_response(name, request.headers.get("if-none-match"))